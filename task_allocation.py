@@ -1,20 +1,37 @@
+import time
+_IMPORT_START = time.perf_counter()  # 启动计时：模块导入开始
+
 import numpy as np
 from itertools import combinations
 from typing import List, Dict, Set, Tuple, Union
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import math
 import json
-import time
+import copy
 import sys
 from socket import *
 from struct import pack
-from threading import Thread
+from threading import Thread, Event, Condition, Lock
+from collections import deque
+import queue
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import argparse
 import random
-import tkinter as tk
-from tkinter import filedialog
 import os
+import select
+import selectors
+import gzip
+import zipfile
+import mmap
+import re
 import xml.etree.ElementTree as ET
 
+# tkinter 只在弹出文件选择对话框时才导入（见 select_json_file），无界面启动不付出导入开销
+
+_IMPORT_ELAPSED = time.perf_counter() - _IMPORT_START
+
 # ========== 坐标系统配置 ==========
 # 参考点：所有局部坐标的零点位置（经纬度）
 REFERENCE_POINT_LAT = 39.53  # 参考点纬度（度）
@@ -26,6 +43,16 @@ KM_PER_DEGREE_LAT = 111.0  # 1度纬度 ≈ 111 km
 KM_PER_DEGREE_LON = 111.0 * math.cos(math.radians(REFERENCE_POINT_LAT))  # 1度经度 ≈ 85.5 km
 # ==================================
 
+# ========== 仿真状态数组布局 ==========
+# 状态矩阵形状为 (STATE_SIZE, N)，每一行是一个连续的状态分量
+STATE_X, STATE_Y, STATE_VX, STATE_VY, STATE_AX, STATE_AY, STATE_HEADING, STATE_ANGVEL = range(8)
+STATE_SIZE = 8
+
+# 休眠状态矩阵 (SLEEP_SIZE, N)：休眠标志、休眠时的分组中心和目标位置（用于唤醒判断）
+SLEEP_FLAG, SLEEP_ANCHOR_X, SLEEP_ANCHOR_Y, SLEEP_TARGET_X, SLEEP_TARGET_Y = range(5)
+SLEEP_SIZE = 5
+# ==================================
+
 
 # 1. Define data classes
 @dataclass
@@ -47,6 +74,116 @@ class TaskGroup:
     group_id: int
 
 
+@dataclass
+class SimulationSnapshot:
+    """仿真状态快照（检查点/恢复/分叉）"""
+    state: np.ndarray
+    drone_order: List[str]
+    group_index: np.ndarray
+    speed_factor: np.ndarray
+    n_groups: int
+    allocation_result: Dict
+    sim_step: int
+    sim_time: float
+    rng_state: Dict
+    target_area: Tuple[float, float]
+    area_size: float
+    sleep_state: np.ndarray = None
+
+
+@dataclass
+class FlightParams:
+    """飞行动力学参数（物理步进内核使用，可跨进程传递）"""
+    max_speed: float = 15.0
+    max_acceleration: float = 8.0
+    max_angular_velocity: float = 45.0
+    smoothing_factor: float = 0.15
+    dt: float = 0.1
+    separation_radius: float = 2.0  # 组内分离半径，0 表示关闭分离
+    separation_weight: float = 4.0  # 分离加速度权重
+    separation_cell_size: float = 0.0  # 空间哈希网格边长，0 表示等于分离半径
+    settle_radius: float = 0.0  # 进入休眠的目标距离，0 表示关闭休眠实体优化
+    wake_radius: float = 12.0  # 休眠实体目标距离超过该值时唤醒（大于 settle_radius，形成滞回）
+    settle_wake_shift: float = 3.0  # 休眠后分组中心移动超过该距离时唤醒
+    settle_check_interval: int = 10  # 每隔多少步做一次休眠/唤醒判断（其余步沿用上次的休眠标志）
+
+
+class EntityRegistry:
+    """实体注册表
+
+    一次性建立字符串ID（'A12'、'D7'）与整数索引、数字对象ID、阵营标志之间的对应关系，
+    并固定稳定的排序顺序；每帧的热路径直接按索引取值，不再做字符串处理。
+    """
+
+    def __init__(self, drone_types):
+        """
+        Args:
+            drone_types: drone_id -> 'attack' / 'defense'
+        """
+        self.ids = sorted(drone_types)  # 稳定顺序（与原先每帧 sorted() 的顺序一致）
+        self.index = {drone_id: k for k, drone_id in enumerate(self.ids)}
+        self.types = [drone_types[drone_id] for drone_id in self.ids]
+        self.is_attack = np.array([t == 'attack' for t in self.types], dtype=bool)
+        self.numbers = np.array([int(''.join(filter(str.isdigit, drone_id)) or 0) for drone_id in self.ids],
+                                dtype=np.int64)
+        # Tacview对象ID：红方 1-9999，蓝方 10000 + 编号
+        self.object_ids = np.where(self.is_attack, self.numbers, 10000 + self.numbers)
+        self.labels = [drone_id[1:] for drone_id in self.ids]  # ShortName 中的编号部分
+        self.columns = np.arange(len(self.ids))  # 注册表索引 -> 状态矩阵列
+
+        # 热路径使用的Python列表（避免逐元素访问NumPy标量）
+        self.number_list = self.numbers.tolist()
+        self.object_id_list = self.object_ids.tolist()
+        self.is_attack_list = self.is_attack.tolist()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_allocation(cls, allocation_result, drone_ids=None):
+        """从分配结果建立注册表（阵营取 initial_positions 中的 type，缺失时按ID前缀判断）"""
+        initial_positions = allocation_result.get('initial_positions', {})
+        if drone_ids is None:
+            drone_ids = allocation_result['drone_attributes'].keys()
+        drone_types = {}
+        for drone_id in drone_ids:
+            info = initial_positions.get(drone_id)
+            if info and 'type' in info:
+                drone_types[drone_id] = info['type']
+            else:
+                drone_types[drone_id] = 'attack' if drone_id.startswith('A') else 'defense'
+        return cls(drone_types)
+
+    def bind_columns(self, drone_index):
+        """绑定状态矩阵的列顺序"""
+        self.columns = np.array([drone_index[drone_id] for drone_id in self.ids], dtype=np.intp)
+
+
+class EncodedFrame(bytes):
+    """encode_frame 输出的整帧字节串，附带帧序号和关键帧信息
+
+    keyframe_seq 不为 None 时本帧是关键帧，加入序号不超过它的等待客户端可从本帧开始接收。
+    """
+
+    def __new__(cls, data, index=None, keyframe_seq=None):
+        frame = super().__new__(cls, data)
+        frame.index = index
+        frame.keyframe_seq = keyframe_seq
+        return frame
+
+
+@dataclass
+class TacviewViewer:
+    """一个已完成握手的Tacview客户端及其待发数据（非阻塞发送未发完的部分）"""
+    sock: object
+    addr: tuple
+    seq: int = 0
+    pending: deque = field(default_factory=deque)
+    pending_bytes: int = 0
+    offset: int = 0  # pending[0] 已发送的字节数
+    resyncs: int = 0
+
+
 # Tacview Streamer class
 class TacviewStreamer:
     """Tacview实时数据流处理类"""
@@ -55,8 +192,7 @@ class TacviewStreamer:
         self.local_ip = local_ip
         self.local_port = local_port
         self.socket = None
-        self.client_socket = None
-        self.is_connected = False
+        self.is_connected = False  # 至少有一个客户端（含等待关键帧的客户端）
         self.is_streaming = False
         
         # Tacview协议数据
@@ -73,117 +209,296 @@ class TacviewStreamer:
         self.log_file = None
         self.log_file_path = 'tacview_data_log.txt'
         
+        # 目标区域中心点（客户端连接时自动发送）
+        self.target_area = None
+        
+        # 整帧编码器：按注册表缓存每个对象的格式模板，姿态噪声使用独立的随机数发生器
+        self.rng = np.random.default_rng()
+        self._fragment_registry = None
+        self._full_fragments = []
+        self._short_fragments = []
+        self._frame_template = None
+        self._short_template = None
+        self._delta_template = None  # 上一个增量帧模板：(注册表, 是否省略静态属性, 对象索引, 模板)
+        
+        # 静态属性省略：Tacview会保留对象属性，Type/Coalition/Color/Name/ShortName/Radar*
+        # 只在对象首次出现时（对每个新连接的客户端）发送一次，之后每帧只发送 T= 和 Mach。
+        # 主要减少字节数；编码时间仍以每个对象 7 个浮点字段的格式化为主（见 benchmark_acmi_encoder）
+        self.elide_static = True
+        self._static_sent = set()  # 当前客户端已收到静态属性的对象ID
+        self._static_complete = None  # 静态属性已全部发送过的注册表
+        
+        # 死区与关键帧：水平位移和航向变化都不超过阈值的对象本帧不发送，每 keyframe_interval 帧全部发送一次
+        # （roll/pitch/高度是显示噪声，不参与判断）。推演中飞行的无人机每帧都会越过阈值，
+        # 主要受益的是到达目标后悬停的无人机（DroneSimulation.settle_radius > 0）
+        self.deadband_position = 0.01  # 水平位移阈值 (km)，0 表示关闭死区
+        self.deadband_angle = 1.0  # 航向变化阈值 (度)
+        self.keyframe_interval = 50  # 关键帧间隔（帧），0 表示只在首帧
+        self._deadband_registry = None  # 上次发送值所对应的注册表
+        self._last_sent = None  # 每个对象上次发送的 (x, y, yaw)，形状 (3, N)
+        self._frames_encoded = 0
+        self.updates_sent = 0
+        self.updates_suppressed = 0
+        
+        # 发送线程：编码后的帧经有界队列交给发送线程，推演线程不在 sendall 上阻塞
+        self.send_queue = None
+        self.sender_thread = None
+        self.send_latency_total = 0.0  # 入队到发送完成的累计延迟（秒）
+        self.send_latency_max = 0.0
+        self.frames_written = 0
+        # 丢帧后下一帧需要重新同步（丢掉的帧可能带有静态属性或死区之外的更新）
+        self._resync_static = False
+        self._resync_positions = False
+        
+        # 多客户端：监听线程完成握手后把客户端放入 _joining，编码器在下一帧输出关键帧
+        # （全部对象的完整属性），发送端分发该帧时把客户端加入 viewers，之后共享同一数据流
+        self.server_thread = None
+        self._server_stop = Event()
+        self.handshake_timeout = 5.0  # 握手响应超时（秒）
+        self._reference_time = None
+        self.viewers = []
+        self._joining = []
+        self._viewer_lock = Lock()
+        self._join_seq = 0  # 客户端加入序号
+        self._keyframe_requested = False
+        self._last_keyframe_index = -1  # 最近一个关键帧的帧序号
+        self.viewer_backlog_limit = 8 * 1024 * 1024  # 单个客户端的待发字节上限，超过后丢弃积压并等待关键帧
+        
+        # 断线重连：监听在整个推演期间保持，端口绑定失败或监听套接字出错时定期重新绑定
+        self.rebind_interval = 2.0  # 重新绑定间隔（秒）
+        self.connections = 0  # 完成握手的连接数
+        self.reconnects = 0  # 所有客户端都断开后重新连上的次数
+        self.disconnects = 0
+        self.downtime = 0.0  # 首次连接之后没有任何客户端的累计时间（秒）
+        self._down_since = None
+        self.listener_restarts = 0
+        self._bind_failed = False
+        
+        # ACMI录制（AcmiRecorder）：与客户端共用同一编码帧流，没有客户端时也编码
+        self.recorder = None
+        self.stream_header = None  # 固定的数据流开头（回放录制文件时使用文件自带的文件头）
+        
     def start_server(self):
-        """启动Tacview服务器"""
+        """启动Tacview服务器（后台线程监听，任意时刻可连接任意数量的客户端）
+
+        每个客户端在后台线程中完成握手并收到文件头、参考时间、标题和目标区域，
+        随后等待下一个关键帧（全部对象的完整状态）加入共享的帧数据流。
+        监听在整个推演期间保持：端口暂时不可用或监听出错时每 rebind_interval 秒重新绑定。
+
+        Returns:
+            bool: 本次是否立即绑定成功（失败时后台继续重试）
+        """
+        # 所有客户端（及录制文件）共用同一个参考时间，帧时间戳对所有客户端一致
+        self._stream_header()
+        self._open_log_file()
+        bound = self._bind_listener()
+        
+        self._server_stop = Event()
+        self.server_thread = Thread(target=self._server_loop, name='tacview-server', daemon=True)
+        self.server_thread.start()
+        
+        print('\n' + '=' * 70)
+        print('【Tacview服务器启动】')
+        print(f'  监听地址: {self.local_ip}:{self.local_port}')
+        print(f'  发送缓冲区: 512KB (支持大规模飞机)')
+        print('  客户端可随时连接（支持多个Tacview同时观看，断开后可重新连接）')
+        if not bound:
+            print(f'  ⚠ 端口暂不可用，每 {self.rebind_interval:.0f} 秒重试绑定')
+        print('=' * 70)
+        return bound
+    
+    def _bind_listener(self):
+        """绑定并监听端口（非阻塞），失败时返回 False（连续失败只打印一次）"""
+        listener = None
         try:
-            self.socket = socket(AF_INET, SOCK_STREAM, IPPROTO_TCP)
-            self.socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)  # 允许端口重用
-            
-            # 增加发送缓冲区大小，支持大数据量传输
-            self.socket.setsockopt(SOL_SOCKET, SO_SNDBUF, 524288)  # 512KB发送缓冲区
-            
-            self.socket.bind((self.local_ip, self.local_port))
-            self.socket.listen()
-            print('\n' + '=' * 70)
-            print('【Tacview服务器启动】')
-            print(f'  监听地址: {self.local_ip}:{self.local_port}')
-            print(f'  发送缓冲区: 512KB (支持大规模飞机)')
-            print('  等待Tacview客户端连接... (5秒超时)')
-            print('=' * 70)
-            
-            # 设置超时，避免无限等待
-            self.socket.settimeout(5.0)
-            
-            try:
-                # 等待客户端连接
-                self.client_socket, addr = self.socket.accept()
-                
-                # 为客户端连接设置缓冲区和优化参数
-                self.client_socket.setsockopt(SOL_SOCKET, SO_SNDBUF, 524288)  # 512KB发送缓冲
-                try:
-                    # 禁用Nagle算法，减少延迟（立即发送小数据包）
-                    import socket as sock_module
-                    self.client_socket.setsockopt(sock_module.IPPROTO_TCP, sock_module.TCP_NODELAY, 1)
-                except AttributeError:
-                    # 如果TCP_NODELAY不可用，跳过
-                    pass
-                
-                print(f'\n✓ Tacview客户端已连接: {addr}')
-                print(f'  Socket优化: 512KB缓冲区 + TCP_NODELAY')
-                
-                # 发送握手数据
-                print('\n【步骤1】发送握手数据...')
-                self.client_socket.sendall(self.handshake_data1.encode('utf-8'))
-                print(f'  > {self.handshake_data1.strip()}')
-                self.client_socket.sendall(self.handshake_data2.encode('utf-8'))
-                print(f'  > {self.handshake_data2.strip()}')
-                self.client_socket.sendall(self.handshake_data3.encode('utf-8'))
-                print(f'  > {self.handshake_data3.strip()}')
-                self.client_socket.sendall(b'\x00')
-                print('  > NULL字节')
-                
-                # 接收握手响应
-                print('\n【步骤2】接收握手响应...')
-                data = self.client_socket.recv(1024)
-                print(f'  < 握手响应: {data}')
-                
-                # 发送文件头和参考时间（匹配训练文件格式）
-                print('\n【步骤3】发送ACMI文件头...')
-                self.client_socket.sendall(self.tel_file_header.encode('utf-8'))
-                print(f'  > {self.tel_file_header.strip()}')
-                
-                current_time = time.strftime(self.tel_reference_time_format, time.gmtime()).encode('utf-8')
-                self.client_socket.sendall(current_time)
-                print(f'  > {current_time.decode().strip()}')
-                
-                # 发送标题（匹配训练文件格式）
-                self.client_socket.sendall(self.tel_title.encode('utf-8'))
-                print(f'  > {self.tel_title.strip()}')
-                
-                # 打开日志文件，记录发送的数据
-                try:
-                    self.log_file = open(self.log_file_path, 'w', encoding='utf-8')
-                    # 写入文件头信息
-                    self.log_file.write('=' * 80 + '\n')
-                    self.log_file.write('Tacview数据日志\n')
-                    self.log_file.write(f'开始时间: {time.strftime("%Y-%m-%d %H:%M:%S")}\n')
-                    self.log_file.write('=' * 80 + '\n\n')
-                    self.log_file.write('【文件头】\n')
-                    self.log_file.write(self.tel_file_header)
-                    self.log_file.write(current_time.decode('utf-8'))
-                    self.log_file.write(self.tel_title)
-                    self.log_file.write('\n' + '-' * 80 + '\n\n')
-                    self.log_file.flush()
-                    print(f'  > 数据日志文件: {self.log_file_path}')
-                except Exception as e:
-                    print(f'  ⚠ 无法创建日志文件: {e}')
-                
-                self.is_connected = True
-                print('\n' + '=' * 70)
-                print('✓✓✓ Tacview初始化完成，准备发送飞机数据 ✓✓✓')
-                print('=' * 70 + '\n')
-                return True
-                
-            except timeout:
-                print('\n' + '!' * 70)
-                print('【警告】等待Tacview客户端连接超时')
-                print('  提示: 请确保Tacview已打开并连接到 127.0.0.1:58008')
-                print('  仿真将继续运行但不显示Tacview')
-                print('!' * 70 + '\n')
-                self.is_connected = False
-                return False
-            
+            listener = socket(AF_INET, SOCK_STREAM, IPPROTO_TCP)
+            listener.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)  # 允许端口重用
+            listener.bind((self.local_ip, self.local_port))
+            listener.listen()
+            listener.setblocking(False)
+        except OSError as e:
+            if listener is not None:
+                listener.close()
+            if not self._bind_failed:
+                print(f'【错误】Tacview监听端口 {self.local_ip}:{self.local_port} 绑定失败: {e}')
+            self._bind_failed = True
+            return False
+        if self._bind_failed:
+            print(f'【Tacview】监听端口 {self.local_ip}:{self.local_port} 已重新绑定')
+        self._bind_failed = False
+        self.socket = listener
+        return True
+    
+    def _stream_header(self):
+        """客户端和录制文件共用的数据流开头：文件头、参考时间、标题和目标区域"""
+        if self.stream_header is not None:
+            return self.stream_header
+        if self._reference_time is None:
+            self._reference_time = time.strftime(self.tel_reference_time_format, time.gmtime())
+        header = self.tel_file_header + self._reference_time + self.tel_title
+        if self.target_area is not None:
+            header += self._target_area_line(self.target_area)
+        return header
+    
+    def _open_log_file(self):
+        """打开数据日志文件并写入文件头（log_file_path 为 None 时不记录）"""
+        if not self.log_file_path:
+            return
+        try:
+            self.log_file = open(self.log_file_path, 'w', encoding='utf-8')
+            self.log_file.write('=' * 80 + '\n')
+            self.log_file.write('Tacview数据日志\n')
+            self.log_file.write(f'开始时间: {time.strftime("%Y-%m-%d %H:%M:%S")}\n')
+            self.log_file.write('=' * 80 + '\n\n')
+            self.log_file.write('【文件头】\n')
+            self.log_file.write(self.tel_file_header)
+            self.log_file.write(self._reference_time)
+            self.log_file.write(self.tel_title)
+            if self.target_area is not None:
+                self.log_file.write('【目标中心点】\n')
+                self.log_file.write(self._target_area_line(self.target_area))
+            self.log_file.write('\n' + '-' * 80 + '\n\n')
+            self.log_file.flush()
+            print(f'  > 数据日志文件: {self.log_file_path}')
         except Exception as e:
-            print('\n' + '!' * 70)
-            print(f'【错误】启动Tacview服务器失败: {e}')
-            import traceback
-            traceback.print_exc()
-            print('!' * 70 + '\n')
+            print(f'  ⚠ 无法创建日志文件: {e}')
+    
+    def _server_loop(self):
+        """监听线程：接受新连接并完成握手（selectors 多路复用，握手互不阻塞）"""
+        selector = selectors.DefaultSelector()
+        listener = None  # 已注册到 selector 的监听套接字
+        try:
+            while not self._server_stop.is_set():
+                if self.socket is None and not self._bind_listener():
+                    self._server_stop.wait(self.rebind_interval)
+                    continue
+                if listener is not self.socket:
+                    listener = self.socket
+                    selector.register(listener, selectors.EVENT_READ, None)
+                for key, _ in selector.select(timeout=0.5):
+                    if key.data is None:
+                        if not self._accept_client(selector):
+                            # 监听套接字出错：关闭后重新绑定
+                            selector.unregister(listener)
+                            listener.close()
+                            self.socket = listener = None
+                            self.listener_restarts += 1
+                            self._server_stop.wait(self.rebind_interval)
+                            break
+                    else:
+                        self._finish_handshake(selector, key.fileobj, key.data)
+                # 超时未回应握手的连接
+                now = time.time()
+                for key in list(selector.get_map().values()):
+                    if key.data is not None and now - key.data[1] > self.handshake_timeout:
+                        print(f'【警告】Tacview客户端 {key.data[0]} 握手超时')
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+        finally:
+            for key in list(selector.get_map().values()):
+                if key.data is not None:
+                    key.fileobj.close()
+            selector.close()
+    
+    def _accept_client(self, selector):
+        """接受一个新连接并发送握手数据；监听套接字本身出错时返回 False"""
+        try:
+            client, addr = self.socket.accept()
+        except (BlockingIOError, InterruptedError, ConnectionAbortedError):
+            return True
+        except OSError as e:
+            print(f'【错误】Tacview监听出错: {e}，{self.rebind_interval:.0f} 秒后重新绑定')
             return False
+        try:
+            client.setsockopt(SOL_SOCKET, SO_SNDBUF, 524288)  # 512KB发送缓冲
+            try:
+                # 禁用Nagle算法，减少延迟（立即发送小数据包）
+                client.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+            except (AttributeError, OSError):
+                pass
+            client.settimeout(self.handshake_timeout)
+            client.sendall((self.handshake_data1 + self.handshake_data2 + self.handshake_data3).encode('utf-8') + b'\x00')
+            selector.register(client, selectors.EVENT_READ, (addr, time.time()))
+        except OSError as e:
+            print(f'【警告】Tacview客户端 {addr} 握手失败: {e}')
+            client.close()
+        return True
     
-    def send_drone_data(self, drone_id, position, velocity, drone_type, timestamp):
-        """发送单架无人机数据到Tacview（不包含时间戳帧头）"""
-        if not self.is_connected or not self.client_socket:
+    def _finish_handshake(self, selector, client, data):
+        """收到握手响应：发送文件头、参考时间、标题和目标区域，加入等待关键帧的客户端"""
+        addr = data[0]
+        selector.unregister(client)
+        try:
+            response = client.recv(1024)
+            if not response:
+                raise ConnectionError('握手期间连接已关闭')
+            client.sendall(self._stream_header().encode('utf-8'))
+            client.setblocking(False)
+        except OSError as e:
+            print(f'【警告】Tacview客户端 {addr} 握手失败: {e}')
+            client.close()
+            return
+        with self._viewer_lock:
+            viewer = TacviewViewer(client, addr)
+            self._queue_joiner(viewer)
+            count = len(self.viewers) + len(self._joining)
+            self.connections += 1
+            outage = None
+            if self._down_since is not None:
+                outage = time.time() - self._down_since
+                self.downtime += outage
+                self._down_since = None
+                self.reconnects += 1
+        print(f'\n✓ Tacview客户端已连接: {addr}（当前 {count} 个客户端），下一帧发送全部对象的关键帧')
+        if outage is not None:
+            print(f'  重新连接（第 {self.reconnects} 次），中断 {outage:.1f} 秒，从当前帧继续')
+    
+    def _queue_joiner(self, viewer):
+        """把客户端加入等待关键帧的队列（调用方持有 _viewer_lock）
+
+        还有未发完的数据时先不请求关键帧，等它发完后由 _admit_joiners 请求。
+        """
+        self._join_seq += 1
+        viewer.seq = self._join_seq
+        self._joining.append(viewer)
+        if not viewer.pending:
+            self._keyframe_requested = True
+        self.is_connected = True
+    
+    def has_output(self):
+        """是否有客户端连接或正在录制（否则不必编码帧）"""
+        return self.is_connected or self.recorder is not None
+    
+    def attach_recorder(self, recorder):
+        """开始录制：写入数据流开头，第一帧作为关键帧"""
+        self.recorder = recorder
+        recorder.on_keyframe_needed = self.request_keyframe
+        recorder.start(self._stream_header())
+    
+    def request_keyframe(self):
+        """请求下一帧作为关键帧（全部对象、完整属性）"""
+        with self._viewer_lock:
+            self._keyframe_requested = True
+    
+    def take_keyframe_request(self, index):
+        """帧源检查关键帧请求：有请求时清除请求并返回关键帧覆盖的加入序号，否则返回 None
+
+        Args:
+            index: 本帧的帧序号（单调递增，用于判断关键帧是否在发送队列中被丢弃）
+        """
+        if not self._keyframe_requested:
+            return None
+        with self._viewer_lock:
+            self._keyframe_requested = False
+            self._last_keyframe_index = index
+            return self._join_seq
+    
+    def send_drone_data(self, drone_id, position, velocity, drone_type, timestamp, object_id=None, label=None):
+        """发送单架无人机数据到Tacview（不包含时间戳帧头）
+
+        object_id / label 由 EntityRegistry 预先计算时直接使用，否则从 drone_id 解析。
+        """
+        if not self.has_output():
             return False
             
         try:
@@ -238,22 +553,26 @@ class TacviewStreamer:
             mach = min(mach, 2.0)  # 限制最大马赫数
             
             # 设置颜色和阵营（参考训练文件格式）
+            if label is None:
+                label = drone_id[1:]
             if drone_type == 'attack':
                 color = 'Red'
                 coalition = 'Enemies'
                 name = 'F-16'
-                short_name = f'F-16  {drone_id[1:]}  3.00'  # 格式如 "F-16  1  3.00"
+                short_name = f'F-16  {label}  3.00'  # 格式如 "F-16  1  3.00"
             else:
                 color = 'Blue'
                 coalition = 'Enemies'  # 蓝方也标记为Enemies（对抗模式）
                 name = 'F-16'
-                short_name = f'F-16  {drone_id[1:]}  3.00'  # 格式如 "F-16  1  3.00"
+                short_name = f'F-16  {label}  3.00'  # 格式如 "F-16  1  3.00"
             
             # 生成唯一ID - 确保红蓝双方至少各支持100架不重复
             # 攻击型（红方）：1-9999
             # 防御型（蓝方）：10001-19999
             # 这样可以支持每方最多9999架飞机
-            if drone_type == 'attack':
+            if object_id is not None:
+                pass  # 注册表已给出
+            elif drone_type == 'attack':
                 # 红方：从drone_id "A1", "A2", ... 提取数字
                 object_id = int(''.join(filter(str.isdigit, drone_id)))
             else:
@@ -281,31 +600,231 @@ class TacviewStreamer:
             print(f"格式化Tacview数据失败: {e}")
             return None
     
+    def _object_fragments(self, registry):
+        """按注册表顺序缓存每个对象的ACMI格式模板（对象ID、阵营颜色和ShortName直接写入模板）
+
+        模板是 UTF-8 字节串，整帧直接用 bytes 的 % 格式化，省去格式化后再编码的一次复制。
+        """
+        if self._fragment_registry is registry:
+            return
+        self._full_fragments = [
+            (f'{object_id},T=%.7f|%.7f|%.7f|%.7f|%.7f|%.7f,Type=Air+FixedWing,Coalition=Enemies,'
+             f'Color={"Red" if is_attack else "Blue"},Name=F-16,Mach=%.3f,ShortName=F-16  {label}  3.00,'
+             f'RadarMode=1,RadarRange=2000,RadarHorizontalBeamwidth=10,RadarVerticalBeamwidth=10\n').encode('utf-8')
+            for object_id, is_attack, label in zip(registry.object_id_list, registry.is_attack_list, registry.labels)
+        ]
+        self._short_fragments = [f'{object_id},T=%.7f|%.7f|%.7f|%.7f|%.7f|%.7f,Mach=%.3f\n'.encode('utf-8')
+                                 for object_id in registry.object_id_list]
+        self._frame_template = None
+        self._short_template = None
+        self._delta_template = None
+        self._static_complete = None
+        self._fragment_registry = registry
+
+    def encode_frame(self, timestamp, registry, x, y, z, vx, vy):
+        """把整帧状态数组编码为ACMI字节串（含 #时间戳 帧头，格式与 send_drone_data 逐行输出一致）
+
+        数值换算全部向量化，整帧用一个缓存的格式模板一次性格式化；启用死区时只写入
+        本帧移动超过阈值的对象。有客户端等待加入时本帧作为关键帧（全部对象、完整属性）。
+
+        Args:
+            registry: EntityRegistry（数组按其顺序排列）
+            x, y: 局部坐标 (km)；z: 高度 (m)
+            vx, vy: 速度分量（已按Tacview单位换算）
+        """
+        self._object_fragments(registry)
+        index = self._frames_encoded
+        keyframe_seq = self.take_keyframe_request(index)
+        if keyframe_seq is not None:
+            self._resync_positions = True
+            self._resync_static = True
+        if self._resync_positions:
+            self._resync_positions = False
+            self._deadband_registry = None  # 本帧作为关键帧发送全部对象
+        if self._resync_static:
+            self._resync_static = False
+            self._static_sent = set()
+            self._static_complete = None
+        n = len(registry)
+        values = np.empty((n, 7))
+        np.clip(REFERENCE_POINT_LON + np.asarray(x) / KM_PER_DEGREE_LON, -180.0, 180.0, out=values[:, 0])
+        np.clip(REFERENCE_POINT_LAT + np.asarray(y) / KM_PER_DEGREE_LAT, -90.0, 90.0, out=values[:, 1])
+        values[:, 2] = z
+        values[:, 3:5] = self.rng.uniform(-5, 5, size=(n, 2))  # roll, pitch
+        vx = np.asarray(vx)
+        vy = np.asarray(vy)
+        moving = (np.abs(vx) > 0.001) | (np.abs(vy) > 0.001)
+        values[:, 5] = np.where(moving, np.mod(np.degrees(np.arctan2(vx, vy)), 360.0), 0.0)  # 航向（北为0，顺时针）
+        speed = np.sqrt(vx ** 2 + vy ** 2)
+        values[:, 6] = np.where(speed > 0, np.minimum(speed / 340.0, 2.0), 0.8)  # 马赫数
+
+        changed = self._deadband_filter(registry, x, y, values[:, 5])
+        self._frames_encoded += 1
+        if changed is None:
+            self.updates_sent += n
+            template = self._select_template(registry)
+        else:
+            self.updates_sent += len(changed)
+            self.updates_suppressed += n - len(changed)
+            template = self._select_template(registry, changed)
+            values = values[changed]
+        return EncodedFrame(template % (timestamp, *values.ravel().tolist()), index, keyframe_seq)
+
+    def _deadband_filter(self, registry, x, y, yaw):
+        """死区判断：返回本帧需要发送的对象索引；全部发送（关键帧、首帧、死区关闭）时返回 None"""
+        if self.deadband_position <= 0:
+            return None
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        keyframe = self.keyframe_interval > 0 and self._frames_encoded % self.keyframe_interval == 0
+        if keyframe or self._deadband_registry is not registry:
+            self._last_sent = np.vstack([x, y, yaw])
+            self._deadband_registry = registry
+            return None
+        last = self._last_sent
+        turn = np.abs(yaw - last[2])
+        turn = np.minimum(turn, 360.0 - turn)
+        moved = (((x - last[0]) ** 2 + (y - last[1]) ** 2 > self.deadband_position ** 2)
+                 | (turn > self.deadband_angle))
+        changed = np.flatnonzero(moved)
+        if len(changed) == len(x):
+            self._last_sent = np.vstack([x, y, yaw])
+            return None
+        last[0, changed] = x[changed]
+        last[1, changed] = y[changed]
+        last[2, changed] = yaw[changed]
+        return changed
+
+    def _select_template(self, registry, changed=None):
+        """选择本帧的格式模板：未发送过静态属性的对象用完整格式，其余只含动态字段
+
+        changed 给出时只包含这些对象（死区过滤后）。所有对象的静态属性都已发送（或不省略静态属性）时
+        模板只取决于 changed，与上一帧的 changed 相同时直接复用上一帧的模板。
+        """
+        if changed is not None:
+            if not self.elide_static or self._static_complete is registry:
+                cached = self._delta_template
+                if (cached is not None and cached[0] is registry and cached[1] == self.elide_static
+                        and np.array_equal(cached[2], changed)):
+                    return cached[3]
+                fragments = self._short_fragments if self.elide_static else self._full_fragments
+                template = b'#%.2f\n' + b''.join([fragments[k] for k in changed.tolist()])
+                self._delta_template = (registry, self.elide_static, changed, template)
+                return template
+            ids = registry.object_id_list
+            sent = self._static_sent
+            fulls = self._full_fragments
+            shorts = self._short_fragments
+            template = b'#%.2f\n' + b''.join([shorts[k] if ids[k] in sent else fulls[k] for k in changed.tolist()])
+            sent.update(ids[k] for k in changed.tolist())
+            if len(sent) >= len(ids) and sent.issuperset(ids):
+                self._static_complete = registry
+            return template
+        if not self.elide_static:
+            if self._frame_template is None:
+                self._frame_template = b'#%.2f\n' + b''.join(self._full_fragments)
+            return self._frame_template
+        if self._static_complete is registry:
+            if self._short_template is None:
+                self._short_template = b'#%.2f\n' + b''.join(self._short_fragments)
+            return self._short_template
+        sent = self._static_sent
+        template = b'#%.2f\n' + b''.join(
+            short if object_id in sent else full
+            for object_id, full, short in zip(registry.object_id_list, self._full_fragments, self._short_fragments)
+        )
+        sent.update(registry.object_id_list)
+        self._static_complete = registry
+        return template
+
     def send_frame_data(self, timestamp, drone_data_list):
-        """批量发送一帧的所有无人机数据 - 参考fourty_enemy.py优化"""
-        if not self.is_connected or not self.client_socket:
+        """批量发送一帧的所有无人机数据（逐行格式化的数据行）"""
+        if not self.has_output():
+            return False
+        message = f'#{timestamp:.2f}\n' + ''.join(line for line in drone_data_list if line)
+        return self.send_encoded_frame(timestamp, message.encode('utf-8'), len(drone_data_list))
+
+    def start_sender(self, queue_size=8, policy='drop_oldest'):
+        """启动发送线程（policy: block / drop_oldest / coalesce，见 StageQueue）"""
+        self.send_queue = StageQueue(queue_size, policy, on_drop=self._on_frame_dropped)
+        self.sender_thread = Thread(target=self._sender_loop, name='tacview-sender', daemon=True)
+        self.sender_thread.start()
+
+    def stop_sender(self):
+        """等待队列中的帧发送完毕并停止发送线程"""
+        if self.sender_thread is None:
+            return
+        self.send_queue.close()
+        self.sender_thread.join(timeout=5)
+        self.sender_thread = None
+
+    def _on_frame_dropped(self, item):
+        """发送队列丢帧"""
+        self.frame_dropped(item[1])
+
+    def frame_dropped(self, encoded_data):
+        """已编码的帧在发送之前被丢弃（发送队列或输出流水线的队列）
+
+        下一帧作为关键帧发送；丢掉的帧带有静态属性时重新发送静态属性；丢掉的是请求的关键帧时
+        重新请求（等待加入的客户端和录制器都在等它）。
+        """
+        self._resync_positions = True
+        if b'Type=' in encoded_data:
+            self._resync_static = True
+        if getattr(encoded_data, 'keyframe_seq', None) is not None:
+            self.request_keyframe()
+
+    def _sender_loop(self):
+        """发送线程主循环"""
+        while True:
+            item = self.send_queue.get()
+            if item is None:
+                break
+            timestamp, encoded_data, drone_count, queued_at = item
+            self._write_frame(timestamp, encoded_data, drone_count)
+            latency = time.perf_counter() - queued_at
+            self.send_latency_total += latency
+            self.send_latency_max = max(self.send_latency_max, latency)
+            self.frames_written += 1
+
+    def sender_stats(self):
+        """发送线程统计：队列深度、丢帧数和发送延迟"""
+        if self.send_queue is None:
+            return None
+        stats = self.send_queue.stats()
+        stats['frames_written'] = self.frames_written
+        stats['avg_latency'] = self.send_latency_total / self.frames_written if self.frames_written else 0.0
+        stats['max_latency'] = self.send_latency_max
+        return stats
+
+    def send_encoded_frame(self, timestamp, encoded_data, drone_count):
+        """发送已编码的整帧数据（encode_frame 或 send_frame_data 生成）
+
+        启动了发送线程时只入队（按队列策略处理积压），否则在调用线程中直接发送。
+        录制在入队之前进行，发送队列丢帧不影响录制文件。
+        """
+        if self.recorder is not None:
+            self.recorder.write(timestamp, encoded_data, getattr(encoded_data, 'keyframe_seq', 0) is not None)
+        if not self.is_connected:
+            return self.recorder is not None
+        if self.send_queue is not None:
+            self.send_queue.put((timestamp, encoded_data, drone_count, time.perf_counter()))
+            return True
+        return self._write_frame(timestamp, encoded_data, drone_count)
+
+    def _write_frame(self, timestamp, encoded_data, drone_count):
+        """写日志并把一帧分发给所有客户端（每帧只编码一次）"""
+        if not self.is_connected:
             return False
             
         try:
-            drone_count = len(drone_data_list)
-            
-            # 参考fourty_enemy.py的简洁写法：直接字符串拼接
-            message = f'#{timestamp:.2f}\n'  # 时间戳帧头
-            
-            # 拼接所有飞机数据
-            for data_line in drone_data_list:
-                if data_line:
-                    message += data_line
-            
-            # 编码并发送
-            encoded_data = message.encode('utf-8')
             data_size = len(encoded_data)
             
             # 写入日志文件
             if self.log_file:
                 try:
                     self.log_file.write(f'【时刻 {timestamp:.2f}s】 飞机数: {drone_count}  数据大小: {data_size}字节\n')
-                    self.log_file.write(message)
+                    self.log_file.write(encoded_data.decode('utf-8'))
                     self.log_file.write('\n')
                     self.log_file.flush()
                 except:
@@ -314,8 +833,7 @@ class TacviewStreamer:
             # 记录发送开始时间
             send_start_time = time.time()
             
-            # 使用 sendall 确保完整发送
-            self.client_socket.sendall(encoded_data)
+            viewer_count = self._fanout(encoded_data)
             
             # 记录发送结束时间并计算传递时间（毫秒）
             send_end_time = time.time()
@@ -335,87 +853,228 @@ class TacviewStreamer:
             if self._frame_counter - self._last_print_frame >= 20:
                 avg_size = self._total_sent / self._frame_counter
                 avg_transmission_time = self._total_transmission_time / self._frame_counter
-                print(f'【Tacview发送】帧 {self._frame_counter} | 飞机: {drone_count} | 本帧: {data_size}B | 平均: {avg_size:.0f}B | 传递时间: {transmission_time:.2f}ms | 平均: {avg_transmission_time:.2f}ms')
+                suppressed = ''
+                if self.updates_suppressed:
+                    ratio = self.updates_suppressed / (self.updates_sent + self.updates_suppressed)
+                    suppressed = f' | 死区抑制: {self.updates_suppressed} 次 ({ratio * 100:.1f}%)'
+                print(f'【Tacview发送】帧 {self._frame_counter} | 飞机: {drone_count} | 客户端: {viewer_count} | 本帧: {data_size}B | 平均: {avg_size:.0f}B | 传递时间: {transmission_time:.2f}ms | 平均: {avg_transmission_time:.2f}ms{suppressed}')
                 self._last_print_frame = self._frame_counter
             
             return True
             
-        except BrokenPipeError:
-            print('\n【错误】Tacview连接已断开（Broken Pipe）')
-            self.is_connected = False
-            return False
         except Exception as e:
             print('\n' + '!' * 70)
             print(f'【错误】发送Tacview帧数据失败')
             print(f'  错误类型: {type(e).__name__}')
             print(f'  错误信息: {e}')
             print(f'  时间戳: {timestamp}')
-            print(f'  飞机数量: {len(drone_data_list)}')
+            print(f'  飞机数量: {drone_count}')
             import traceback
             traceback.print_exc()
             print('!' * 70 + '\n')
-            self.is_connected = False  # 标记为断开
             return False
+
+    def _fanout(self, encoded_data):
+        """把一帧分发给所有客户端，返回收到本帧的客户端数
+
+        等待关键帧的客户端在收到覆盖它的关键帧时加入；某个客户端断开或积压过多
+        只影响该客户端。客户端列表只在 _viewer_lock 下修改：断开和积压的客户端
+        先记下，发送完本帧后再移除。
+        """
+        self._admit_joiners(encoded_data)
+        with self._viewer_lock:
+            viewers = list(self.viewers)
+        closed, lagging = [], []
+        for viewer in viewers:
+            try:
+                self._send_to_viewer(viewer, encoded_data)
+            except OSError as e:
+                closed.append((viewer, type(e).__name__))
+                continue
+            if viewer.pending_bytes > self.viewer_backlog_limit:
+                lagging.append(viewer)
+        for viewer, error in closed:
+            self._drop_viewer(viewer, f'连接已断开（{error}）')
+        for viewer in lagging:
+            # 跟不上的客户端：丢弃积压的帧（已发出一部分的帧保留以保持数据流完整），重新等待关键帧
+            head = viewer.pending[0] if viewer.offset else None
+            viewer.pending.clear()
+            viewer.pending_bytes = 0
+            if head is not None:
+                viewer.pending.append(head)
+                viewer.pending_bytes = len(head)
+            viewer.resyncs += 1
+            with self._viewer_lock:
+                if viewer not in self.viewers:
+                    continue  # 已被 close 移除
+                self.viewers.remove(viewer)
+                self._queue_joiner(viewer)
+            print(f'【警告】Tacview客户端 {viewer.addr} 积压过多，丢弃积压帧并等待关键帧')
+        return len(viewers) - len(closed) - len(lagging)
+
+    def _admit_joiners(self, encoded_data):
+        """把关键帧覆盖到的等待客户端加入共享数据流
+
+        逐行格式化的帧（send_frame_data）总是包含全部对象的完整属性，可直接加入；
+        因积压而重新等待的客户端要先发完剩余数据。关键帧在队列中被丢弃时（后续帧已到达
+        而客户端仍在等待）重新请求关键帧。
+        """
+        if not self._joining:
+            return
+        keyframe_seq = getattr(encoded_data, 'keyframe_seq', self._join_seq)
+        index = getattr(encoded_data, 'index', None)
+        with self._viewer_lock:
+            joining = list(self._joining)
+        closed = []
+        for viewer in joining:
+            if viewer.pending:
+                try:
+                    self._send_to_viewer(viewer, None)
+                except OSError:
+                    closed.append(viewer)
+        for viewer in closed:
+            self._drop_viewer(viewer, '连接已断开')
+        with self._viewer_lock:
+            waiting = []
+            for viewer in self._joining:
+                if not viewer.pending and keyframe_seq is not None and viewer.seq <= keyframe_seq:
+                    self.viewers.append(viewer)
+                else:
+                    waiting.append(viewer)
+            self._joining = waiting
+            ready = any(not viewer.pending for viewer in waiting)
+            if ready and index is not None and index > self._last_keyframe_index:
+                self._keyframe_requested = True
+
+    def _send_to_viewer(self, viewer, data):
+        """非阻塞发送：发送缓冲区满时把未发出的部分留在该客户端的待发队列中（data 为 None 时只发送积压）"""
+        if data is not None:
+            viewer.pending.append(data)
+            viewer.pending_bytes += len(data)
+        try:
+            while viewer.pending:
+                head = viewer.pending[0]
+                viewer.offset += viewer.sock.send(memoryview(head)[viewer.offset:])
+                if viewer.offset < len(head):
+                    break
+                viewer.pending.popleft()
+                viewer.pending_bytes -= len(head)
+                viewer.offset = 0
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _drop_viewer(self, viewer, reason):
+        """移除一个客户端（其余客户端不受影响）"""
+        with self._viewer_lock:
+            if viewer in self.viewers:
+                self.viewers.remove(viewer)
+            if viewer in self._joining:
+                self._joining.remove(viewer)
+            self.is_connected = bool(self.viewers or self._joining)
+            count = len(self.viewers) + len(self._joining)
+            self.disconnects += 1
+            if not self.is_connected and self._down_since is None:
+                self._down_since = time.time()
+        try:
+            viewer.sock.close()
+        except OSError:
+            pass
+        print(f'\n【Tacview】客户端 {viewer.addr} {reason}（剩余 {count} 个客户端）')
+    
+    def _target_area_line(self, target_area):
+        """目标区域中心点的ACMI数据行（匹配训练文件格式）"""
+        x, y = target_area
+        
+        # 发送中心靶心标记
+        longitude = (x - 50) * 0.01
+        latitude = (y - 50) * 0.01
+        
+        # 确保经纬度在有效范围内
+        longitude = max(-180.0, min(180.0, longitude))
+        latitude = max(-90.0, min(90.0, latitude))
+        
+        altitude = 0  # 地面目标
+        
+        object_id = 1000000  # 固定ID（匹配训练文件）
+        
+        # 格式匹配训练文件：1000000,T=160.123456|24.8976763|0, Type=Ground+Static+Building, Name=Competition, EngagementRange=30000
+        # 注意：目标中心点不带时间戳，直接发送
+        return f'{object_id},T={longitude:.7f}|{latitude:.7f}|{altitude:.1f}, Type=Ground+Static+Building, Name=Competition, EngagementRange=30000\n'
     
     def send_target_area(self, target_area):
-        """发送目标区域中心点标记到Tacview（匹配训练文件格式）
-        注意：这应该在文件头之后、第一个时间戳帧之前发送"""
-        if not self.is_connected or not self.client_socket:
-            return False
-            
+        """更新目标区域中心点并发送到已连接的Tacview客户端
+
+        新连接的客户端在握手后、第一个时间戳帧之前自动收到目标区域。
+        """
+        self.target_area = target_area
         try:
-            x, y = target_area
-            
-            # 发送中心靶心标记
-            longitude = (x - 50) * 0.01
-            latitude = (y - 50) * 0.01
-            
-            # 确保经纬度在有效范围内
-            longitude = max(-180.0, min(180.0, longitude))
-            latitude = max(-90.0, min(90.0, latitude))
-            
-            altitude = 0  # 地面目标
-            
-            object_id = 1000000  # 固定ID（匹配训练文件）
-            
-            # 格式匹配训练文件：1000000,T=160.123456|24.8976763|0, Type=Ground+Static+Building, Name=Competition, EngagementRange=30000
-            # 注意：目标中心点不带时间戳，直接发送
-            data = f'{object_id},T={longitude:.7f}|{latitude:.7f}|{altitude:.1f}, Type=Ground+Static+Building, Name=Competition, EngagementRange=30000\n'
-            
-            self.client_socket.sendall(data.encode('utf-8'))
-            
-            # 同时写入日志文件
-            if self.log_file:
-                try:
-                    self.log_file.write('【目标中心点】\n')
-                    self.log_file.write(data)
-                    self.log_file.write('\n')
-                    self.log_file.flush()
-                except:
-                    pass
-            
-            print(f'  > 目标中心点已发送: {longitude:.7f}, {latitude:.7f}')
+            data = self._target_area_line(target_area)
+            if self.is_connected:
+                self.send_encoded_frame(0.0, EncodedFrame(data.encode('utf-8')), 0)
+            print(f'  > 目标中心点已发送: {data.split(",")[1][2:]}')
             return True
             
         except Exception as e:
             print(f"发送目标区域数据失败: {e}")
             return False
     
+    def connection_stats(self):
+        """连接统计：连接/重连/断开次数、累计中断时间和监听重启次数"""
+        downtime = self.downtime
+        if self._down_since is not None:
+            downtime += time.time() - self._down_since
+        return {
+            'connections': self.connections,
+            'reconnects': self.reconnects,
+            'disconnects': self.disconnects,
+            'downtime': downtime,
+            'listener_restarts': self.listener_restarts,
+            'viewers': len(self.viewers) + len(self._joining)
+        }
+
     def close(self):
-        """关闭连接"""
-        self.is_connected = False
+        """关闭所有客户端连接和监听"""
+        self.stop_sender()
+        stats = self.sender_stats()
+        if stats:
+            print(f"Tacview发送线程: 已发送 {stats['frames_written']} 帧 | 队列({stats['policy']}, 容量 {stats['maxsize']}) "
+                  f"平均深度 {stats['avg_depth']:.2f}, 最大 {stats['max_depth']} | 丢帧 {stats['dropped']} | "
+                  f"发送延迟 平均 {stats['avg_latency'] * 1000:.2f} 毫秒, 最大 {stats['max_latency'] * 1000:.2f} 毫秒")
         self.is_streaming = False
-        try:
-            if self.client_socket:
-                self.client_socket.close()
-        except:
-            pass
+        if self.recorder is not None:
+            self.recorder.close()
+            rec = self.recorder.stats()
+            print(f"ACMI录制: {len(rec['files'])} 个文件 ({', '.join(rec['files'])}) | {rec['frames']} 帧 | "
+                  f"{rec['bytes'] / 1024 / 1024:.1f} MB (未压缩) | 写入 {rec['write_time']:.2f} 秒 | fsync {rec['fsyncs']} 次")
+            self.recorder = None
+        if self.server_thread is not None:
+            self._server_stop.set()
+            self.server_thread.join(timeout=2)
+            self.server_thread = None
         try:
             if self.socket:
                 self.socket.close()
         except:
             pass
         
+        # 把已排队的数据发完再断开（每个客户端最多等待2秒）
+        with self._viewer_lock:
+            viewers = self.viewers + self._joining
+            self.viewers = []
+            self._joining = []
+            self.is_connected = False
+        for viewer in viewers:
+            try:
+                viewer.sock.settimeout(2.0)
+                for k, chunk in enumerate(viewer.pending):
+                    viewer.sock.sendall(memoryview(chunk)[viewer.offset if k == 0 else 0:])
+            except OSError:
+                pass
+            try:
+                viewer.sock.close()
+            except OSError:
+                pass
+        
         # 关闭日志文件
         if self.log_file:
             try:
@@ -427,9 +1086,606 @@ class TacviewStreamer:
             except:
                 pass
         
+        if self.updates_suppressed:
+            total = self.updates_sent + self.updates_suppressed
+            print(f"Tacview死区统计: 发送 {self.updates_sent} 次对象更新, 抑制 {self.updates_suppressed} 次 "
+                  f"({self.updates_suppressed / total * 100:.1f}%)")
+        if self.connections:
+            conn = self.connection_stats()
+            print(f"Tacview连接统计: 连接 {conn['connections']} 次, 重连 {conn['reconnects']} 次, "
+                  f"断开 {conn['disconnects']} 次, 累计中断 {conn['downtime']:.1f} 秒, 监听重启 {conn['listener_restarts']} 次")
         print("Tacview连接已关闭")
 
 
+class AcmiRecorder:
+    """ACMI录制器：在后台线程把帧写入可直接用Tacview打开的 .txt.acmi / .zip.acmi 文件
+
+    推演线程只把帧放入队列；写线程按 buffer_size 攒批写入，按大小或仿真时间轮转文件。
+    轮转时先请求一个关键帧（全部对象的完整属性），在该关键帧处切换到新文件，每个文件
+    都包含文件头并且可以单独打开。
+
+    每个关键帧之前写一行注释 KEYFRAME_MARKER（Tacview忽略 // 注释），回放时据此找到同步起点；
+    keyframe_seconds 控制关键帧的最长间隔，从而限制回放跳转和新客户端加入时同步帧的大小。
+
+    Args:
+        path: 输出路径，'.zip.acmi' 写zip压缩包，'.gz' 写gzip，其余写纯文本。
+            Tacview只能打开 .txt.acmi 和 .zip.acmi；.gz 文件要先解压为 .txt.acmi
+            （例如 gunzip -c run.gz > run.txt.acmi），或用 --replay 直接回放
+        max_bytes: 单个文件的最大字节数（未压缩），0 表示不按大小轮转
+        max_seconds: 单个文件覆盖的最大仿真时长（秒），0 表示不按时间轮转
+        fsync_interval: 两次 fsync 之间的最短间隔（秒），0 表示只在关闭文件时 fsync
+        buffer_size: 写缓冲区大小（字节）
+        queue_size: 待写帧队列容量（队列满时推演线程等待，录制不丢帧）
+        keyframe_retry: 等待关键帧期间每隔多少帧重新请求一次（请求的关键帧可能在上游被丢弃）
+        keyframe_seconds: 两个关键帧之间的最长仿真时长（秒），超过时请求关键帧，0 表示不定期请求
+    """
+
+    KEYFRAME_MARKER = b'// keyframe\n'
+
+    def __init__(self, path, max_bytes=0, max_seconds=0.0, fsync_interval=0.0,
+                 buffer_size=4 * 1024 * 1024, queue_size=256, keyframe_retry=20, keyframe_seconds=10.0):
+        self.path = path
+        for suffix in ('.zip.acmi', '.txt.acmi', '.acmi', '.gz'):
+            if path.endswith(suffix):
+                self.stem, self.suffix = path[:-len(suffix)], suffix
+                break
+        else:
+            self.stem, self.suffix = path, ''
+        self.compression = 'zip' if self.suffix == '.zip.acmi' else 'gzip' if self.suffix == '.gz' else None
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.fsync_interval = fsync_interval
+        self.buffer_size = buffer_size
+        self.keyframe_retry = max(1, keyframe_retry)
+        self.keyframe_seconds = keyframe_seconds
+        self.queue = StageQueue(queue_size, 'block')
+        self.on_keyframe_needed = None  # 需要关键帧时的回调（TacviewStreamer.request_keyframe）
+        self.header = b''
+        self.thread = None
+        self.files = []  # 已写入的文件路径
+        self.frames_written = 0
+        self.frames_skipped = 0  # 第一个关键帧之前的帧（缺少静态属性，不写入）
+        self.bytes_written = 0  # 未压缩字节数
+        self.fsyncs = 0
+        self.write_time = 0.0
+        self._raw = None
+        self._archive = None
+        self._stream = None
+        self._buffer = []
+        self._buffered = 0
+        self._file_bytes = 0
+        self._file_start = None  # 当前文件第一帧的仿真时间
+        self._last_fsync = 0.0
+        self._rotate_pending = False
+        self._frames_waiting = 0  # 上次请求关键帧之后到达的非关键帧数
+        self._keyframe_time = None  # 最近一个关键帧的仿真时间
+        self._keyframe_due = False  # 已按 keyframe_seconds 请求关键帧，尚未收到
+
+    def start(self, header):
+        """写入文件头（文件头、参考时间、标题、目标区域）并启动写线程"""
+        self.header = header.encode('utf-8') if isinstance(header, str) else header
+        if self.compression == 'gzip':
+            print(f'【提示】{self.path} 为gzip格式，Tacview不能直接打开，需先解压为 .txt.acmi（或使用 --replay 回放）')
+        self.thread = Thread(target=self._writer_loop, name='acmi-recorder', daemon=True)
+        self.thread.start()
+        if self.on_keyframe_needed:
+            self.on_keyframe_needed()
+
+    def write(self, timestamp, data, keyframe=True):
+        """放入一帧（keyframe 表示该帧包含全部对象的完整属性，可作为新文件的第一帧）"""
+        self.queue.put((timestamp, data, keyframe))
+
+    def _writer_loop(self):
+        """写线程主循环"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            timestamp, data, keyframe = item
+            start = time.perf_counter()
+            try:
+                self._write_item(timestamp, data, keyframe)
+            except OSError as e:
+                print(f'【错误】ACMI录制写入失败: {e}')
+            self.write_time += time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            self._close_file()
+        except OSError as e:
+            print(f'【错误】ACMI录制关闭文件失败: {e}')
+        self.write_time += time.perf_counter() - start
+
+    def _write_item(self, timestamp, data, keyframe):
+        """写入一帧：需要轮转时在关键帧处切换文件"""
+        if self._stream is None:
+            if not keyframe:
+                self.frames_skipped += 1
+                self._await_keyframe()
+                return
+            self._open_file(timestamp)
+        elif self._rotation_due(timestamp):
+            if keyframe:
+                self._close_file()
+                self._open_file(timestamp)
+            elif not self._rotate_pending:
+                self._rotate_pending = True
+                self._frames_waiting = 0
+                if self.on_keyframe_needed:
+                    self.on_keyframe_needed()
+            else:
+                self._await_keyframe()
+        if keyframe:
+            self._keyframe_time = timestamp
+            self._keyframe_due = False
+            self._append(self.KEYFRAME_MARKER)
+        elif (self.keyframe_seconds > 0 and not self._rotate_pending
+              and timestamp - self._keyframe_time >= self.keyframe_seconds):
+            if not self._keyframe_due:
+                self._keyframe_due = True
+                self._frames_waiting = 0
+                if self.on_keyframe_needed:
+                    self.on_keyframe_needed()
+            else:
+                self._await_keyframe()
+        self._append(data)
+        self.frames_written += 1
+        if self._buffered >= self.buffer_size:
+            self._flush_buffer()
+        if self.fsync_interval > 0 and time.time() - self._last_fsync >= self.fsync_interval:
+            self._fsync()
+
+    def _append(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self._file_bytes += len(data)
+        self.bytes_written += len(data)
+
+    def _await_keyframe(self):
+        """等待关键帧期间每隔 keyframe_retry 帧重新请求一次"""
+        self._frames_waiting += 1
+        if self._frames_waiting >= self.keyframe_retry and self.on_keyframe_needed:
+            self._frames_waiting = 0
+            self.on_keyframe_needed()
+
+    def _rotation_due(self, timestamp):
+        return ((self.max_bytes > 0 and self._file_bytes >= self.max_bytes)
+                or (self.max_seconds > 0 and timestamp - self._file_start >= self.max_seconds))
+
+    def _part_path(self, index):
+        """第 index 个文件的路径（第一个文件使用原路径）"""
+        if index == 0:
+            return self.path
+        return f'{self.stem}_{index:03d}{self.suffix}'
+
+    def _open_file(self, timestamp):
+        path = self._part_path(len(self.files))
+        self._raw = open(path, 'wb')
+        if self.compression == 'zip':
+            self._archive = zipfile.ZipFile(self._raw, 'w', zipfile.ZIP_DEFLATED)
+            member = os.path.basename(self.stem) + '.txt.acmi'
+            self._stream = self._archive.open(member, 'w', force_zip64=True)
+        elif self.compression == 'gzip':
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode='wb')
+        else:
+            self._stream = self._raw
+        self.files.append(path)
+        self._file_start = timestamp
+        self._file_bytes = len(self.header)
+        self._rotate_pending = False
+        self._frames_waiting = 0
+        self._last_fsync = time.time()
+        self._stream.write(self.header)
+
+    def _flush_buffer(self):
+        if self._buffer:
+            self._stream.write(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def _fsync(self):
+        self._flush_buffer()
+        if self._stream is not self._raw:
+            self._stream.flush()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self.fsyncs += 1
+        self._last_fsync = time.time()
+
+    def _close_file(self):
+        if self._stream is None:
+            return
+        self._flush_buffer()
+        if self._stream is not self._raw:
+            self._stream.close()
+        if self._archive is not None:
+            self._archive.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self.fsyncs += 1
+        self._raw.close()
+        self._raw = self._archive = self._stream = None
+
+    def close(self):
+        """写完队列中的帧并关闭文件"""
+        self.queue.close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def stats(self):
+        return {
+            'files': list(self.files),
+            'frames': self.frames_written,
+            'frames_skipped': self.frames_skipped,
+            'bytes': self.bytes_written,
+            'fsyncs': self.fsyncs,
+            'write_time': self.write_time,
+            'queue': self.queue.stats()
+        }
+
+
+class AcmiReplayServer:
+    """ACMI回放服务器：内存映射录制文件，建立 #时间戳 帧的字节偏移索引，按原时间间隔推送给Tacview客户端
+
+    客户端连接、握手和多客户端分发复用 TacviewStreamer；数据流开头使用文件自带的文件头。
+    新客户端加入或跳转时发送同步帧：最近一个关键帧（录制时用 AcmiRecorder.KEYFRAME_MARKER 标记，
+    包含全部对象的完整属性）到当前帧的全部更新（合并在当前时间戳下），之后继续逐帧播放。
+
+    控制消息与推演相同（UDP/JSON，见 send_control_command）：paused, speed_multiplier, seek（ACMI时间，秒）。
+
+    Args:
+        path: 录制文件（.txt.acmi 内存映射；.zip.acmi / .gz 解压到内存。.gz 录制Tacview不能直接打开，
+            可用本服务器回放，或解压为 .txt.acmi 后打开）
+        speed: 播放倍速
+        loop: 播放到结尾后是否从头开始
+        control_port: 本地UDP控制端口，0 表示不启用
+    """
+
+    def __init__(self, path, speed=1.0, loop=False, local_ip='127.0.0.1', local_port=58008, control_port=0):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.is_paused = False
+        self.control_port = control_port
+        self.control_socket = None
+        self._mmap = None
+        self._file = None
+        start = time.perf_counter()
+        self._load(path)
+        try:
+            self._build_index()
+        except Exception:
+            self._unload()
+            raise
+        self.index_time = time.perf_counter() - start
+        self.streamer = TacviewStreamer(local_ip, local_port)
+        self.streamer.log_file_path = None
+        self.streamer.stream_header = self.header
+        self.position = 0  # 下一个要播放的帧
+        self.frames_sent = 0
+        self.seeks = 0
+        self._seek_to = None
+        self._anchor = None  # (墙钟时间, ACMI时间)：播放时钟的锚点
+
+    def _load(self, path):
+        """纯文本文件内存映射，压缩文件解压到内存"""
+        if path.endswith('.zip.acmi'):
+            with zipfile.ZipFile(path) as archive:
+                self.data = archive.read(archive.namelist()[0])
+        elif path.endswith('.gz'):
+            with gzip.open(path, 'rb') as f:
+                self.data = f.read()
+        elif os.path.getsize(path) == 0:
+            self.data = b''  # 空文件不能内存映射，交给 _build_index 报告没有帧
+        else:
+            self._file = open(path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = self._mmap
+
+    def _unload(self):
+        """释放内存映射和文件"""
+        self.data = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = self._file = None
+
+    def _build_index(self, chunk_size=1 << 24):
+        """建立帧索引：每个 #时间戳 行的字节偏移、帧时间、帧结束偏移、对象行数和关键帧
+
+        按 chunk_size 分块向量化扫描换行符，临时数组的大小与块而不是文件成比例；
+        每帧只记录起始偏移和之前的换行符总数，帧的行数由相邻两帧的差得到。
+        关键帧是前面紧跟 KEYFRAME_MARKER 的帧；没有标记的文件（其他程序生成）改为检查
+        每个对象行都带 Type= 的帧。第一帧总是作为同步起点。
+        """
+        size = len(self.data)
+        starts, newlines_before = [], []
+        newline_total = 0
+        line_start = True  # 块的第一个字节是否为行首（文件开头或上一块以换行结束）
+        for offset in range(0, size, chunk_size):
+            raw = np.frombuffer(self.data, dtype=np.uint8, count=min(chunk_size, size - offset), offset=offset)
+            newlines = np.flatnonzero(raw == 10)
+            line_starts = newlines + 1
+            line_starts = line_starts[line_starts < len(raw)]
+            if line_start:
+                line_starts = np.concatenate(([0], line_starts))
+            frames = line_starts[raw[line_starts] == ord('#')]
+            starts.append(frames + offset)
+            newlines_before.append(newline_total + np.searchsorted(newlines, frames))
+            newline_total += len(newlines)
+            line_start = raw[-1] == 10
+            del raw  # 不保留对 mmap 的引用（关闭时 mmap 不能有导出的缓冲区）
+        self.starts = np.concatenate(starts) if starts else np.zeros(0, dtype=np.intp)
+        if not len(self.starts):
+            raise ValueError(f'{self.path} 中没有 #时间戳 帧')
+        self.ends = np.append(self.starts[1:], size)
+        marker = AcmiRecorder.KEYFRAME_MARKER
+        times = []
+        marked = []
+        for start in self.starts.tolist():
+            header_end = self.data.find(b'\n', start)
+            if header_end < 0:
+                header_end = size
+            times.append(float(self.data[start + 1:header_end]))
+            marked.append(start >= len(marker) and self.data[start - len(marker):start] == marker)
+        self.times = np.array(times)
+        lines = np.diff(np.append(np.concatenate(newlines_before), newline_total)) - 1
+        # 下一帧的关键帧标记行位于本帧的字节范围内，不计入本帧的对象行
+        self.object_counts = lines - np.append(marked[1:], False).astype(lines.dtype)
+        if any(marked):
+            keyframes = np.flatnonzero(marked)
+        else:
+            keyframes = np.flatnonzero([self.data[start:end].count(b'Type=') == n for start, end, n
+                                        in zip(self.starts.tolist(), self.ends.tolist(), lines.tolist())])
+        self.keyframes = np.union1d([0], keyframes).astype(np.intp)
+        header_end = self.starts[0] - len(marker) if marked[0] else self.starts[0]
+        self.header = bytes(self.data[:header_end]).decode('utf-8')
+
+    def __len__(self):
+        return len(self.starts)
+
+    def frame_at(self, timestamp):
+        """时间戳不晚于 timestamp 的最后一帧（二分查找，O(log n)）"""
+        return max(0, int(np.searchsorted(self.times, timestamp, side='right')) - 1)
+
+    def seek(self, timestamp):
+        """跳转到 timestamp（在播放线程的下一次循环中生效）"""
+        self._seek_to = timestamp
+
+    def set_speed(self, speed):
+        self.speed = max(speed, 1e-3)
+        self._anchor = None
+
+    def _sync_frame(self, k, keyframe_seq):
+        """同步帧：最近一个关键帧到第 k 帧的全部更新（去掉时间戳行和注释行），使用第 k 帧的时间戳"""
+        kf = self.keyframes[int(np.searchsorted(self.keyframes, k, side='right')) - 1]
+        updates = re.sub(rb'(?m)^(?:#|//)[^\n]*\n', b'', bytes(self.data[self.starts[kf]:self.ends[k]]))
+        data = b'#%.2f\n' % self.times[k] + updates
+        return EncodedFrame(data, self.frames_sent, keyframe_seq)
+
+    def _apply_control(self, control_data):
+        if 'paused' in control_data:
+            self.is_paused = bool(control_data['paused'])
+            self._anchor = None
+            print(f"【回放】{'已暂停' if self.is_paused else '继续播放'}")
+        if 'speed_multiplier' in control_data:
+            self.set_speed(float(control_data['speed_multiplier']))
+            print(f"【回放】倍速 {self.speed}x")
+        if 'seek' in control_data:
+            self.seek(float(control_data['seek']))
+
+    def _drain_control_socket(self):
+        if not self.control_socket:
+            return
+        while True:
+            try:
+                data, _ = self.control_socket.recvfrom(65536)
+            except OSError:
+                break
+            try:
+                self._apply_control(json.loads(data.decode('utf-8')))
+            except Exception:
+                pass  # 忽略格式错误的消息
+
+    def _wait(self, timeout):
+        """等待至多 timeout 秒；控制端口收到消息时立即返回"""
+        if not self.control_socket:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select([self.control_socket], [], [], timeout)
+        if readable:
+            self._drain_control_socket()
+
+    def serve(self, duration=None):
+        """启动服务器并播放，直到播放结束（loop=False）、超过 duration 秒或 Ctrl+C"""
+        self.streamer.start_server()
+        if self.control_port:
+            try:
+                self.control_socket = socket(AF_INET, SOCK_DGRAM)
+                self.control_socket.bind(('127.0.0.1', self.control_port))
+                self.control_socket.setblocking(False)
+                print(f"  控制端口: 127.0.0.1:{self.control_port} (UDP/JSON: paused, speed_multiplier, seek)")
+            except OSError as e:
+                print(f"初始化控制端口失败: {e}")
+                self.control_socket = None
+        started = time.time()
+        try:
+            while duration is None or time.time() - started < duration:
+                self._drain_control_socket()
+                if self._seek_to is not None:
+                    self.position = self.frame_at(self._seek_to)
+                    self._seek_to = None
+                    self._anchor = None
+                    self.seeks += 1
+                    self.streamer.request_keyframe()
+                    print(f"【回放】跳转到 {self.times[self.position]:.2f}s（第 {self.position} 帧）")
+                if self.position >= len(self):
+                    if not self.loop:
+                        break
+                    self.position = 0
+                    self._anchor = None
+                    self.streamer.request_keyframe()
+                if self.is_paused or not self.streamer.is_connected:
+                    # 暂停或没有客户端时播放时钟停止
+                    self._anchor = None
+                    self._wait(0.1)
+                    continue
+                k = self.position
+                if self._anchor is None:
+                    self._anchor = (time.time(), self.times[k])
+                delay = self._anchor[0] + (self.times[k] - self._anchor[1]) / self.speed - time.time()
+                if delay > 0:
+                    self._wait(min(delay, 0.1))
+                    continue
+                keyframe_seq = self.streamer.take_keyframe_request(self.frames_sent)
+                if keyframe_seq is not None:
+                    frame = self._sync_frame(k, keyframe_seq)
+                    count = len(set(re.findall(rb'(?m)^([^,\n]+),', frame)))  # 同步帧中的不同对象
+                else:
+                    frame = EncodedFrame(bytes(self.data[self.starts[k]:self.ends[k]]), self.frames_sent)
+                    count = int(self.object_counts[k])
+                self.streamer.send_encoded_frame(self.times[k], frame, count)
+                self.frames_sent += 1
+                self.position += 1
+        except KeyboardInterrupt:
+            print('\n【提示】回放已中断')
+        finally:
+            self.close()
+
+    def close(self):
+        self.streamer.close()
+        if self.control_socket:
+            self.control_socket.close()
+            self.control_socket = None
+        self._unload()
+        print(f"回放统计: 已发送 {self.frames_sent} 帧 | 跳转 {self.seeks} 次")
+
+
+class FakeTacviewClient:
+    """本地模拟的Tacview客户端：完成实时遥测握手，接收并解析ACMI数据流，记录每帧到达时间
+
+    用于在没有Windows版Tacview的环境中测量 TacviewStreamer 的吞吐量和延迟。
+    每帧记录时间戳、对象行数、字节数以及首字节/末字节到达时间（time.perf_counter）；
+    track_objects 时 objects 保存每个对象最近一次的 T= 字段（逐行解析，开销较大）。
+    """
+
+    def __init__(self, host='127.0.0.1', port=58008, name='fake_tacview', track_objects=True):
+        self.host = host
+        self.port = port
+        self.name = name
+        self.track_objects = track_objects
+        self.sock = None
+        self.thread = None
+        self.header_lines = []  # 第一个时间戳帧之前的数据行（文件头、参考时间、目标区域等）
+        self.frames = []  # [时间戳, 对象行数, 字节数, 首字节到达, 末字节到达]
+        self.objects = {}  # 对象ID -> 最近的 T= 字段
+        self.bytes_received = 0
+        self._partial = b''
+
+    def connect(self, timeout=5.0):
+        """连接并完成握手（服务器未就绪时重试），返回是否成功"""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.sock = create_connection((self.host, self.port), timeout=timeout)
+                break
+            except OSError:
+                if time.time() > deadline:
+                    return False
+                time.sleep(0.05)
+        self.sock.setsockopt(SOL_SOCKET, SO_RCVBUF, 4 * 1024 * 1024)
+        handshake = b''
+        while not handshake.endswith(b'\x00'):
+            chunk = self.sock.recv(1024)
+            if not chunk:
+                return False
+            handshake += chunk
+        self.sock.sendall(f'XtraLib.Stream.0\nTacview.RealTimeTelemetry.0\n{self.name}\n\x00'.encode('utf-8'))
+        return True
+
+    def start(self):
+        """在后台线程中接收数据"""
+        self.thread = Thread(target=self._recv_loop, name='fake-tacview', daemon=True)
+        self.thread.start()
+
+    def _recv_loop(self):
+        self.sock.settimeout(0.5)
+        while True:
+            try:
+                chunk = self.sock.recv(1 << 20)
+            except timeout:
+                continue
+            except OSError:
+                break
+            if not chunk:
+                break
+            self._parse(chunk, time.perf_counter())
+
+    def _parse(self, chunk, arrived):
+        """解析完整的行：#时间戳 开始新帧，其余行按块计入当前帧（track_objects 时逐行更新对象状态）"""
+        self.bytes_received += len(chunk)
+        data = self._partial + chunk
+        cut = data.rfind(b'\n') + 1
+        self._partial = data[cut:]
+        frame = self.frames[-1] if self.frames else None
+        pos = 0
+        while pos < cut:
+            if data[pos] == 0x23:  # '#'
+                eol = data.index(b'\n', pos)
+                frame = [float(data[pos + 1:eol]), 0, eol + 1 - pos, arrived, arrived]
+                self.frames.append(frame)
+                pos = eol + 1
+                continue
+            next_frame = data.find(b'\n#', pos, cut)
+            end = cut if next_frame < 0 else next_frame + 1
+            block = data[pos:end]
+            pos = end
+            if frame is None:
+                self.header_lines.extend(block.decode('utf-8', 'replace').splitlines())
+                continue
+            frame[1] += block.count(b',T=')
+            frame[2] += len(block)
+            frame[4] = arrived
+            if self.track_objects:
+                for line in block.split(b'\n'):
+                    object_id, _, fields = line.partition(b',')
+                    if fields.startswith(b'T='):
+                        end_t = fields.find(b',')
+                        self.objects[object_id] = fields[2:end_t if end_t >= 0 else None]
+
+    def wait_for_frames(self, count, timeout=10.0):
+        """等待收到 count 帧（最后一帧完整到达需要下一帧或连接关闭），返回实际帧数"""
+        deadline = time.time() + timeout
+        while len(self.frames) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return len(self.frames)
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+
+def _fake_client_worker(port, conn, duration=120.0):
+    """基准用的客户端进程：接收数据直到服务器关闭连接，把逐帧记录发回主进程
+
+    客户端单独一个进程，解析开销不与编码、发送线程争用GIL；time.perf_counter 在同一台机器上
+    各进程一致，可直接与主进程记录的编码开始时间相减。
+    """
+    client = FakeTacviewClient(port=port, track_objects=False)
+    if client.connect(timeout=10.0):
+        client.start()
+        client.thread.join(duration)
+    client.close()
+    conn.send((client.frames, len(client.objects), client.bytes_received))
+    conn.close()
+
+
 # 2. Task Allocation class
 class GameBasedTaskAllocation:
     """基于博弈的任务分配系统 - 解决负载平衡问题"""
@@ -1173,10 +2429,55 @@ def load_situation_data(situation_file):
     return attack_drones_data, defense_drones_data, initial_positions
 
 
-def execute_task_allocation(json_file):
-    """执行任务分配"""
+TASK_MODES = ('attack', 'defense', 'confrontation')
+
+
+def _allocate_for_mode(attack_drones_data, defense_drones_data, task_mode):
+    """在独立的分配器实例上执行一种任务模式的分配（供进程池调用）"""
+    allocator = GameBasedTaskAllocation(attack_drones_data, defense_drones_data)
+    return allocator.execute_task_allocation(task_mode)
+
+
+def precompute_mode_allocations(attack_drones_data, defense_drones_data, modes=TASK_MODES, pool_threshold=0.5):
+    """计算所有任务模式的分配结果
+
+    先在当前进程中计算第一种模式并计时：单次分配不超过 pool_threshold 秒时其余模式也顺序计算
+    （几毫秒的分配不值得启动进程池），否则其余模式在进程池中并行计算，进程池不可用时顺序计算。
+
+    Returns:
+        dict: task_mode -> 分配结果
+    """
+    first_start = time.perf_counter()
+    results = {modes[0]: _allocate_for_mode(attack_drones_data, defense_drones_data, modes[0])}
+    rest = modes[1:]
+    if not rest:
+        return results
+    if time.perf_counter() - first_start > pool_threshold:
+        try:
+            with ProcessPoolExecutor(max_workers=len(rest)) as pool:
+                futures = {mode: pool.submit(_allocate_for_mode, attack_drones_data, defense_drones_data, mode)
+                           for mode in rest}
+                results.update((mode, future.result()) for mode, future in futures.items())
+            return results
+        except Exception as e:
+            print(f"【警告】并行预计算任务模式失败，改为顺序计算: {e}", flush=True)
+    for mode in rest:
+        results[mode] = _allocate_for_mode(attack_drones_data, defense_drones_data, mode)
+    return results
+
+
+def execute_task_allocation(json_file, timings=None, precompute_modes=False):
+    """执行任务分配
+
+    Args:
+        timings: 可选的启动计时字典，写入 'load' 和 'allocate' 耗时（秒）
+        precompute_modes: 为True时在启动时计算全部三种任务模式，结果放在 'mode_allocations' 中；
+            为False（默认）时只计算当前模式，推演中切换到其他模式时再按需计算（见 DroneSimulation.switch_task_mode）
+    """
+    load_start = time.perf_counter()
     # 从JSON文件加载数据
     attack_drones_data, defense_drones_data, initial_positions = load_situation_data(json_file)
+    allocate_start = time.perf_counter()
     
     # 检查是否存在控制文件并读取任务模式
     task_mode = "attack"  # 默认为攻击模式
@@ -1189,26 +2490,1020 @@ def execute_task_allocation(json_file):
     except Exception as e:
         print(f"读取控制文件失败，使用默认任务模式: {e}", flush=True)
     
-    # 创建任务分配系统
-    allocator = GameBasedTaskAllocation(attack_drones_data, defense_drones_data)
-    
-    # 根据任务模式选择不同的策略
-    allocation_result = allocator.execute_task_allocation(task_mode)
+    if precompute_modes:
+        modes = (task_mode,) + tuple(mode for mode in TASK_MODES if mode != task_mode)
+        mode_results = precompute_mode_allocations(attack_drones_data, defense_drones_data, modes)
+        allocation_result = mode_results[task_mode]
+        allocation_result['mode_allocations'] = {
+            mode: {'task_groups': result['task_groups'], 'allocation_metadata': result['allocation_metadata']}
+            for mode, result in mode_results.items()
+        }
+        print(f"已预计算任务模式: {', '.join(mode_results)}", flush=True)
+    else:
+        # 创建任务分配系统
+        allocator = GameBasedTaskAllocation(attack_drones_data, defense_drones_data)
+        
+        # 根据任务模式选择不同的策略
+        allocation_result = allocator.execute_task_allocation(task_mode)
     
     # 添加初始位置信息到结果中
     allocation_result['initial_positions'] = initial_positions
     allocation_result['task_mode'] = task_mode  # 在结果中也记录任务模式
     
+    if timings is not None:
+        timings['load'] = allocate_start - load_start
+        timings['allocate'] = time.perf_counter() - allocate_start
+    
     return allocation_result
 
 
-# 4. Simulation class
+def _allocation_columns(allocation_result):
+    """把逐架无人机的属性、评分和初始位置整理为列式数组（顺序同 drone_attributes）"""
+    attrs = allocation_result['drone_attributes']
+    shapley = allocation_result.get('shapley_values', {})
+    initial = allocation_result.get('initial_positions', {})
+    ids = list(attrs)
+    columns = {
+        'id': ids,
+        'type': [initial.get(d, {}).get('type', 'attack' if d.startswith('A') else 'defense') for d in ids],
+        'mobility': [attrs[d]['mobility'] for d in ids],
+        'power': [attrs[d]['power'] for d in ids],
+        'distance_to_target': [attrs[d]['distance_to_target'] for d in ids],
+        'shapley_value': [shapley.get(d, 0.0) for d in ids],
+    }
+    for axis, name in enumerate(('x', 'y', 'z')):
+        columns[name] = [initial[d]['position'][axis] if d in initial else 0.0 for d in ids]
+    for axis, name in enumerate(('vx', 'vy', 'vz')):
+        columns[name] = [initial[d]['velocity'][axis] if d in initial else 0.0 for d in ids]
+    return columns
+
+
+def write_allocation_output(allocation_result, path='task_allocation_output.json', pretty=False, sidecar=False):
+    """写出任务分配结果
+
+    Args:
+        pretty: True 时写出原来的缩进JSON；否则写紧凑列式JSON（逐架属性按列存放：
+            列数组先在内存中整理完整，再逐个任务组、逐列写出）
+        sidecar: 同时写出二进制列式文件（与 path 同名的 .npz）
+
+    Returns:
+        dict: 写出耗时（秒）、文件大小（字节）及二进制文件信息
+    """
+    start = time.perf_counter()
+    columns = None
+    if pretty:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(allocation_result, f, indent=2, ensure_ascii=False)
+    else:
+        compact = {'separators': (',', ':'), 'ensure_ascii': False}
+        columns = _allocation_columns(allocation_result)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{"format":"columnar-v1"')
+            f.write(',"task_mode":' + json.dumps(allocation_result.get('task_mode'), **compact))
+            f.write(',"allocation_metadata":' + json.dumps(allocation_result.get('allocation_metadata', {}), **compact))
+            f.write(',"task_groups":[')
+            for k, group in enumerate(allocation_result['task_groups']):
+                f.write((',' if k else '') + '\n' + json.dumps(group, **compact))
+            f.write('\n]')
+            if 'mode_allocations' in allocation_result:
+                f.write(',"mode_allocations":' + json.dumps(allocation_result['mode_allocations'], **compact))
+            f.write(',"drones":{')
+            for k, (name, values) in enumerate(columns.items()):
+                f.write((',' if k else '') + '\n' + json.dumps(name) + ':' + json.dumps(values, **compact))
+            f.write('\n}}\n')
+    stats = {'path': path, 'format': 'pretty' if pretty else 'compact',
+             'seconds': time.perf_counter() - start, 'bytes': os.path.getsize(path)}
+
+    if sidecar:
+        sidecar_start = time.perf_counter()
+        sidecar_path = os.path.splitext(path)[0] + '.npz'
+        if columns is None:
+            columns = _allocation_columns(allocation_result)
+        groups = allocation_result['task_groups']
+        index = {drone_id: k for k, drone_id in enumerate(columns['id'])}
+        members = [index[d] for g in groups for d in g['defense_drones'] + g['attack_drones']]
+        sizes = [len(g['defense_drones']) + len(g['attack_drones']) for g in groups]
+        with open(sidecar_path, 'wb') as f:
+            np.savez(
+                f,
+                id=np.array(columns['id'], dtype=np.str_),
+                is_attack=np.array([t == 'attack' for t in columns['type']], dtype=bool),
+                **{name: np.array(columns[name], dtype=np.float64)
+                   for name in ('mobility', 'power', 'distance_to_target', 'shapley_value',
+                                'x', 'y', 'z', 'vx', 'vy', 'vz')},
+                group_id=np.array([g['group_id'] for g in groups], dtype=np.int64),
+                group_offsets=np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+                group_members=np.array(members, dtype=np.int64)
+            )
+        stats['sidecar_path'] = sidecar_path
+        stats['sidecar_bytes'] = os.path.getsize(sidecar_path)
+        stats['sidecar_seconds'] = time.perf_counter() - sidecar_start
+    return stats
+
+
+def load_allocation_output(path='task_allocation_output.json'):
+    """读取任务分配结果（兼容缩进JSON和紧凑列式JSON），返回原有的字典结构"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('format') != 'columnar-v1':
+        return data
+
+    columns = data['drones']
+    result = {
+        'task_groups': data['task_groups'],
+        'shapley_values': {},
+        'drone_attributes': {},
+        'allocation_metadata': data['allocation_metadata'],
+        'initial_positions': {},
+        'task_mode': data['task_mode']
+    }
+    if 'mode_allocations' in data:
+        result['mode_allocations'] = data['mode_allocations']
+    for k, drone_id in enumerate(columns['id']):
+        result['shapley_values'][drone_id] = columns['shapley_value'][k]
+        result['drone_attributes'][drone_id] = {
+            'mobility': columns['mobility'][k],
+            'power': columns['power'][k],
+            'distance_to_target': columns['distance_to_target'][k]
+        }
+        result['initial_positions'][drone_id] = {
+            'position': [columns['x'][k], columns['y'][k], columns['z'][k]],
+            'velocity': [columns['vx'][k], columns['vy'][k], columns['vz'][k]],
+            'type': columns['type'][k]
+        }
+    return result
+
+
+def print_startup_report(timings):
+    """打印启动耗时分解（导入、加载、分配、首帧）"""
+    labels = (('import', '模块导入'), ('load', '态势加载'), ('allocate', '任务分配'),
+              ('save', '结果保存'), ('first_frame', '仿真创建到首帧完成'))
+    total = sum(timings.get(key, 0.0) for key, _ in labels)
+    print('\n' + '-' * 70)
+    print('【启动耗时】')
+    for key, label in labels:
+        if key in timings:
+            print(f'  {label}: {timings[key] * 1000:.1f} 毫秒')
+    print(f'  合计: {total * 1000:.1f} 毫秒')
+    print('-' * 70 + '\n', flush=True)
+
+
+# 4. Simulation class
+class SpatialHash:
+    """均匀网格空间哈希
+
+    网格覆盖整个仿真区域，每步用 NumPy 排序重建；邻居查询只检查周围若干格，
+    在密度有界时总代价与无人机数量接近线性（避免 O(N²) 两两比较）。
+    可选的 partition（如分组编号）把不同分区的点放进互不相交的网格，
+    查询只返回同一分区内的点对，分区重叠时也不会枚举跨分区的候选点。
+    """
+
+    def __init__(self, area_size, cell_size):
+        self.cell_size = float(cell_size)
+        self.cells_per_axis = max(1, int(math.ceil(area_size / self.cell_size)))
+        self.order = np.zeros(0, dtype=np.intp)  # 按网格键排序后的点索引
+        self.sorted_keys = np.zeros(0, dtype=np.int64)
+        self.cell_x = np.zeros(0, dtype=np.int64)
+        self.cell_y = np.zeros(0, dtype=np.int64)
+        self.partition = np.zeros(0, dtype=np.int64)
+
+    def _cell_key(self, partition, cell_x, cell_y):
+        n = self.cells_per_axis
+        return (partition * n + cell_y) * n + cell_x
+
+    def build(self, x, y, partition=None):
+        """根据当前位置重建网格"""
+        n = self.cells_per_axis
+        self.cell_x = np.clip((x / self.cell_size).astype(np.int64), 0, n - 1)
+        self.cell_y = np.clip((y / self.cell_size).astype(np.int64), 0, n - 1)
+        self.partition = (np.zeros(len(x), dtype=np.int64) if partition is None
+                          else np.asarray(partition, dtype=np.int64))
+        keys = self._cell_key(self.partition, self.cell_x, self.cell_y)
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def query_pairs(self, x, y, radius):
+        """邻居查询：返回距离小于 radius 的点对 (i, j, dx, dy, dist)，每对正反各出现一次"""
+        n = self.cells_per_axis
+        rings = int(math.ceil(radius / self.cell_size))
+        pairs_i = []
+        pairs_j = []
+        for dy in range(-rings, rings + 1):
+            for dx in range(-rings, rings + 1):
+                ncx = self.cell_x + dx
+                ncy = self.cell_y + dy
+                src = np.nonzero((ncx >= 0) & (ncx < n) & (ncy >= 0) & (ncy < n))[0]
+                if len(src) == 0:
+                    continue
+                key = self._cell_key(self.partition[src], ncx[src], ncy[src])
+                start = np.searchsorted(self.sorted_keys, key, side='left')
+                count = np.searchsorted(self.sorted_keys, key, side='right') - start
+                total = int(count.sum())
+                if total == 0:
+                    continue
+                # 展开每个点与相邻格内所有点的组合
+                offsets = np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+                pairs_i.append(np.repeat(src, count))
+                pairs_j.append(self.order[np.repeat(start, count) + offsets])
+
+        if not pairs_i:
+            empty = np.zeros(0)
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), empty, empty, empty
+        i = np.concatenate(pairs_i)
+        j = np.concatenate(pairs_j)
+        dx = x[i] - x[j]
+        dy = y[i] - y[j]
+        dist = np.sqrt(dx ** 2 + dy ** 2)
+        keep = (i != j) & (dist < radius)
+        return i[keep], j[keep], dx[keep], dy[keep], dist[keep]
+
+
+def separation_steering(x, y, group_index, area_size, params):
+    """组内分离转向：对半径内的同组邻居施加与距离成反比的排斥向量
+
+    只考虑同组邻居，因此与多进程分片（按分组切分）的结果一致。
+    """
+    n = len(x)
+    radius = params.separation_radius
+    spatial_hash = SpatialHash(area_size, params.separation_cell_size or radius)
+    spatial_hash.build(x, y, partition=group_index)
+    i, j, dx, dy, dist = spatial_hash.query_pairs(x, y, radius)
+
+    keep = dist > 0
+    i, dx, dy, dist = i[keep], dx[keep], dy[keep], dist[keep]
+    strength = (1.0 - dist / radius) / dist
+    sep_x = np.bincount(i, weights=dx * strength, minlength=n)
+    sep_y = np.bincount(i, weights=dy * strength, minlength=n)
+    return sep_x, sep_y
+
+
+def physics_step_arrays(state, group_index, n_groups, speed_factor, target_area, area_size, params,
+                        sleep_state=None, check_sleep=True):
+    """向量化物理步进：原地更新状态矩阵 state (STATE_SIZE, n)
+
+    Args:
+        state: 状态矩阵视图（可以是共享内存上的切片）
+        group_index: 每架无人机所属分组的局部编号 (0..n_groups-1)
+        n_groups: 分组数量
+        speed_factor: 期望速度系数（攻击型0.8，防御型0.6）
+        target_area: 目标区域中心 (x, y)
+        area_size: 仿真区域边长
+        params: FlightParams 飞行动力学参数
+        sleep_state: 可选的休眠状态矩阵 (SLEEP_SIZE, n)，params.settle_radius > 0 时原地更新；
+            已到达目标且处于编队中的无人机转为休眠，在原地悬停，不再积分也不参与组内分离
+            （活动实体之间仍然分离，但不会避让休眠实体）
+        check_sleep: 本步是否做休眠/唤醒判断（为 False 时沿用 sleep_state 中的休眠标志）
+    """
+    if state.shape[1] == 0:
+        return
+    x, y = state[STATE_X], state[STATE_Y]
+
+    # 分组中心（各组成员位置的平均值，包含休眠成员）
+    counts = np.maximum(np.bincount(group_index, minlength=n_groups), 1)
+    gx = np.bincount(group_index, weights=x, minlength=n_groups) / counts
+    gy = np.bincount(group_index, weights=y, minlength=n_groups) / counts
+
+    if sleep_state is None or params.settle_radius <= 0:
+        _steer_and_integrate(state, group_index, gx, gy, speed_factor, target_area, area_size, params)
+        return
+
+    if check_sleep:
+        settled, settle = _update_sleep_state(x, y, gx[group_index], gy[group_index], sleep_state, target_area, params)
+        if settle.any():
+            _hold_settled(state, np.flatnonzero(settle))
+    else:
+        settled = sleep_state[SLEEP_FLAG] > 0
+    if not settled.any():
+        _steer_and_integrate(state, group_index, gx, gy, speed_factor, target_area, area_size, params)
+        return
+    active = np.flatnonzero(~settled)
+    if len(active):
+        active_state = np.take(state, active, axis=1)
+        _steer_and_integrate(active_state, group_index[active], gx, gy, speed_factor[active],
+                             target_area, area_size, params)
+        state[:, active] = active_state
+
+
+def _update_sleep_state(x, y, member_gx, member_gy, sleep_state, target_area, params):
+    """按滞回规则更新休眠标志，返回 (本步休眠的掩码, 本步新进入休眠的掩码)
+
+    进入休眠：目标距离 < settle_radius 且与分组中心的距离不超过编队半径（编队转向不起作用）；
+    唤醒：目标距离 > wake_radius、分组中心相对休眠时移动超过 settle_wake_shift，或目标位置改变。
+    """
+    settled = sleep_state[SLEEP_FLAG] > 0
+    # 只比较距离的平方，省去开方
+    target_distance2 = (x - target_area[0]) ** 2 + (y - target_area[1]) ** 2
+    if settled.any():
+        shift2 = (member_gx - sleep_state[SLEEP_ANCHOR_X]) ** 2 + (member_gy - sleep_state[SLEEP_ANCHOR_Y]) ** 2
+        target_moved = (sleep_state[SLEEP_TARGET_X] != target_area[0]) | (sleep_state[SLEEP_TARGET_Y] != target_area[1])
+        wake = settled & ((target_distance2 > params.wake_radius ** 2)
+                          | (shift2 > params.settle_wake_shift ** 2) | target_moved)
+    else:
+        wake = settled
+    formation_distance2 = (member_gx - x) ** 2 + (member_gy - y) ** 2
+    settle = ~settled & (target_distance2 < params.settle_radius ** 2) & (formation_distance2 <= 25.0)
+
+    settled = (settled & ~wake) | settle
+    sleep_state[SLEEP_FLAG] = settled
+    if settle.any():
+        sleep_state[SLEEP_ANCHOR_X, settle] = member_gx[settle]
+        sleep_state[SLEEP_ANCHOR_Y, settle] = member_gy[settle]
+        sleep_state[SLEEP_TARGET_X, settle] = target_area[0]
+        sleep_state[SLEEP_TARGET_Y, settle] = target_area[1]
+    return settled, settle
+
+
+def _hold_settled(state, idx):
+    """刚进入休眠的实体原地悬停：速度、加速度和角速度清零，位置和航向保持不变
+
+    之后每步只做唤醒判断，状态列不再改变；唤醒后从静止重新加速。
+    """
+    for row in (STATE_VX, STATE_VY, STATE_AX, STATE_AY, STATE_ANGVEL):
+        state[row, idx] = 0.0
+
+
+def _steer_and_integrate(state, group_index, gx, gy, speed_factor, target_area, area_size, params):
+    """完整的转向、加速度和边界反弹更新（原地更新 state，gx/gy 为各分组中心）"""
+    x, y, vx, vy, ax, ay, heading, angvel = state
+    dt = params.dt
+
+    # 目标方向
+    target_dx = target_area[0] - x
+    target_dy = target_area[1] - y
+    target_distance = np.sqrt(target_dx ** 2 + target_dy ** 2)
+    target_direction = np.where(target_distance > 0.1,
+                                np.degrees(np.arctan2(target_dx, target_dy)), heading)
+
+    # 编队方向（只有距离编队中心较远时才考虑编队）
+    formation_weight = 0.3
+    formation_dx = gx[group_index] - x
+    formation_dy = gy[group_index] - y
+    formation_distance = np.sqrt(formation_dx ** 2 + formation_dy ** 2)
+    formation_direction = np.degrees(np.arctan2(formation_dx, formation_dy))
+    target_direction = np.where(formation_distance > 5.0,
+                                target_direction * (1 - formation_weight) + formation_direction * formation_weight,
+                                target_direction)
+
+    # 航向角变化（处理角度跨越问题）
+    heading_diff = target_direction - heading
+    heading_diff = np.where(heading_diff > 180, heading_diff - 360,
+                            np.where(heading_diff < -180, heading_diff + 360, heading_diff))
+
+    # 限制角速度
+    max_angular_accel = 60.0  # 最大角加速度 (度/秒²)
+    desired_angular_velocity = np.clip(heading_diff * 2.0, -params.max_angular_velocity, params.max_angular_velocity)
+    angular_accel = np.clip(desired_angular_velocity - angvel, -max_angular_accel, max_angular_accel)
+    new_angvel = np.clip(angvel + angular_accel * dt, -params.max_angular_velocity, params.max_angular_velocity)
+    new_heading = heading + new_angvel * dt
+    new_heading = np.where(new_heading < 0, new_heading + 360,
+                           np.where(new_heading >= 360, new_heading - 360, new_heading))
+
+    # 期望速度（接近目标时减速）
+    heading_rad = np.radians(new_heading)
+    desired_speed = params.max_speed * speed_factor * np.where(target_distance < 10, 0.5, 1.0)
+    accel_x = (desired_speed * np.sin(heading_rad) - vx) * 2.0
+    accel_y = (desired_speed * np.cos(heading_rad) - vy) * 2.0
+
+    # 组内分离（空间哈希邻居查询，避免同组无人机重叠）
+    if params.separation_radius > 0 and len(x) > 1:
+        sep_x, sep_y = separation_steering(x, y, group_index, area_size, params)
+        accel_x = accel_x + sep_x * params.separation_weight
+        accel_y = accel_y + sep_y * params.separation_weight
+
+    # 限制加速度
+    accel_magnitude = np.sqrt(accel_x ** 2 + accel_y ** 2)
+    accel_scale = params.max_acceleration / np.maximum(accel_magnitude, params.max_acceleration)
+    accel_x = accel_x * accel_scale
+    accel_y = accel_y * accel_scale
+
+    # 更新速度（考虑惯性）并限速
+    sf = params.smoothing_factor
+    new_vx = vx * sf + (vx + accel_x * dt) * (1 - sf)
+    new_vy = vy * sf + (vy + accel_y * dt) * (1 - sf)
+    speed = np.sqrt(new_vx ** 2 + new_vy ** 2)
+    speed_scale = params.max_speed / np.maximum(speed, params.max_speed)
+    new_vx = new_vx * speed_scale
+    new_vy = new_vy * speed_scale
+
+    # 更新位置，边界处理（反弹效果）
+    new_x = x + new_vx * dt
+    new_y = y + new_vy * dt
+    out_x = (new_x <= 0) | (new_x >= area_size)
+    out_y = (new_y <= 0) | (new_y >= area_size)
+    new_vx = np.where(out_x, -new_vx * 0.8, new_vx)
+    new_vy = np.where(out_y, -new_vy * 0.8, new_vy)
+
+    # 原地写回（共享内存模式下其他进程可直接看到）
+    x[:] = np.clip(new_x, 0, area_size)
+    y[:] = np.clip(new_y, 0, area_size)
+    vx[:] = new_vx
+    vy[:] = new_vy
+    ax[:] = accel_x
+    ay[:] = accel_y
+    heading[:] = new_heading
+    angvel[:] = new_angvel
+
+
+def intra_group_pairs(group_index, n_groups):
+    """列出已分组前缀中所有组内点对，返回 (pair_i, pair_j, pair_start)
+
+    点对按分组连续排列，第 g 组的点对位于 [pair_start[g], pair_start[g+1])。
+    """
+    starts = np.searchsorted(group_index, np.arange(n_groups + 1))
+    pair_i = []
+    pair_j = []
+    pair_count = np.zeros(n_groups, dtype=np.intp)
+    for g in range(n_groups):
+        size = int(starts[g + 1] - starts[g])
+        if size > 1:
+            a, b = np.triu_indices(size, k=1)
+            pair_i.append(a + starts[g])
+            pair_j.append(b + starts[g])
+            pair_count[g] = len(a)
+    pair_start = np.concatenate([[0], np.cumsum(pair_count)])
+    if not pair_i:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), pair_start
+    return np.concatenate(pair_i), np.concatenate(pair_j), pair_start
+
+
+def group_cohesion_arrays(x, y, pairs):
+    """向量化组内聚合度：各组成员两两之间的平均距离（成员不足2个的组为0）
+
+    x, y 可以带任意前导批量维度 (..., N)，返回 (..., n_groups)。
+    """
+    pair_i, pair_j, pair_start = pairs
+    dist = np.sqrt((x[..., pair_i] - x[..., pair_j]) ** 2 + (y[..., pair_i] - y[..., pair_j]) ** 2)
+    cumulative = np.concatenate([np.zeros(dist.shape[:-1] + (1,)), np.cumsum(dist, axis=-1)], axis=-1)
+    sums = cumulative[..., pair_start[1:]] - cumulative[..., pair_start[:-1]]
+    counts = np.diff(pair_start)
+    return np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+
+
+def _distribution_summary(values):
+    """分布统计：均值、标准差和分位数"""
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return {'mean': 0.0, 'std': 0.0, 'min': 0.0, 'p5': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    p5, p50, p95 = np.percentile(values, [5, 50, 95])
+    return {
+        'mean': float(values.mean()), 'std': float(values.std()), 'min': float(values.min()),
+        'p5': float(p5), 'p50': float(p50), 'p95': float(p95), 'max': float(values.max())
+    }
+
+
+def _partition_groups(group_index, n_groups, num_shards):
+    """按分组边界把状态数组切成若干连续分片，使各分片的无人机数量尽量均衡
+
+    group_index 必须按分组编号升序排列。返回 [(lo, hi, g_lo, g_hi), ...]
+    """
+    n = len(group_index)
+    starts = np.searchsorted(group_index, np.arange(n_groups + 1))
+    boundaries = [0]
+    for k in range(1, num_shards):
+        g = int(np.searchsorted(starts, k * n / num_shards))
+        g = min(max(g, boundaries[-1]), n_groups)
+        boundaries.append(g)
+    boundaries.append(n_groups)
+
+    shards = []
+    for g_lo, g_hi in zip(boundaries[:-1], boundaries[1:]):
+        lo, hi = int(starts[g_lo]), int(starts[g_hi])
+        if hi > lo:
+            shards.append((lo, hi, g_lo, g_hi))
+    return shards
+
+
+def _shard_worker(shm_name, shape, lo, hi, group_index, n_groups, speed_factor,
+                  target_area, area_size, params, barrier, stop_event, sleep_shm_name=None, sleep_columns=0,
+                  sim_step=None):
+    """分片工作进程：每步在两次栅栏之间更新共享状态矩阵（及休眠状态）的 [lo, hi) 列
+
+    sim_step 为主进程每步写入的共享步数，休眠判断与单进程一样按 sim_step 取模，结果逐位一致。
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    sleep_shm = shared_memory.SharedMemory(name=sleep_shm_name) if sleep_shm_name else None
+    try:
+        state = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        local_state = state[:, lo:hi]
+        local_sleep = None
+        if sleep_shm is not None:
+            sleep_state = np.ndarray((SLEEP_SIZE, sleep_columns), dtype=np.float64, buffer=sleep_shm.buf)
+            local_sleep = sleep_state[:, lo:hi]
+        while True:
+            barrier.wait()  # 等待主进程发起本步
+            if stop_event.is_set():
+                break
+            step = sim_step.value if sim_step is not None else 0
+            physics_step_arrays(local_state, group_index, n_groups, speed_factor, target_area, area_size,
+                                params, local_sleep, check_sleep=step % params.settle_check_interval == 0)
+            barrier.wait()  # 通知主进程本步完成
+        del local_state, state, local_sleep
+        if sleep_shm is not None:
+            del sleep_state
+    finally:
+        shm.close()
+        if sleep_shm is not None:
+            sleep_shm.close()
+
+
+class ShardedPhysics:
+    """多进程分片物理计算
+
+    任务分组之间只通过各自的分组中心相互作用，因此按分组把状态数组切成连续分片，
+    每个工作进程在 multiprocessing.shared_memory 上原地更新自己的分片，主进程
+    通过每步两次栅栏同步。Tacview与态势广播直接读取共享状态矩阵 self.state。
+    """
+
+    def __init__(self, state, group_index, n_groups, speed_factor, target_area, area_size,
+                 params, num_workers, barrier_timeout=30.0, sleep_state=None):
+        self.barrier_timeout = barrier_timeout
+        self.shm = shared_memory.SharedMemory(create=True, size=max(state.nbytes, 1))
+        self.state = np.ndarray(state.shape, dtype=np.float64, buffer=self.shm.buf)
+        self.state[:] = state
+
+        # 休眠状态（已分组前缀的列）同样放在共享内存中，由各工作进程更新自己的分片
+        self.sleep_shm = None
+        self.sleep_state = None
+        if sleep_state is not None:
+            self.sleep_shm = shared_memory.SharedMemory(create=True, size=max(sleep_state.nbytes, 1))
+            self.sleep_state = np.ndarray(sleep_state.shape, dtype=np.float64, buffer=self.sleep_shm.buf)
+            self.sleep_state[:] = sleep_state
+
+        # 只对已分组的前缀做分片（未分组的无人机位于数组末尾，不参与物理更新）
+        n_grouped = len(group_index)
+        self.shards = _partition_groups(group_index, n_groups, num_workers) if n_grouped else []
+
+        ctx = mp.get_context()
+        self.barrier = ctx.Barrier(len(self.shards) + 1)
+        self.stop_event = ctx.Event()
+        self.sim_step = ctx.Value('q', 0, lock=False)  # 本步的仿真步数（休眠判断的节拍）
+        self.workers = []
+        for lo, hi, g_lo, g_hi in self.shards:
+            worker = ctx.Process(
+                target=_shard_worker,
+                args=(self.shm.name, state.shape, lo, hi, group_index[lo:hi] - g_lo, g_hi - g_lo,
+                      speed_factor[lo:hi], tuple(target_area), area_size, params,
+                      self.barrier, self.stop_event,
+                      self.sleep_shm.name if self.sleep_shm else None,
+                      sleep_state.shape[1] if sleep_state is not None else 0, self.sim_step),
+                daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+
+        print(f"  多进程分片物理: {len(self.workers)} 个工作进程, 分片大小: "
+              f"{[hi - lo for lo, hi, _, _ in self.shards]}", flush=True)
+
+    def step(self, sim_step=0):
+        """执行一步：写入本步的仿真步数，释放所有工作进程并等待它们完成"""
+        self.sim_step.value = sim_step
+        self.barrier.wait(self.barrier_timeout)
+        self.barrier.wait(self.barrier_timeout)
+
+    def close(self):
+        """停止工作进程并释放共享内存，返回最终状态的私有副本（休眠状态副本留在 self.sleep_state）"""
+        final_state = self.state.copy()
+        self.stop_event.set()
+        try:
+            self.barrier.wait(self.barrier_timeout)
+        except Exception:
+            pass
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self.state = None
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception:
+            pass
+        if self.sleep_shm is not None:
+            self.sleep_state = self.sleep_state.copy()
+            try:
+                self.sleep_shm.close()
+                self.sleep_shm.unlink()
+            except Exception:
+                pass
+            self.sleep_shm = None
+        return final_state
+
+
+@dataclass
+class StateFrame:
+    """已发布的一帧状态（只读视图，列顺序由 registry.columns 给出）"""
+    step: int
+    sim_time: float
+    data: np.ndarray
+    registry: 'EntityRegistry'
+    buffer: int
+    sequence: int
+    sequences: list
+
+    def valid(self):
+        """读者读完后校验：所在缓冲区尚未被下一次发布改写时为 True"""
+        return self.sequences[self.buffer] == self.sequence
+
+
+class FrameBuffer:
+    """双缓冲的每帧状态快照（单写者、多读者、无锁）
+
+    推演线程把状态复制进后台缓冲区后原子地替换 front 引用，读者拿到的帧在写者
+    再发布一帧之前不会被改写；读者复制出所需数据后用 StateFrame.valid() 做序号校验，
+    失效则改读最新帧。
+    """
+
+    def __init__(self):
+        self.buffers = [None, None]
+        self.sequences = [0, 0]  # 每个缓冲区的改写序号
+        self.front = None  # 最近发布的 StateFrame
+        self.published = 0
+        self.new_frame = Event()
+
+    def publish(self, step, sim_time, state, registry):
+        """发布一帧（推演线程调用）"""
+        k = self.published % 2
+        buffer = self.buffers[k]
+        if buffer is None or buffer.shape != state.shape:
+            buffer = self.buffers[k] = np.empty(state.shape)
+        self.sequences[k] += 1  # 先使仍持有该缓冲区旧帧的读者失效，再改写
+        np.copyto(buffer, state)
+        view = buffer.view()
+        view.flags.writeable = False
+        self.front = StateFrame(step, sim_time, view, registry, k, self.sequences[k], self.sequences)
+        self.published += 1
+        self.new_frame.set()
+
+    READ_ROWS = [STATE_X, STATE_Y, STATE_VX, STATE_VY, STATE_HEADING]
+
+    def read(self):
+        """按注册表顺序复制最新帧的 (x, y, vx, vy, heading) 数组 (5, N)，返回 (frame, values)"""
+        while True:
+            frame = self.front
+            if frame is None:
+                return None, None
+            values = frame.data[self.READ_ROWS][:, frame.registry.columns]
+            if frame.valid():
+                return frame, values
+
+
+class StageQueue:
+    """流水线阶段之间的有界队列
+
+    背压策略：
+        block: 队列满时生产者等待
+        drop_oldest: 队列满时丢弃最旧的一项
+        coalesce: 只保留最新的一项（新项到达时丢弃所有未处理项）
+    """
+
+    POLICIES = ('block', 'drop_oldest', 'coalesce')
+
+    def __init__(self, maxsize=4, policy='block', on_drop=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的背压策略: {policy}（可选 {', '.join(self.POLICIES)}）")
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.items = deque()
+        self.condition = Condition()
+        self.closed = False
+        self.puts = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.depth_total = 0  # 每次放入后的队列深度之和（用于平均深度）
+        self.blocked_time = 0.0  # block 策略下生产者的累计等待时间
+        self.on_drop = on_drop  # 丢弃某项时的回调（在生产者线程中调用）
+
+    def put(self, item):
+        """放入一项（按背压策略处理队列满的情况）"""
+        with self.condition:
+            if self.policy == 'coalesce':
+                self.dropped += len(self.items)
+                if self.on_drop:
+                    for dropped in self.items:
+                        self.on_drop(dropped)
+                self.items.clear()
+            elif len(self.items) >= self.maxsize:
+                if self.policy == 'drop_oldest':
+                    dropped = self.items.popleft()
+                    self.dropped += 1
+                    if self.on_drop:
+                        self.on_drop(dropped)
+                else:
+                    wait_start = time.perf_counter()
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self.condition.wait()
+                    self.blocked_time += time.perf_counter() - wait_start
+            self.items.append(item)
+            self.puts += 1
+            depth = len(self.items)
+            self.depth_total += depth
+            if depth > self.max_depth:
+                self.max_depth = depth
+            self.condition.notify_all()
+
+    def get(self):
+        """取出一项；队列关闭且已取空时返回 None"""
+        with self.condition:
+            while not self.items and not self.closed:
+                self.condition.wait()
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        """关闭队列（已放入的项仍会被取出）"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'maxsize': self.maxsize,
+            'puts': self.puts,
+            'dropped': self.dropped,
+            'max_depth': self.max_depth,
+            'avg_depth': self.depth_total / self.puts if self.puts else 0.0,
+            'blocked_time': self.blocked_time
+        }
+
+
+class OutputPipeline:
+    """输出流水线：推演线程作为源阶段，其余阶段各自一个工作线程，阶段之间用有界队列连接
+
+    Args:
+        stages: [(name, func), ...]，func 接收上一阶段的输出，返回交给下一阶段的项（None 表示不再传递）
+        queue_size: 每个队列的容量
+        policy: 背压策略（见 StageQueue）
+        source_name: 源阶段名称（submit 时记录其耗时）
+        on_drop: 可选的 {阶段名称: 回调}，该阶段的入口队列丢弃某项时调用（见 StageQueue）
+    """
+
+    def __init__(self, stages, queue_size=4, policy='block', source_name='physics', on_drop=None):
+        on_drop = on_drop or {}
+        self.queues = [StageQueue(queue_size, policy, on_drop=on_drop.get(name)) for name, _ in stages]
+        self.names = [source_name] + [name for name, _ in stages]
+        self.items = [0] * len(self.names)
+        self.busy = [0.0] * len(self.names)
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.threads = []
+        for k, (name, func) in enumerate(stages):
+            outbox = self.queues[k + 1] if k + 1 < len(stages) else None
+            thread = Thread(target=self._stage_loop, args=(k + 1, func, self.queues[k], outbox),
+                            name=f'pipeline-{name}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _stage_loop(self, index, func, inbox, outbox):
+        """阶段工作线程"""
+        while True:
+            item = inbox.get()
+            if item is None:
+                break
+            start = time.perf_counter()
+            try:
+                result = func(item)
+            except Exception as e:
+                print(f"【警告】流水线阶段 {self.names[index]} 异常: {e}")
+                result = None
+            self.busy[index] += time.perf_counter() - start
+            self.items[index] += 1
+            if outbox is not None and result is not None:
+                outbox.put(result)
+        if outbox is not None:
+            outbox.close()
+
+    def submit(self, item, source_seconds=0.0):
+        """源阶段提交一项，source_seconds 为源阶段生成该项的耗时"""
+        self.items[0] += 1
+        self.busy[0] += source_seconds
+        self.queues[0].put(item)
+
+    def close(self):
+        """关闭流水线，等待所有阶段处理完已提交的项"""
+        self.queues[0].close()
+        for thread in self.threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def stats(self):
+        """各阶段的吞吐量、繁忙度和入口队列深度"""
+        elapsed = self.elapsed or (time.perf_counter() - self.started)
+        stages = []
+        for k, name in enumerate(self.names):
+            stage = {
+                'name': name,
+                'items': self.items[k],
+                'busy_time': self.busy[k],
+                'throughput': self.items[k] / elapsed if elapsed > 0 else 0.0,
+                'capacity': self.items[k] / self.busy[k] if self.busy[k] > 0 else float('inf'),
+                'utilization': self.busy[k] / elapsed if elapsed > 0 else 0.0
+            }
+            if k > 0:
+                stage['queue'] = self.queues[k - 1].stats()
+            stages.append(stage)
+        # 瓶颈：单帧耗时最长（可持续帧率最低）的阶段
+        bottleneck = min(stages, key=lambda stage: stage['capacity'])['name'] if stages else None
+        return {'elapsed': elapsed, 'stages': stages, 'bottleneck': bottleneck}
+
+
+def print_pipeline_report(stats):
+    """打印输出流水线各阶段的吞吐量和队列深度"""
+    print('\n' + '=' * 70)
+    print('【输出流水线统计】')
+    for stage in stats['stages']:
+        line = (f"  {stage['name']}: {stage['items']} 帧, 吞吐 {stage['throughput']:.1f} 帧/秒, "
+                f"繁忙度 {stage['utilization'] * 100:.1f}%, 单帧 {stage['busy_time'] / max(stage['items'], 1) * 1000:.2f} 毫秒")
+        queue_stats = stage.get('queue')
+        if queue_stats:
+            line += (f" | 入口队列({queue_stats['policy']}, 容量 {queue_stats['maxsize']}): "
+                     f"平均深度 {queue_stats['avg_depth']:.2f}, 最大 {queue_stats['max_depth']}, "
+                     f"丢弃 {queue_stats['dropped']}, 阻塞 {queue_stats['blocked_time'] * 1000:.1f} 毫秒")
+        print(line)
+    capacity = next(stage['capacity'] for stage in stats['stages'] if stage['name'] == stats['bottleneck'])
+    print(f"  瓶颈阶段: {stats['bottleneck']}（最高可持续 {capacity:.1f} 帧/秒）")
+    print('=' * 70 + '\n')
+
+
+class MetricSeries:
+    """推演过程中的性能指标时间序列（预分配缓冲区，记录时不分配内存）"""
+
+    def __init__(self, capacity, n_groups):
+        self.count = 0
+        self.steps = np.zeros(capacity, dtype=np.int64)
+        self.times = np.zeros(capacity)
+        self.avg_distance_to_target = np.zeros(capacity)
+        self.group_cohesion = np.zeros((capacity, n_groups))
+
+    @property
+    def capacity(self):
+        return len(self.steps)
+
+    def reserve(self, capacity):
+        """确保至少还能记录 capacity 个采样点（在推演开始前调用）"""
+        needed = self.count + capacity
+        if needed <= self.capacity:
+            return
+        for name in ('steps', 'times', 'avg_distance_to_target', 'group_cohesion'):
+            old = getattr(self, name)
+            new = np.zeros((needed,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def append(self, step, sim_time, avg_distance, cohesion):
+        """记录一个采样点（缓冲区已满时丢弃）"""
+        if self.count >= self.capacity:
+            return
+        k = self.count
+        self.steps[k] = step
+        self.times[k] = sim_time
+        self.avg_distance_to_target[k] = avg_distance
+        self.group_cohesion[k] = cohesion
+        self.count += 1
+
+    def as_dict(self):
+        """已记录部分的视图"""
+        k = self.count
+        return {
+            'steps': self.steps[:k],
+            'times': self.times[:k],
+            'avg_distance_to_target': self.avg_distance_to_target[:k],
+            'group_cohesion': self.group_cohesion[:k]
+        }
+
+
+class TrajectoryRecorder:
+    """逐步轨迹记录器（预分配环形缓冲区，内存固定）
+
+    每步把所有无人机的位置、速度、航向和角速度复制进 float32 环形缓冲区；缓冲区按块划分，
+    写满的块交给后台线程压缩保存为 chunk_XXXXX.npz，推演循环中不分配内存。
+    """
+
+    FIELDS = ('x', 'y', 'vx', 'vy', 'heading', 'angular_velocity')
+
+    def __init__(self, output_dir, drone_order, chunk_frames=256, num_chunks=4, interval=1):
+        self.output_dir = output_dir
+        self.chunk_frames = chunk_frames
+        self.num_chunks = num_chunks
+        self.interval = max(1, interval)
+        self.drone_order = list(drone_order)
+        self.columns = None  # 状态矩阵列顺序改变后（任务模式切换）按记录开始时的无人机顺序取列
+        self._gathered = None  # 按 columns 取列的预分配暂存区 (STATE_SIZE, n)
+        n = len(drone_order)
+        capacity = chunk_frames * num_chunks
+        self.frames = np.zeros((capacity, len(self.FIELDS), n), dtype=np.float32)
+        self.steps = np.zeros(capacity, dtype=np.int64)
+        self.times = np.zeros(capacity)
+        self.cursor = 0  # 环形缓冲区中下一帧的位置
+        self.chunk_fill = 0  # 当前块已写入的帧数
+        self.chunks_written = 0
+        self.frames_recorded = 0
+        self.stall_time = 0.0  # 等待后台写盘的累计时间
+
+        # 每块一个"空闲"事件：后台线程写完后置位，记录器回绕到该块前等待
+        self.chunk_free = [Event() for _ in range(num_chunks)]
+        for event in self.chunk_free:
+            event.set()
+
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'drone_order': list(drone_order), 'fields': list(self.FIELDS),
+                       'interval': self.interval, 'chunk_frames': chunk_frames}, f, ensure_ascii=False)
+
+        self.write_queue = queue.Queue()
+        self.writer_thread = Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def record(self, step, sim_time, state):
+        """记录一帧（每 interval 步一次）"""
+        if step % self.interval:
+            return
+        chunk = self.cursor // self.chunk_frames
+        if self.chunk_fill == 0 and not self.chunk_free[chunk].is_set():
+            wait_start = time.time()
+            self.chunk_free[chunk].wait()
+            self.stall_time += time.time() - wait_start
+
+        if self.columns is not None:
+            # 取列到预分配的 float64 暂存区（同类型、mode='clip' 时 np.take 不建临时缓冲区）
+            if self._gathered is None or self._gathered.shape != (state.shape[0], len(self.columns)):
+                self._gathered = np.empty((state.shape[0], len(self.columns)))
+            state = np.take(state, self.columns, axis=1, out=self._gathered, mode='clip')
+        k = self.cursor
+        self.frames[k, 0:4] = state[STATE_X:STATE_VY + 1]
+        self.frames[k, 4:6] = state[STATE_HEADING:STATE_ANGVEL + 1]
+        self.steps[k] = step
+        self.times[k] = sim_time
+        self.frames_recorded += 1
+        self.cursor = (k + 1) % len(self.steps)
+        self.chunk_fill += 1
+        if self.chunk_fill == self.chunk_frames:
+            self._submit(chunk, self.chunk_fill)
+
+    def _submit(self, chunk, count):
+        """把写满（或最后未满）的块交给后台线程"""
+        self.chunk_free[chunk].clear()
+        self.write_queue.put((chunk, count, self.chunks_written))
+        self.chunks_written += 1
+        self.chunk_fill = 0
+
+    def _writer_loop(self):
+        """后台写盘线程"""
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                break
+            chunk, count, sequence = item
+            lo = chunk * self.chunk_frames
+            hi = lo + count
+            try:
+                np.savez_compressed(os.path.join(self.output_dir, f'chunk_{sequence:05d}.npz'),
+                                    steps=self.steps[lo:hi], times=self.times[lo:hi], frames=self.frames[lo:hi])
+            except Exception as e:
+                print(f"【警告】轨迹块写入失败: {e}")
+            finally:
+                self.chunk_free[chunk].set()
+
+    def close(self):
+        """写出剩余帧并等待后台线程结束"""
+        if self.chunk_fill:
+            chunk = (self.cursor - 1) % len(self.steps) // self.chunk_frames
+            self._submit(chunk, self.chunk_fill)
+        self.write_queue.put(None)
+        self.writer_thread.join()
+        print(f"轨迹记录已保存: {self.output_dir} ({self.frames_recorded} 帧, {self.chunks_written} 个块, "
+              f"等待写盘 {self.stall_time * 1000:.1f} 毫秒)")
+
+
+def load_trajectory(output_dir):
+    """读取 TrajectoryRecorder 输出目录，返回 (meta, steps, times, frames)"""
+    with open(os.path.join(output_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    names = sorted(name for name in os.listdir(output_dir) if name.startswith('chunk_') and name.endswith('.npz'))
+    steps, times, frames = [], [], []
+    for name in names:
+        with np.load(os.path.join(output_dir, name)) as data:
+            steps.append(data['steps'])
+            times.append(data['times'])
+            frames.append(data['frames'])
+    if not names:
+        n = len(meta['drone_order'])
+        return meta, np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros((0, len(meta['fields']), n), dtype=np.float32)
+    return meta, np.concatenate(steps), np.concatenate(times), np.concatenate(frames)
+
+
 class DroneSimulation:
     """Simulates drone movements and streams to Tacview"""
 
     def __init__(self, allocation_result, target_area=(80, 80), area_size=100, 
                  enable_status_broadcast=True, status_broadcast_port=10114,
-                 control_file_path='simulation_control.json'):
+                 control_file_path='simulation_control.json', physics_workers=0,
+                 enable_tacview=True, seed=None, control_port=0, async_output=False,
+                 output_pipeline=None, pipeline_queue_size=4, tacview_send_policy='drop_oldest',
+                 tacview_queue_size=8, acmi_recorder=None):
         self.allocation_result = allocation_result
         self.target_area = target_area
         self.area_size = area_size
@@ -1218,12 +3513,71 @@ class DroneSimulation:
         self.drone_headings = {}  # 航向角
         self.drone_angular_velocities = {}  # 角速度
         
+        # 状态数组（推演过程中的权威数据，字典在推演结束后同步）
+        self.state = np.zeros((STATE_SIZE, 0))
+        self.drone_order = []  # 数组列顺序：按任务分组连续排列，未分组的在末尾
+        self.drone_index = {}  # drone_id -> 列索引
+        self.group_index = np.zeros(0, dtype=np.intp)  # 已分组前缀中每列所属分组编号
+        self.n_groups = 0
+        self.n_grouped = 0  # 已分组的无人机数量（状态矩阵前缀）
+        self.speed_factor = np.zeros(0)
+        self.registry = None  # EntityRegistry：整数索引、数字对象ID、阵营标志和稳定顺序
+        
         # 飞行动力学参数
         self.max_speed = 15.0  # 最大速度 (km/h 转换为仿真单位)
         self.max_acceleration = 8.0  # 最大加速度
         self.max_angular_velocity = 45.0  # 最大角速度 (度/秒)
         self.smoothing_factor = 0.15  # 平滑因子 (0-1, 越小越平滑)
         
+        # 组内分离参数（空间哈希邻居查询）
+        self.separation_radius = 2.0  # 分离半径 (km)，0 表示关闭
+        self.separation_weight = 4.0  # 分离加速度权重
+        self.separation_cell_size = 0.0  # 空间哈希网格边长，0 表示等于分离半径
+        
+        # 休眠实体优化（到达目标并处于编队中的无人机原地悬停、不参与组内分离，滞回唤醒）
+        self.settle_radius = 0.0  # 进入休眠的目标距离 (km)，0 表示关闭（默认关闭，与完整动力学轨迹一致）
+        self.wake_radius = 12.0  # 唤醒的目标距离 (km)
+        self.settle_wake_shift = 3.0  # 分组中心移动超过该距离时唤醒 (km)
+        self.settle_check_interval = 10  # 每隔多少步做一次休眠/唤醒判断
+        self.sleep_state = np.zeros((SLEEP_SIZE, 0))
+        
+        # 随机数发生器、步数计数和仿真时钟（检查点的一部分）
+        self.rng = np.random.default_rng(seed)
+        self.display_rng = np.random.default_rng(None if seed is None else [seed, 1])  # 仅用于显示抖动（输出线程使用）
+        self.sim_step = 0  # 累计执行的物理步数
+        self.sim_time = 0.0  # Tacview时间戳（仿真时钟）
+        self.tacview_time_step = 0.01  # 匹配训练文件格式
+        
+        # 性能指标时间序列（每 metrics_interval 步采样一次，0 表示关闭）
+        self.metrics_interval = 10
+        self.metric_series = None
+        self._cohesion_pairs = None
+        
+        # 轨迹记录（可选）
+        self.trajectory_recorder = None
+        
+        # 每帧发布的双缓冲状态快照；async_output 为True时 Tacview 和态势广播在输出线程中读取快照
+        self.frame_buffer = FrameBuffer()
+        self.async_output = async_output
+        self.output_thread = None
+        self._output_stop = Event()
+        self._frames_emitted = 0
+        
+        # 输出流水线（物理 → 编码 → 发送，各阶段独立线程；output_pipeline 为背压策略，None 表示不启用）
+        self.output_pipeline = output_pipeline
+        self.pipeline_queue_size = pipeline_queue_size
+        self.pipeline = None
+        self.pipeline_stats = None
+        
+        # 时间倍率：高倍速时每个输出帧执行 K 个物理步，K 由倍速和实测的物理/输出耗时确定
+        self.max_warp_steps = 100  # 每帧最多物理步数，1 表示关闭
+        self._physics_cost = 0.0  # 单个物理步耗时的指数滑动平均（秒）
+        self._sink_cost = 0.0  # 推演线程上每帧输出耗时的指数滑动平均（秒）
+        
+        # 多进程分片物理（physics_workers > 1 时启用）
+        self.physics_workers = physics_workers
+        self.sharded_physics = None
+        
         # 态势广播设置
         self.enable_status_broadcast = enable_status_broadcast
         self.status_broadcast_port = status_broadcast_port
@@ -1231,31 +3585,55 @@ class DroneSimulation:
         
         # 推演控制参数
         self.control_file_path = control_file_path  # 使用传入的控制文件路径
+        self.situation_file = None  # 态势文件：切换到未预计算的任务模式时据此按需计算分配
         self.is_paused = False
         self.speed_multiplier = 1.0
         self.last_control_check_time = 0
-        self.control_check_interval = 0.5  # 每0.5秒检查一次控制文件
+        self.control_check_interval = 0.5  # 每0.5秒检查一次控制文件是否被修改
+        self.control_file_mtime = None
+        
+        # 事件驱动的本地控制端口（UDP，JSON消息），控制文件作为后备
+        self.control_port = control_port
+        self.control_socket = None
         
         print(f"  控制文件路径: {self.control_file_path}")
+        if self.control_port:
+            self._init_control_channel()
         
         # 初始化态势广播套接字
         if self.enable_status_broadcast:
             self._init_status_broadcast()
         
-        # Tacview集成
-        self.tacview_streamer = TacviewStreamer()
-        # 在单独线程中启动Tacview服务器
-        self.tacview_thread = Thread(target=self._start_tacview_server, daemon=True)
-        self.tacview_thread.start()
-        time.sleep(1)  # 等待服务器启动
+        # 启动计时（由主程序设置 startup_timings 后，首帧完成时打印耗时分解）
+        self.startup_timings = None
+        self._created_at = time.perf_counter()
+        
+        # Tacview集成（分叉出的推演分支不启动Tacview）
+        # 监听在后台线程中进行，不等待客户端；客户端连接后自动补发目标区域
+        self.tacview_streamer = None
+        self.tacview_thread = None
+        if enable_tacview:
+            self.tacview_streamer = TacviewStreamer()
+            self.tacview_streamer.target_area = self.target_area
+            # ACMI录制（后台线程写文件）代替逐帧同步写入的文本日志
+            if acmi_recorder is not None:
+                self.tacview_streamer.log_file_path = None
+                self.tacview_streamer.attach_recorder(acmi_recorder)
+            # 发送线程：Tacview跟不上时按策略丢帧，不拖慢推演（None 表示在推演线程中直接发送）
+            if tacview_send_policy:
+                self.tacview_streamer.start_sender(tacview_queue_size, tacview_send_policy)
+            # 在单独线程中启动Tacview服务器
+            self.tacview_thread = Thread(target=self._start_tacview_server, daemon=True)
+            self.tacview_thread.start()
     
     def _start_tacview_server(self):
         """在单独线程中启动Tacview服务器"""
         success = self.tacview_streamer.start_server()
         if success:
-            print("Tacview服务器启动成功，可以连接Tacview客户端到 127.0.0.1:58008")
+            print(f"Tacview服务器启动成功，Tacview客户端可随时连接到 "
+                  f"{self.tacview_streamer.local_ip}:{self.tacview_streamer.local_port}（支持多个客户端）")
         else:
-            print("Tacview服务器启动失败")
+            print("Tacview端口暂不可用，后台继续重试绑定，推演不受影响")
     
     def _read_control_file(self):
         """读取控制文件更新推演状态"""
@@ -1263,33 +3641,174 @@ class DroneSimulation:
             if not os.path.exists(self.control_file_path):
                 return
             
+            self.control_file_mtime = os.stat(self.control_file_path).st_mtime
             with open(self.control_file_path, 'r', encoding='utf-8') as f:
                 control_data = json.load(f)
             
-            old_paused = self.is_paused
-            old_speed = self.speed_multiplier
-            
-            self.is_paused = control_data.get('paused', False)
-            self.speed_multiplier = control_data.get('speed_multiplier', 1.0)
-            
-            # 检测状态变化并打印
-            if old_paused != self.is_paused:
-                if self.is_paused:
-                    print('\n' + '=' * 70)
-                    print('⏸️  【推演已暂停】')
-                    print('=' * 70 + '\n')
-                else:
-                    print('\n' + '=' * 70)
-                    print('▶️  【推演已继续】')
-                    print('=' * 70 + '\n')
-            
-            if old_speed != self.speed_multiplier and not self.is_paused:
-                print(f'\n⚡ 推演倍速已调整: {old_speed}x → {self.speed_multiplier}x\n')
+            self._apply_control(control_data, use_defaults=True)
                 
         except Exception as e:
             # 读取控制文件失败时使用默认值
             pass
     
+    def _check_control_file(self):
+        """控制文件后备通道：只在文件修改时间变化时重新解析"""
+        try:
+            mtime = os.stat(self.control_file_path).st_mtime
+        except OSError:
+            return
+        if mtime != self.control_file_mtime:
+            self._read_control_file()
+    
+    def _apply_control(self, control_data, use_defaults=False):
+        """应用控制指令
+
+        Args:
+            control_data: 控制字段字典（paused, speed_multiplier）
+            use_defaults: 为True时缺失字段取默认值（控制文件语义），否则保持当前值（增量消息）
+        """
+        old_paused = self.is_paused
+        old_speed = self.speed_multiplier
+        
+        if use_defaults:
+            self.is_paused = control_data.get('paused', False)
+            self.speed_multiplier = control_data.get('speed_multiplier', 1.0)
+        else:
+            self.is_paused = control_data.get('paused', self.is_paused)
+            self.speed_multiplier = control_data.get('speed_multiplier', self.speed_multiplier)
+        
+        task_mode = control_data.get('blue_task_mode')
+        if task_mode and task_mode != self.allocation_result.get('task_mode'):
+            self.switch_task_mode(task_mode)
+        
+        # 检测状态变化并打印
+        if old_paused != self.is_paused:
+            if self.is_paused:
+                print('\n' + '=' * 70)
+                print('⏸️  【推演已暂停】')
+                print('=' * 70 + '\n')
+            else:
+                print('\n' + '=' * 70)
+                print('▶️  【推演已继续】')
+                print('=' * 70 + '\n')
+        
+        if old_speed != self.speed_multiplier and not self.is_paused:
+            print(f'\n⚡ 推演倍速已调整: {old_speed}x → {self.speed_multiplier}x\n')
+    
+    def switch_task_mode(self, task_mode):
+        """切换任务模式：替换任务分组并按新分组重排状态矩阵
+
+        未预计算的模式按 situation_file 在当前线程中计算（单次分配只需几毫秒），结果缓存在
+        'mode_allocations' 中，之后切换回来不再计算。
+
+        Returns:
+            bool: 是否切换成功（未预计算且没有态势文件时返回 False）
+        """
+        mode_allocations = self.allocation_result.setdefault('mode_allocations', {})
+        current_mode = self.allocation_result.get('task_mode')
+        if current_mode and current_mode not in mode_allocations:
+            mode_allocations[current_mode] = {'task_groups': self.allocation_result['task_groups'],
+                                              'allocation_metadata': self.allocation_result.get('allocation_metadata', {})}
+        if task_mode not in mode_allocations:
+            if not self.situation_file:
+                print(f"【警告】任务模式 {task_mode} 未预计算，需重新启动任务分配才能切换", flush=True)
+                self.allocation_result['task_mode'] = task_mode  # 避免重复提示
+                return False
+            allocate_start = time.perf_counter()
+            attack_drones_data, defense_drones_data, _ = load_situation_data(self.situation_file)
+            result = _allocate_for_mode(attack_drones_data, defense_drones_data, task_mode)
+            mode_allocations[task_mode] = {'task_groups': result['task_groups'],
+                                           'allocation_metadata': result['allocation_metadata']}
+            print(f"已按需计算任务模式 {task_mode}（{(time.perf_counter() - allocate_start) * 1000:.1f} 毫秒）",
+                  flush=True)
+
+        old_mode = self.allocation_result.get('task_mode')
+        sharded = self.sharded_physics is not None
+        if sharded:
+            self._stop_sharded_physics()
+
+        old_index = self.drone_index
+        self.allocation_result['task_groups'] = mode_allocations[task_mode]['task_groups']
+        self.allocation_result['allocation_metadata'] = mode_allocations[task_mode]['allocation_metadata']
+        self.allocation_result['task_mode'] = task_mode
+        self._build_layout(old_index)
+        self.state = np.ascontiguousarray(self.state[:, [old_index[d] for d in self.drone_order]])
+
+        if self.metric_series is not None and self.metric_series.group_cohesion.shape[1] != self.n_groups:
+            # 分组数变化，聚合度列数不同，指标时间序列以剩余容量重新开始
+            remaining = self.metric_series.capacity - self.metric_series.count
+            self.metric_series = MetricSeries(remaining, self.n_groups)
+        if self.trajectory_recorder:
+            self.trajectory_recorder.columns = np.array(
+                [self.drone_index[d] for d in self.trajectory_recorder.drone_order], dtype=np.intp)
+        if sharded:
+            self._start_sharded_physics(self._flight_params())
+
+        print('\n' + '=' * 70)
+        print(f'🔄 【任务模式已切换】{old_mode} → {task_mode}（{self.n_groups} 个任务组）')
+        print('=' * 70 + '\n')
+        return True
+
+    def _init_control_channel(self):
+        """初始化本地控制端口（非阻塞UDP套接字）"""
+        try:
+            self.control_socket = socket(AF_INET, SOCK_DGRAM)
+            self.control_socket.bind(('127.0.0.1', self.control_port))
+            self.control_socket.setblocking(False)
+            print(f"  控制端口: 127.0.0.1:{self.control_port} (UDP/JSON，控制文件作为后备)")
+        except Exception as e:
+            print(f"初始化控制端口失败，仅使用控制文件: {e}")
+            self.control_socket = None
+    
+    def _drain_control_socket(self):
+        """非阻塞地读取并应用所有待处理的控制消息，返回处理的消息数"""
+        if not self.control_socket:
+            return 0
+        handled = 0
+        while True:
+            try:
+                data, _ = self.control_socket.recvfrom(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break
+            try:
+                self._apply_control(json.loads(data.decode('utf-8')))
+                handled += 1
+            except Exception:
+                pass  # 忽略格式错误的消息
+        return handled
+    
+    def _poll_control(self):
+        """每帧检查控制事件：控制端口非阻塞读取，控制文件按间隔检查修改时间"""
+        self._drain_control_socket()
+        current_time = time.time()
+        if current_time - self.last_control_check_time >= self.control_check_interval:
+            self._check_control_file()
+            self.last_control_check_time = current_time
+    
+    def _wait_for_control(self, timeout):
+        """等待至多 timeout 秒；控制端口收到消息时立即返回"""
+        if not self.control_socket:
+            time.sleep(timeout)
+            return
+        try:
+            readable, _, _ = select.select([self.control_socket], [], [], timeout)
+        except (OSError, ValueError):
+            time.sleep(timeout)
+            return
+        if readable:
+            self._drain_control_socket()
+    
+    def close_control_channel(self):
+        """关闭控制端口"""
+        if self.control_socket:
+            try:
+                self.control_socket.close()
+            except Exception:
+                pass
+            self.control_socket = None
+    
     def _init_status_broadcast(self):
         """初始化态势广播UDP套接字"""
         try:
@@ -1299,10 +3818,29 @@ class DroneSimulation:
             print(f"初始化态势广播套接字失败: {e}")
             self.enable_status_broadcast = False
     
-    def _broadcast_status(self):
-        """广播当前红方和蓝方态势数据到本地UDP端口"""
-        if not self.enable_status_broadcast or not self.status_socket:
+    def _broadcast_status(self, frame, values):
+        """广播一帧红方和蓝方态势数据到本地UDP端口
+
+        Args:
+            frame: 已发布的 StateFrame
+            values: FrameBuffer.read() 读出的 (x, y, vx, vy, heading) 数组（注册表顺序）
+        """
+        self._send_status(self._encode_status(frame, values))
+
+    def _send_status(self, data):
+        """发送已编码的态势数据"""
+        if data is None or not self.status_socket:
             return
+        try:
+            self.status_socket.sendto(data, ('127.0.0.1', self.status_broadcast_port))
+        except Exception as e:
+            # 静默失败，不影响主仿真
+            pass
+
+    def _encode_status(self, frame, values):
+        """把一帧快照编码为态势广播的JSON字节串（未启用广播时返回 None）"""
+        if not self.enable_status_broadcast or not self.status_socket:
+            return None
         
         try:
             # 构造红方态势数据
@@ -1311,30 +3849,23 @@ class DroneSimulation:
             # 构造蓝方目标态势数据（使用实际的防御型无人机）
             blue_targets_list = []
             
-            for drone_id in self.drone_positions:
-                # 获取无人机的类型（攻击或防御）
-                drone_type = self.allocation_result['initial_positions'][drone_id]['type']
+            registry = frame.registry
+            xs, ys, vxs, vys, headings = values.tolist()
+            
+            for k, drone_id in enumerate(registry.ids):
+                # 计算速度大小（m/s）
+                speed = math.sqrt(vxs[k]**2 + vys[k]**2)
                 
                 # 红方
-                if drone_type == 'attack':
-                    position = self.drone_positions[drone_id]
-                    velocity = self.drone_velocities[drone_id]
-                    heading = self.drone_headings.get(drone_id, 0)
-                    
-                    # 计算速度大小（m/s）
-                    speed = math.sqrt(velocity[0]**2 + velocity[1]**2)
-                    
-                    # 提取平台ID（从 "A1" 提取数字）
-                    platform_id = int(''.join(filter(str.isdigit, drone_id)))
-                    
-                    # 构造飞机数据
+                if registry.is_attack_list[k]:
+                    # 构造飞机数据（平台ID为 "A1" 中的数字）
                     aircraft_data = {
-                        'platform_id': platform_id,
-                        'longitude': position[0] / 1000.0,  # 转换为合适的坐标
-                        'latitude': position[1] / 1000.0,
-                        'height': position[2] if len(position) > 2 else 1000,  # 高度（米）
+                        'platform_id': registry.number_list[k],
+                        'longitude': xs[k] / 1000.0,  # 转换为合适的坐标
+                        'latitude': ys[k] / 1000.0,
+                        'height': 1000,  # 高度（米）
                         'speed': speed,  # 速度（m/s）
-                        'course': heading,  # 航向（度）
+                        'course': headings[k],  # 航向（度）
                         'roll': 0,
                         'pitch': 0,
                         'drone_id': drone_id
@@ -1342,25 +3873,15 @@ class DroneSimulation:
                     red_aircraft_list.append(aircraft_data)
 
                 # 蓝方目标
-                if drone_type == 'defense':
-                    position = self.drone_positions[drone_id]
-                    velocity = self.drone_velocities[drone_id]
-                    heading = self.drone_headings.get(drone_id, 0)
-                    
-                    # 计算速度大小（m/s）
-                    speed = math.sqrt(velocity[0]**2 + velocity[1]**2)
-                    
-                    # 提取目标ID（从 "D1" 提取数字）
-                    target_id = int(''.join(filter(str.isdigit, drone_id)))
-                    
-                    # 构造目标数据
+                else:
+                    # 构造目标数据（目标ID为 "D1" 中的数字）
                     target_data = {
-                        'target_id': target_id,
-                        'longitude': position[0] / 1000.0,  # 转换为合适的坐标
-                        'latitude': position[1] / 1000.0,
-                        'height': position[2] if len(position) > 2 else 1000,  # 高度（米）
+                        'target_id': registry.number_list[k],
+                        'longitude': xs[k] / 1000.0,  # 转换为合适的坐标
+                        'latitude': ys[k] / 1000.0,
+                        'height': 1000,  # 高度（米）
                         'speed': speed,  # 速度（m/s）
-                        'course': heading,  # 航向（度）
+                        'course': headings[k],  # 航向（度）
                         'roll': 0,
                         'pitch': 0,
                         'target_kind': 5,  # 目标类型：5-无人机
@@ -1369,21 +3890,16 @@ class DroneSimulation:
                     blue_targets_list.append(target_data)
             
          
-            # 发送数据到本地UDP端口
             data = json.dumps({
                 'timestamp': time.time(),
                 'red_aircraft': red_aircraft_list,
                 'blue_targets': blue_targets_list
             }, ensure_ascii=False)
-            
-            self.status_socket.sendto(
-                data.encode('utf-8'),
-                ('127.0.0.1', self.status_broadcast_port)
-            )
+            return data.encode('utf-8')
                 
         except Exception as e:
             # 静默失败，不影响主仿真
-            pass
+            return None
 
     def initialize_positions(self):
         """Initialize drone positions based on their distance to target"""
@@ -1393,7 +3909,7 @@ class DroneSimulation:
         for drone_id, attrs in drone_attrs.items():
             # Convert distance and random angle to x,y coordinates
             distance = attrs['distance_to_target']
-            angle = np.random.uniform(0, 2 * np.pi)
+            angle = self.rng.uniform(0, 2 * np.pi)
 
             # Position relative to target area
             x = self.target_area[0] + distance * np.cos(angle)
@@ -1409,256 +3925,600 @@ class DroneSimulation:
             self.drone_headings[drone_id] = np.degrees(angle)  # 初始航向角指向目标
             self.drone_angular_velocities[drone_id] = 0  # 初始角速度为0
 
+        self._build_state_arrays()
+
+    def _build_state_arrays(self):
+        """把字典状态打包为状态矩阵，列按任务分组连续排列（便于分片）"""
+        self._build_layout(self.drone_positions)
+        self.state = np.zeros((STATE_SIZE, len(self.drone_order)))
+        for i, drone_id in enumerate(self.drone_order):
+            self.state[STATE_X:STATE_Y + 1, i] = self.drone_positions[drone_id]
+            self.state[STATE_VX:STATE_VY + 1, i] = self.drone_velocities[drone_id]
+            self.state[STATE_AX:STATE_AY + 1, i] = self.drone_accelerations[drone_id]
+            self.state[STATE_HEADING, i] = self.drone_headings[drone_id]
+            self.state[STATE_ANGVEL, i] = self.drone_angular_velocities[drone_id]
+
+    def _build_layout(self, drone_ids):
+        """确定状态矩阵的列顺序、分组编号和速度系数"""
+        order = []
+        group_index = []
+        speed_factor = []
+        seen = set()
+        for g, group in enumerate(self.allocation_result['task_groups']):
+            for drone_id in group['defense_drones'] + group['attack_drones']:
+                if drone_id in seen or drone_id not in drone_ids:
+                    continue
+                seen.add(drone_id)
+                order.append(drone_id)
+                group_index.append(g)
+                # 攻击无人机速度较快，防御无人机速度较慢
+                speed_factor.append(0.8 if drone_id in group['attack_drones'] else 0.6)
+        n_grouped = len(order)
+        order.extend(d for d in drone_ids if d not in seen)
+
+        self.drone_order = order
+        self.drone_index = {drone_id: i for i, drone_id in enumerate(order)}
+        self.group_index = np.array(group_index, dtype=np.intp)
+        self.n_groups = len(self.allocation_result['task_groups'])
+        self.speed_factor = np.array(speed_factor, dtype=np.float64)
+        self.n_grouped = n_grouped
+        self.sleep_state = np.zeros((SLEEP_SIZE, n_grouped))  # 布局改变后全部唤醒
+        self._cohesion_pairs = None
+        self._build_registry()
+
+    def _build_registry(self):
+        """按当前列顺序建立实体注册表"""
+        self.registry = EntityRegistry.from_allocation(self.allocation_result, self.drone_order)
+        self.registry.bind_columns(self.drone_index)
+
+    def _sync_state_dicts(self):
+        """把状态矩阵写回各状态字典"""
+        x, y, vx, vy, ax, ay, heading, angvel = self.state.tolist()
+        for i, drone_id in enumerate(self.drone_order):
+            self.drone_positions[drone_id] = (x[i], y[i])
+            self.drone_velocities[drone_id] = (vx[i], vy[i])
+            self.drone_accelerations[drone_id] = (ax[i], ay[i])
+            self.drone_headings[drone_id] = heading[i]
+            self.drone_angular_velocities[drone_id] = angvel[i]
+
+    def _flight_params(self):
+        """当前飞行动力学参数"""
+        return FlightParams(
+            max_speed=self.max_speed,
+            max_acceleration=self.max_acceleration,
+            max_angular_velocity=self.max_angular_velocity,
+            smoothing_factor=self.smoothing_factor,
+            separation_radius=self.separation_radius,
+            separation_weight=self.separation_weight,
+            separation_cell_size=self.separation_cell_size,
+            settle_radius=self.settle_radius,
+            wake_radius=self.wake_radius,
+            settle_wake_shift=self.settle_wake_shift,
+            settle_check_interval=max(1, self.settle_check_interval)
+        )
+
+    def _start_sharded_physics(self, params):
+        """启动多进程分片物理，之后 self.state 指向共享内存"""
+        try:
+            self.sharded_physics = ShardedPhysics(
+                self.state, self.group_index, self.n_groups, self.speed_factor,
+                self.target_area, self.area_size, params, self.physics_workers,
+                sleep_state=self.sleep_state
+            )
+            self.state = self.sharded_physics.state
+            self.sleep_state = self.sharded_physics.sleep_state
+        except Exception as e:
+            print(f"【警告】启动多进程分片物理失败，使用单进程计算: {e}", flush=True)
+            self.sharded_physics = None
+
+    def _stop_sharded_physics(self):
+        """停止多进程分片物理，状态复制回进程私有数组"""
+        if self.sharded_physics is not None:
+            self.state = self.sharded_physics.close()
+            self.sleep_state = self.sharded_physics.sleep_state
+            self.sharded_physics = None
+
+    def _physics_step(self, params):
+        """执行一步物理更新（单进程或多进程分片）"""
+        if self.sharded_physics is not None:
+            try:
+                self.sharded_physics.step(self.sim_step)
+                return
+            except Exception as e:
+                print(f"【警告】分片工作进程同步失败，切换为单进程计算: {e}", flush=True)
+                self._stop_sharded_physics()
+        n = self.n_grouped
+        physics_step_arrays(self.state[:, :n], self.group_index, self.n_groups,
+                            self.speed_factor, self.target_area, self.area_size, params, self.sleep_state,
+                            check_sleep=self.sim_step % params.settle_check_interval == 0)
+
+    def advance(self, steps):
+        """无延时、无输出地推进若干物理步（用于分叉分支的假设推演）"""
+        params = self._flight_params()
+        self._reserve_metric_series(steps)
+        for _ in range(steps):
+            self._physics_step(params)
+            self.sim_step += 1
+            self.sim_time += self.tacview_time_step
+            self._record_metrics()
+            if self.trajectory_recorder:
+                self.trajectory_recorder.record(self.sim_step, self.sim_time, self.state)
+        self._sync_state_dicts()
+
+    def start_recording(self, output_dir, chunk_frames=256, num_chunks=4, interval=1):
+        """开启轨迹记录（需在 initialize_positions 之后调用）"""
+        self.trajectory_recorder = TrajectoryRecorder(output_dir, self.drone_order, chunk_frames=chunk_frames,
+                                                      num_chunks=num_chunks, interval=interval)
+
+    def stop_recording(self):
+        """停止轨迹记录并写出剩余数据"""
+        if self.trajectory_recorder:
+            self.trajectory_recorder.close()
+            self.trajectory_recorder = None
+
+    def _metrics_arrays(self):
+        """向量化计算当前的平均目标距离和各组聚合度 (n_groups,)"""
+        x, y = self.state[STATE_X], self.state[STATE_Y]
+        if len(x) == 0:
+            return 0.0, np.zeros(self.n_groups)
+        avg_distance = float(np.sqrt((x - self.target_area[0]) ** 2 + (y - self.target_area[1]) ** 2).mean())
+        if self._cohesion_pairs is None:
+            self._cohesion_pairs = intra_group_pairs(self.group_index, self.n_groups)
+        ng = self.n_grouped
+        cohesion = group_cohesion_arrays(x[:ng], y[:ng], self._cohesion_pairs)
+        return avg_distance, cohesion
+
+    def _reserve_metric_series(self, steps):
+        """推演开始前为指标时间序列预分配足够的缓冲区"""
+        if not self.metrics_interval:
+            return
+        if self.metric_series is None or self.metric_series.group_cohesion.shape[1] != self.n_groups:
+            self.metric_series = MetricSeries(0, self.n_groups)
+        self.metric_series.reserve(steps // self.metrics_interval + 1)
+
+    def _record_metrics(self):
+        """每 metrics_interval 步记录一次指标"""
+        if not self.metrics_interval or self.metric_series is None or self.sim_step % self.metrics_interval:
+            return
+        avg_distance, cohesion = self._metrics_arrays()
+        self.metric_series.append(self.sim_step, self.sim_time, avg_distance, cohesion)
+
+    def run_replicas(self, replicas, steps=100):
+        """批量蒙特卡洛：同一分配结果的 R 个独立随机初始化在一个 (R×N) 状态数组中一起推演
+
+        每个副本按 initialize_positions 的规则随机放置无人机，所有副本共用一次向量化物理步进
+        （副本 r 的分组编号偏移 r*n_groups，互不影响）。
+
+        Returns:
+            dict: 各副本的平均目标距离 (R,)、组内聚合度 (R, n_groups) 及其分布统计
+        """
+        drone_attrs = self.allocation_result['drone_attributes']
+        if not self.drone_order:
+            self._build_layout(drone_attrs)
+        n = len(self.drone_order)
+        ng = self.n_grouped
+        params = self._flight_params()
+        start_time = time.time()
+
+        # 随机初始化 (R, N)：与 initialize_positions 相同的放置规则和随机数抽取顺序
+        attr_position = {drone_id: k for k, drone_id in enumerate(drone_attrs)}
+        columns = [attr_position[d] for d in self.drone_order]
+        distance = np.array([drone_attrs[d]['distance_to_target'] for d in self.drone_order])
+        angle = self.rng.uniform(0, 2 * np.pi, size=(replicas, len(drone_attrs)))[:, columns]
+        state = np.zeros((STATE_SIZE, replicas, n))
+        state[STATE_X] = np.clip(self.target_area[0] + distance * np.cos(angle), 0, self.area_size)
+        state[STATE_Y] = np.clip(self.target_area[1] + distance * np.sin(angle), 0, self.area_size)
+        state[STATE_HEADING] = np.degrees(angle)
+
+        # 副本间分组编号错开，整体当作 R*n_groups 个分组的一次步进
+        group_index = (self.group_index[None, :] + np.arange(replicas)[:, None] * self.n_groups).ravel()
+        speed_factor = np.tile(self.speed_factor, replicas)
+        sleep_state = np.zeros((SLEEP_SIZE, replicas * ng))
+        for step in range(self.sim_step, self.sim_step + steps):
+            check_sleep = step % params.settle_check_interval == 0
+            if ng == n:
+                grouped = state.reshape(STATE_SIZE, replicas * n)
+                physics_step_arrays(grouped, group_index, replicas * self.n_groups, speed_factor,
+                                    self.target_area, self.area_size, params, sleep_state, check_sleep)
+            else:
+                grouped = state[:, :, :ng].reshape(STATE_SIZE, replicas * ng)
+                physics_step_arrays(grouped, group_index, replicas * self.n_groups, speed_factor,
+                                    self.target_area, self.area_size, params, sleep_state, check_sleep)
+                state[:, :, :ng] = grouped.reshape(STATE_SIZE, replicas, ng)
+
+        # 指标分布
+        x, y = state[STATE_X], state[STATE_Y]
+        avg_distance = np.sqrt((x - self.target_area[0]) ** 2 + (y - self.target_area[1]) ** 2).mean(axis=1)
+        pairs = intra_group_pairs(self.group_index, self.n_groups)
+        cohesion = group_cohesion_arrays(x[:, :ng], y[:, :ng], pairs)
+        multi_member = np.diff(pairs[2]) > 0
+        mean_cohesion = cohesion[:, multi_member].mean(axis=1) if multi_member.any() else np.zeros(replicas)
+        elapsed = time.time() - start_time
+
+        return {
+            'replicas': replicas,
+            'steps': steps,
+            'elapsed': elapsed,
+            'group_ids': [group['group_id'] for group in self.allocation_result['task_groups']],
+            'avg_distance_to_target': avg_distance,
+            'group_cohesion': cohesion,
+            'summary': {
+                'avg_distance_to_target': _distribution_summary(avg_distance),
+                'mean_group_cohesion': _distribution_summary(mean_cohesion)
+            }
+        }
+
+    def snapshot(self):
+        """获取当前完整仿真状态的快照（数组均为副本）"""
+        return SimulationSnapshot(
+            state=self.state.copy(),
+            drone_order=list(self.drone_order),
+            group_index=self.group_index.copy(),
+            speed_factor=self.speed_factor.copy(),
+            n_groups=self.n_groups,
+            allocation_result=copy.deepcopy(self.allocation_result),
+            sim_step=self.sim_step,
+            sim_time=self.sim_time,
+            rng_state=copy.deepcopy(self.rng.bit_generator.state),
+            target_area=tuple(self.target_area),
+            area_size=self.area_size,
+            sleep_state=self.sleep_state.copy()
+        )
+
+    def restore(self, snapshot):
+        """从快照恢复仿真状态（之后的推演与快照时刻逐位一致）"""
+        self.state = snapshot.state.copy()
+        self.drone_order = list(snapshot.drone_order)
+        self.drone_index = {drone_id: i for i, drone_id in enumerate(self.drone_order)}
+        self.group_index = snapshot.group_index.copy()
+        self._cohesion_pairs = None
+        self.n_grouped = len(self.group_index)
+        if snapshot.sleep_state is not None and snapshot.sleep_state.shape == (SLEEP_SIZE, self.n_grouped):
+            self.sleep_state = snapshot.sleep_state.copy()
+        else:
+            self.sleep_state = np.zeros((SLEEP_SIZE, self.n_grouped))
+        self.speed_factor = snapshot.speed_factor.copy()
+        self.n_groups = snapshot.n_groups
+        self.allocation_result = copy.deepcopy(snapshot.allocation_result)
+        self.sim_step = snapshot.sim_step
+        self.sim_time = snapshot.sim_time
+        self.rng.bit_generator.state = copy.deepcopy(snapshot.rng_state)
+        self.target_area = tuple(snapshot.target_area)
+        self.area_size = snapshot.area_size
+        self._build_registry()
+        self._sync_state_dicts()
+
+    def fork(self, count=1):
+        """在进程内分叉出若干推演分支（不启动Tacview和态势广播）
+
+        各分支拥有独立的状态数组和随机数发生器，可分别修改参数后调用 advance()。
+        """
+        snapshot = self.snapshot()
+        branches = []
+        for _ in range(count):
+            branch = DroneSimulation(snapshot.allocation_result, target_area=snapshot.target_area,
+                                     area_size=snapshot.area_size, enable_status_broadcast=False,
+                                     control_file_path=self.control_file_path, enable_tacview=False)
+            branch.situation_file = self.situation_file
+            for attr in ('max_speed', 'max_acceleration', 'max_angular_velocity', 'smoothing_factor',
+                         'separation_radius', 'separation_weight', 'separation_cell_size',
+                         'settle_radius', 'wake_radius', 'settle_wake_shift', 'settle_check_interval'):
+                setattr(branch, attr, getattr(self, attr))
+            branch.restore(snapshot)
+            branches.append(branch)
+        return branches
+
+    def save_checkpoint(self, path):
+        """把完整仿真状态写入紧凑的二进制检查点文件（.npz，不使用pickle）"""
+        snapshot = self.snapshot()
+        meta = {
+            'n_groups': snapshot.n_groups,
+            'sim_step': snapshot.sim_step,
+            'sim_time': snapshot.sim_time,
+            'rng_state': snapshot.rng_state,
+            'target_area': list(snapshot.target_area),
+            'area_size': snapshot.area_size
+        }
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                state=snapshot.state,
+                drone_order=np.array(snapshot.drone_order, dtype=np.str_),
+                group_index=snapshot.group_index,
+                speed_factor=snapshot.speed_factor,
+                sleep_state=snapshot.sleep_state,
+                allocation_result=np.frombuffer(
+                    json.dumps(snapshot.allocation_result, ensure_ascii=False).encode('utf-8'), dtype=np.uint8),
+                meta=np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+            )
+
+    @staticmethod
+    def load_snapshot(path):
+        """从检查点文件读取快照"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+            return SimulationSnapshot(
+                state=data['state'].copy(),
+                drone_order=data['drone_order'].tolist(),
+                group_index=data['group_index'].astype(np.intp),
+                speed_factor=data['speed_factor'].copy(),
+                n_groups=meta['n_groups'],
+                allocation_result=json.loads(data['allocation_result'].tobytes().decode('utf-8')),
+                sim_step=meta['sim_step'],
+                sim_time=meta['sim_time'],
+                rng_state=meta['rng_state'],
+                target_area=tuple(meta['target_area']),
+                area_size=meta['area_size'],
+                sleep_state=data['sleep_state'].copy() if 'sleep_state' in data.files else None
+            )
+
+    def load_checkpoint(self, path):
+        """从检查点文件恢复仿真状态"""
+        self.restore(self.load_snapshot(path))
+
+    def _tacview_frame_bytes(self, frame, values):
+        """把一帧快照编码为ACMI整帧字节串（未连接时返回 None）"""
+        if not (self.tacview_streamer and self.tacview_streamer.has_output()):
+            return None
+        registry = frame.registry
+        altitudes = 1000 + self.display_rng.uniform(-50, 50, size=len(registry))
+        return self.tacview_streamer.encode_frame(frame.sim_time, registry, values[0], values[1], altitudes,
+                                                  values[2] * 10, values[3] * 10)
+
+    def _send_tacview_bytes(self, frame, data, first_frame=False):
+        """批量发送一帧已编码的Tacview数据"""
+        tacview_timestamp = frame.sim_time
+        drone_count = len(frame.registry)
+        
+        # 第一帧时打印数据示例
+        if first_frame and data:
+            lines = data.split(b'\n', 4)[1:4]
+            print('\n' + '=' * 70)
+            print('【第一帧数据示例】统一时刻发送所有飞机')
+            print(f'  时间戳: #{tacview_timestamp:.2f}')
+            print(f'  飞机总数: {drone_count} 架')
+            print(f'  数据大小: {len(data)} 字节')
+            print('  前3架飞机数据:')
+            for i, line in enumerate(lines[:min(3, drone_count)]):
+                print(f'    [{i+1}] {line.decode("utf-8")}')
+            if drone_count > 3:
+                print(f'    ... 还有 {drone_count-3} 架飞机')
+            print('=' * 70 + '\n')
+    
+        # 统一时刻批量发送整帧数据（一次性发送）
+        success = self.tacview_streamer.send_encoded_frame(tacview_timestamp, data, drone_count)
+        if not success:
+            print('【警告】Tacview发送失败，连接可能已断开')
+
+    def _send_tacview_frame(self, frame, values, first_frame=False):
+        """把一帧快照格式化为Tacview数据并批量发送"""
+        try:
+            data = self._tacview_frame_bytes(frame, values)
+            if data:
+                self._send_tacview_bytes(frame, data, first_frame)
+        except Exception as e:
+            # 捕获异常但继续仿真
+            if self._frames_emitted <= 5:  # 只在前5帧报告错误
+                print(f'【错误】Tacview数据发送异常: {e}')
+
+    def _encode_frame(self, item):
+        """流水线编码阶段：编码Tacview整帧数据和态势广播"""
+        frame, values = item
+        self._frames_emitted += 1
+        try:
+            tacview_data = self._tacview_frame_bytes(frame, values)
+        except Exception as e:
+            tacview_data = None
+            if self._frames_emitted <= 5:
+                print(f'【错误】Tacview数据编码异常: {e}')
+        return frame, tacview_data, self._encode_status(frame, values), self._frames_emitted == 1
+
+    def _on_encoded_dropped(self, item):
+        """流水线丢弃已编码的帧：通知 Tacview 重新同步（死区增量、关键帧请求）"""
+        tacview_data = item[1]
+        if tacview_data:
+            self.tacview_streamer.frame_dropped(tacview_data)
+
+    def _send_encoded(self, item):
+        """流水线发送阶段：写Tacview套接字并发送态势广播"""
+        frame, tacview_data, status_data, first_frame = item
+        if tacview_data:
+            try:
+                self._send_tacview_bytes(frame, tacview_data, first_frame)
+            except Exception as e:
+                print(f'【错误】Tacview数据发送异常: {e}')
+        self._send_status(status_data)
+
+    def _emit_frame(self):
+        """读取最新快照并交给各输出端（Tacview、态势广播）"""
+        frame, values = self.frame_buffer.read()
+        if frame is None:
+            return
+        self._frames_emitted += 1
+        self._send_tacview_frame(frame, values, first_frame=self._frames_emitted == 1)
+        self._broadcast_status(frame, values)
+
+    def latest_frame(self):
+        """最近发布的只读状态快照（可在任意线程调用，读完后用 frame.valid() 校验）"""
+        return self.frame_buffer.front
+
+    def _start_output_thread(self):
+        """启动输出线程：每发布一帧就读取最新快照并发送，来不及时跳到最新帧"""
+        self._output_stop.clear()
+        self.output_thread = Thread(target=self._output_loop, daemon=True)
+        self.output_thread.start()
+
+    def _output_loop(self):
+        """输出线程主循环"""
+        while not self._output_stop.is_set():
+            if not self.frame_buffer.new_frame.wait(0.1):
+                continue
+            self.frame_buffer.new_frame.clear()
+            self._emit_frame()
+
+    def _stop_output_thread(self):
+        """停止输出线程并补发最后一帧"""
+        if self.output_thread is None:
+            return
+        self._output_stop.set()
+        self.output_thread.join()
+        self.output_thread = None
+        if self.frame_buffer.new_frame.is_set():
+            self.frame_buffer.new_frame.clear()
+            self._emit_frame()
+
+    def _start_pipeline(self):
+        """启动输出流水线（编码、发送两个工作线程）"""
+        try:
+            self.pipeline = OutputPipeline([('encode', self._encode_frame), ('send', self._send_encoded)],
+                                           queue_size=self.pipeline_queue_size, policy=self.output_pipeline,
+                                           on_drop={'send': self._on_encoded_dropped})
+        except ValueError as e:
+            print(f"【警告】{e}，不启用输出流水线", flush=True)
+            self.pipeline = None
+
+    def _stop_pipeline(self):
+        """关闭输出流水线并打印各阶段统计"""
+        if self.pipeline is None:
+            return
+        self.pipeline.close()
+        self.pipeline_stats = self.pipeline.stats()
+        self.pipeline = None
+        print_pipeline_report(self.pipeline_stats)
+
+    def _update_step_costs(self, physics_cost, sink_cost, alpha=0.2):
+        """更新单个物理步和每帧输出耗时的滑动平均"""
+        if self._physics_cost == 0.0:
+            self._physics_cost, self._sink_cost = physics_cost, sink_cost
+        else:
+            self._physics_cost += alpha * (physics_cost - self._physics_cost)
+            self._sink_cost += alpha * (sink_cost - self._sink_cost)
+
+    def _time_warp_steps(self, interval):
+        """每个输出帧的物理步数 K
+
+        需要的步速为 1/interval；每帧耗时约 K*物理步耗时 + 输出耗时，
+        取满足 K / (K*c_phys + c_sink) >= 1/interval 的最小 K（物理步本身跟不上时取上限）。
+        """
+        if self.max_warp_steps <= 1 or self._physics_cost == 0.0:
+            return 1
+        headroom = interval - self._physics_cost
+        if headroom <= 0:
+            return self.max_warp_steps
+        return int(min(self.max_warp_steps, max(1, math.ceil(self._sink_cost / headroom))))
+
     def update_positions(self, steps=100):
         """Simulate smooth movement of drones with realistic flight dynamics"""
-        dt = 0.1  # 时间步长 (秒)
+        params = self._flight_params()  # 时间步长 dt=0.1 秒
         max_step_time = 0  # 记录最大单步运行时间
         actual_step = 0  # 实际执行的步数（不包含暂停时的步数）
         
-        # Tacview时间戳：从0.0开始，每步增加0.01
-        tacview_timestamp = 0.0
-        tacview_time_step = 0.01  # 匹配训练文件格式
+        # Tacview时间戳：从仿真时钟继续（新仿真从0.0开始），每步增加0.01
+        tacview_timestamp = self.sim_time
+        tacview_time_step = self.tacview_time_step
+        
+        # 指标时间序列缓冲区在进入循环前一次性分配
+        self._reserve_metric_series(steps)
+        
+        # 多进程分片模式：状态矩阵放到共享内存，由工作进程按任务分组分片更新
+        if self.physics_workers and self.physics_workers > 1 and self.n_grouped:
+            self._start_sharded_physics(params)
+        
+        # 输出流水线优先；否则异步输出线程读取双缓冲快照
+        if self.output_pipeline:
+            self._start_pipeline()
+        elif self.async_output:
+            self._start_output_thread()
         
-        step = 0
-        while step < steps:
-            step_start_time = time.time()  # 记录单步开始时间
+        frames = 0  # 输出帧数
+        max_warp = 1  # 实际使用的最大每帧步数
+        try:
+            step = 0  # 本次调用已执行的物理步数（循环计数器，暂停时不增加）
+            while step < steps:
+                step_start_time = time.time()  # 记录单步开始时间
             
-            # 定期检查控制文件
-            current_time = time.time()
-            if current_time - self.last_control_check_time >= self.control_check_interval:
-                self._read_control_file()
-                self.last_control_check_time = current_time
+                # 处理控制事件（控制端口每帧非阻塞读取，控制文件作为后备）
+                self._poll_control()
             
-            # 如果暂停，则跳过计算和Tacview发送，只等待
-            if self.is_paused:
-                time.sleep(0.1)  # 暂停时仍然休眠，避免CPU占用
-                continue  # 跳过本帧的所有计算和发送（不增加step）
+                # 如果暂停，则跳过计算和Tacview发送，阻塞等待控制消息
+                if self.is_paused:
+                    self._wait_for_control(self.control_check_interval)
+                    continue  # 跳过本帧的所有计算和发送（不增加step）
             
-            # 推演未暂停，增加实际步数和Tacview时间戳
-            actual_step += 1
-            step += 1
-            tacview_timestamp += tacview_time_step  # 时间戳递增0.01
+                # 根据速度倍数调整间隔时间
+                # 基础间隔0.1秒，速度越快间隔越短
+                base_interval = 0.1
+                adjusted_interval = base_interval / self.speed_multiplier
+                
+                # 时间倍率：本帧执行 warp 个物理步，只输出最后的状态
+                warp = min(self._time_warp_steps(adjusted_interval), steps - step)
+                max_warp = max(max_warp, warp)
+                previous_step = actual_step
             
-            # Calculate group centers
-            group_centers = {}
-            for group in self.allocation_result['task_groups']:
-                all_drones = group['defense_drones'] + group['attack_drones']
-                if not all_drones:
-                    continue
-
-                positions = [self.drone_positions[d] for d in all_drones]
-                x_center = np.mean([p[0] for p in positions])
-                y_center = np.mean([p[1] for p in positions])
-                group_centers[group['group_id']] = (x_center, y_center)
-
-            # Update positions with smooth flight dynamics
-            for group in self.allocation_result['task_groups']:
-                group_id = group['group_id']
-                all_drones = group['defense_drones'] + group['attack_drones']
+                physics_start = time.perf_counter()
+                for _ in range(warp):
+                    # 推演未暂停，增加实际步数和Tacview时间戳
+                    actual_step += 1
+                    step += 1
+                    tacview_timestamp += tacview_time_step  # 时间戳递增0.01
+                
+                    # 物理更新（向量化；physics_workers > 1 时由工作进程在共享内存上分片计算）
+                    self._physics_step(params)
+                    self.sim_step += 1
+                    self.sim_time = tacview_timestamp
+                    self._record_metrics()
+                    if self.trajectory_recorder:
+                        self.trajectory_recorder.record(self.sim_step, self.sim_time, self.state)
+                sink_start = time.perf_counter()
 
-                # Skip empty groups
-                if not all_drones:
-                    continue
+                # 发布本帧快照；Tacview和态势广播读取快照（异步模式下在输出线程中进行，不计入步耗时）
+                self.frame_buffer.publish(self.sim_step, self.sim_time, self.state, self.registry)
+                if self.pipeline:
+                    self.pipeline.submit(self.frame_buffer.read(), time.time() - step_start_time)
+                elif not self.async_output:
+                    self._emit_frame()
+                frames += 1
+                self._update_step_costs((sink_start - physics_start) / warp, time.perf_counter() - sink_start)
 
-                for drone_id in all_drones:
-                    drone_type = 'attack' if drone_id in group['attack_drones'] else 'defense'
-                    
-                    # 获取当前状态
-                    x, y = self.drone_positions[drone_id]
-                    vx, vy = self.drone_velocities[drone_id]
-                    ax, ay = self.drone_accelerations[drone_id]
-                    current_heading = self.drone_headings[drone_id]
-                    angular_velocity = self.drone_angular_velocities[drone_id]
-                    
-                    # 计算期望方向
-                    # 目标方向
-                    target_dx = self.target_area[0] - x
-                    target_dy = self.target_area[1] - y
-                    target_distance = math.sqrt(target_dx**2 + target_dy**2)
-                    
-                    if target_distance > 0.1:
-                        target_direction = math.degrees(math.atan2(target_dx, target_dy))
-                    else:
-                        target_direction = current_heading
-                    
-                    # 编队方向 (如果有编队中心)
-                    formation_weight = 0.3
-                    if group_id in group_centers:
-                        gx, gy = group_centers[group_id]
-                        formation_dx = gx - x
-                        formation_dy = gy - y
-                        formation_distance = math.sqrt(formation_dx**2 + formation_dy**2)
-                        
-                        if formation_distance > 5.0:  # 只有距离编队中心较远时才考虑编队
-                            formation_direction = math.degrees(math.atan2(formation_dx, formation_dy))
-                            # 混合目标方向和编队方向
-                            target_direction = (target_direction * (1 - formation_weight) + 
-                                              formation_direction * formation_weight)
-                    
-                    # 计算航向角变化 (平滑转向)
-                    heading_diff = target_direction - current_heading
-                    # 处理角度跨越问题
-                    if heading_diff > 180:
-                        heading_diff -= 360
-                    elif heading_diff < -180:
-                        heading_diff += 360
-                    
-                    # 限制角速度
-                    max_angular_accel = 60.0  # 最大角加速度 (度/秒²)
-                    desired_angular_velocity = np.clip(heading_diff * 2.0, -self.max_angular_velocity, self.max_angular_velocity)
-                    angular_accel = np.clip(desired_angular_velocity - angular_velocity, -max_angular_accel, max_angular_accel)
-                    
-                    # 更新角速度和航向
-                    angular_velocity += angular_accel * dt
-                    angular_velocity = np.clip(angular_velocity, -self.max_angular_velocity, self.max_angular_velocity)
-                    current_heading += angular_velocity * dt
-                    
-                    # 确保航向角在0-360度范围内
-                    if current_heading < 0:
-                        current_heading += 360
-                    elif current_heading >= 360:
-                        current_heading -= 360
-                    
-                    # 计算期望速度 (基于当前航向)
-                    heading_rad = math.radians(current_heading)
-                    
-                    # 根据无人机类型设置不同的速度
-                    if drone_type == 'attack':
-                        desired_speed = self.max_speed * 0.8  # 攻击无人机速度较快
-                    else:
-                        desired_speed = self.max_speed * 0.6  # 防御无人机速度较慢
-                    
-                    # 根据距离目标的远近调整速度
-                    if target_distance < 10:
-                        desired_speed *= 0.5  # 接近目标时减速
-                    
-                    desired_vx = desired_speed * math.sin(heading_rad)
-                    desired_vy = desired_speed * math.cos(heading_rad)
-                    
-                    # 计算加速度 (平滑加速)
-                    accel_x = (desired_vx - vx) * 2.0  # 加速度系数
-                    accel_y = (desired_vy - vy) * 2.0
-                    
-                    # 限制加速度
-                    accel_magnitude = math.sqrt(accel_x**2 + accel_y**2)
-                    if accel_magnitude > self.max_acceleration:
-                        accel_x = accel_x / accel_magnitude * self.max_acceleration
-                        accel_y = accel_y / accel_magnitude * self.max_acceleration
-                    
-                    # 更新速度 (考虑惯性)
-                    vx = vx * self.smoothing_factor + (vx + accel_x * dt) * (1 - self.smoothing_factor)
-                    vy = vy * self.smoothing_factor + (vy + accel_y * dt) * (1 - self.smoothing_factor)
-                    
-                    # 限制速度
-                    speed = math.sqrt(vx**2 + vy**2)
-                    if speed > self.max_speed:
-                        vx = vx / speed * self.max_speed
-                        vy = vy / speed * self.max_speed
-                    
-                    # 更新位置
-                    new_x = x + vx * dt
-                    new_y = y + vy * dt
-                    
-                    # 边界处理 (反弹效果)
-                    if new_x <= 0 or new_x >= self.area_size:
-                        vx = -vx * 0.8  # 反弹并减速
-                        new_x = np.clip(new_x, 0, self.area_size)
-                    if new_y <= 0 or new_y >= self.area_size:
-                        vy = -vy * 0.8  # 反弹并减速
-                        new_y = np.clip(new_y, 0, self.area_size)
-                    
-                    # 更新所有状态
-                    self.drone_positions[drone_id] = (new_x, new_y)
-                    self.drone_velocities[drone_id] = (vx, vy)
-                    self.drone_accelerations[drone_id] = (accel_x, accel_y)
-                    self.drone_headings[drone_id] = current_heading
-                    self.drone_angular_velocities[drone_id] = angular_velocity
-
-            # 批量发送Tacview数据（每帧统一发送所有飞机）
-            if self.tacview_streamer and self.tacview_streamer.is_connected:
-                try:
-                    # 使用递增的Tacview时间戳（从0.01开始，每步0.01）
-                    
-                    # 使用列表推导式高效收集数据
-                    drone_data_list = []
-                    
-                    # 按顺序收集：先红方，再蓝方（保持一致性）
-                    for drone_id in sorted(self.drone_positions.keys()):
-                        drone_x, drone_y = self.drone_positions[drone_id]
-                        vx, vy = self.drone_velocities.get(drone_id, (0, 0))
-                        
-                        # 确定无人机类型
-                        drone_type = 'attack' if drone_id.startswith('A') else 'defense'
-                        
-                        # 转换为Tacview坐标系 (经纬度和高度)
-                        position = (drone_x, drone_y, 1000 + np.random.uniform(-50, 50))
-                        velocity = (vx * 10, vy * 10, 0)
-                        
-                        # 格式化数据行（时间戳用于计算，但不包含在单行数据中）
-                        data_line = self.tacview_streamer.send_drone_data(
-                            drone_id, position, velocity, drone_type, tacview_timestamp
-                        )
-                        if data_line:
-                            drone_data_list.append(data_line)
-                    
-                    # 第一帧时打印数据示例
-                    if actual_step == 1 and drone_data_list:
-                        print('\n' + '=' * 70)
-                        print('【第一帧数据示例】统一时刻发送所有飞机')
-                        print(f'  时间戳: #{tacview_timestamp:.2f}')
-                        print(f'  飞机总数: {len(drone_data_list)} 架')
-                        print(f'  数据大小: {sum(len(line.encode()) for line in drone_data_list)} 字节')
-                        print('  前3架飞机数据:')
-                        for i, line in enumerate(drone_data_list[:3]):
-                            print(f'    [{i+1}] {line.strip()}')
-                        if len(drone_data_list) > 3:
-                            print(f'    ... 还有 {len(drone_data_list)-3} 架飞机')
-                        print('=' * 70 + '\n')
-                    
-                    # 统一时刻批量发送整帧数据（一次性发送）
-                    if drone_data_list:
-                        success = self.tacview_streamer.send_frame_data(tacview_timestamp, drone_data_list)
-                        if not success:
-                            print('【警告】Tacview发送失败，连接可能已断开')
-                        
-                except Exception as e:
-                    # 捕获异常但继续仿真
-                    if actual_step <= 5:  # 只在前5帧报告错误
-                        print(f'【错误】Tacview数据发送异常: {e}')
-                    pass
-
-            # 每50步输出一次进度（已禁用，避免日志过多）
-            # if step % 50 == 0:
-            #     print(f"仿真进度: {step}/{steps} 步 ({step/steps*100:.1f}%)")
+                # 每50步输出一次进度（已禁用，避免日志过多）
+                # if step % 50 == 0:
+                #     print(f"仿真进度: {step}/{steps} 步 ({step/steps*100:.1f}%)")
             
-            # 广播红方态势数据（每10步广播一次，减少数据量）
-            # if step % 10 == 0:
-            self._broadcast_status()
-
-            # 计算单步运行时间（不包括sleep延迟）
-            step_end_time = time.time()
-            step_elapsed = step_end_time - step_start_time
-            if step_elapsed > max_step_time:
-                max_step_time = step_elapsed
-
-            # 根据速度倍数调整间隔时间
-            # 基础间隔0.1秒，速度越快间隔越短
-            base_interval = 0.1
-            adjusted_interval = base_interval / self.speed_multiplier
+                # 启动计时：首帧完成
+                if frames == 1 and self.startup_timings is not None:
+                    self.startup_timings['first_frame'] = time.perf_counter() - self._created_at
+                    print_startup_report(self.startup_timings)
+
+                # 计算单帧运行时间（不包括sleep延迟）
+                step_end_time = time.time()
+                step_elapsed = step_end_time - step_start_time
+                if step_elapsed > max_step_time:
+                    max_step_time = step_elapsed
             
-            # 显示进度（每50帧显示一次，包含速度信息）
-            if actual_step % 50 == 0:
-                speed_indicator = f"[{self.speed_multiplier}x]"
-                progress_pct = (actual_step / steps * 100) if steps > 0 else 0
-                print(f"  仿真进度: {actual_step}/{steps} 步 ({progress_pct:.1f}%) {speed_indicator}", flush=True)
+                # 显示进度（每50步显示一次，包含速度信息）
+                if actual_step // 50 != previous_step // 50:
+                    speed_indicator = f"[{self.speed_multiplier}x]" + (f" [{warp}步/帧]" if warp > 1 else "")
+                    progress_pct = (actual_step / steps * 100) if steps > 0 else 0
+                    print(f"  仿真进度: {actual_step}/{steps} 步 ({progress_pct:.1f}%) {speed_indicator}", flush=True)
             
-            time.sleep(adjusted_interval)  # 根据倍速调整间隔
+                # 本帧应占用 warp 个间隔，扣除已用的计算时间（收到控制消息时提前返回）
+                self._wait_for_control(max(0.0, warp * adjusted_interval - step_elapsed))
+        
+        finally:
+            self._stop_pipeline()
+            self._stop_output_thread()
+            self._stop_sharded_physics()
+            self._sync_state_dicts()
         
         # 输出仿真统计
         print(f"\n推演统计:")
         print(f"  目标步数: {steps}")
         print(f"  实际执行步数: {actual_step}")
-        print(f"  最大单步时间: {max_step_time*1000:.2f} 毫秒 ({max_step_time:.4f} 秒)")
+        print(f"  最大单帧时间: {max_step_time*1000:.2f} 毫秒 ({max_step_time:.4f} 秒)")
+        if self.settle_radius > 0 and self.n_grouped:
+            print(f"  休眠实体: {int(self.sleep_state[SLEEP_FLAG].sum())}/{self.n_grouped} 架")
+        if actual_step:
+            print(f"  输出帧数: {frames} | 时间倍率最大每帧 {max_warp} 步")
         if actual_step < steps:
             print(f"  提示: 由于暂停，未完成所有步数")
 
@@ -1670,48 +4530,38 @@ class DroneSimulation:
             'coverage': {}
         }
 
-        # Calculate average distance to target
-        total_distance = 0
-        for drone_id, position in self.drone_positions.items():
-            distance = np.sqrt((position[0] - self.target_area[0]) ** 2 +
-                               (position[1] - self.target_area[1]) ** 2)
-            total_distance += distance
-
-        metrics['avg_distance_to_target'] = total_distance / len(self.drone_positions)
-
-        # Calculate group cohesion (average distance between group members)
-        for group in self.allocation_result['task_groups']:
-            all_drones = group['defense_drones'] + group['attack_drones']
-            if len(all_drones) <= 1:
-                metrics['group_cohesion'][group['group_id']] = 0
-                continue
-
-            total_internal_dist = 0
-            pair_count = 0
+        # 平均目标距离和组内聚合度（成员间平均距离）均为向量化计算
+        avg_distance, cohesion = self._metrics_arrays()
+        metrics['avg_distance_to_target'] = avg_distance
+        for g, group in enumerate(self.allocation_result['task_groups']):
+            metrics['group_cohesion'][group['group_id']] = float(cohesion[g])
 
-            for i, drone1 in enumerate(all_drones):
-                for drone2 in all_drones[i + 1:]:
-                    pos1 = self.drone_positions[drone1]
-                    pos2 = self.drone_positions[drone2]
-                    dist = np.sqrt((pos1[0] - pos2[0]) ** 2 + (pos1[1] - pos2[1]) ** 2)
-                    total_internal_dist += dist
-                    pair_count += 1
-
-            if pair_count > 0:
-                metrics['group_cohesion'][group['group_id']] = total_internal_dist / pair_count
-            else:
-                metrics['group_cohesion'][group['group_id']] = 0
+        # 推演过程中的指标曲线
+        if self.metric_series is not None:
+            metrics['time_series'] = self.metric_series.as_dict()
 
         return metrics
 
-    def run_simulation(self, steps=100):
-        """Run the full simulation with pause/resume support"""
-        self.initialize_positions()
+    def run_simulation(self, steps=100, resume_from=None, checkpoint_path=None, record_dir=None):
+        """Run the full simulation with pause/resume support
+
+        Args:
+            resume_from: 检查点文件路径，提供时从检查点继续而不是重新初始化位置
+            checkpoint_path: 推演结束后写入检查点的文件路径
+            record_dir: 轨迹记录输出目录
+        """
+        if resume_from:
+            self.load_checkpoint(resume_from)
+            print(f"已从检查点恢复: {resume_from} (步数 {self.sim_step}, 时钟 {self.sim_time:.2f})", flush=True)
+        else:
+            self.initialize_positions()
+        if record_dir:
+            self.start_recording(record_dir)
         print("开始无人机仿真...", flush=True)
         
         # 统计飞机数量
         total_drones = len(self.drone_positions)
-        attack_drones = sum(1 for d in self.drone_positions.keys() if d.startswith('A'))
+        attack_drones = int(self.registry.is_attack.sum())
         defense_drones = total_drones - attack_drones
         print(f"  红方(攻击)飞机: {attack_drones} 架", flush=True)
         print(f"  蓝方(防御)飞机: {defense_drones} 架", flush=True)
@@ -1721,14 +4571,16 @@ class DroneSimulation:
         self._read_control_file()
         print(f"  初始状态: {'暂停' if self.is_paused else '运行'} | 倍速: {self.speed_multiplier}x", flush=True)
         
-        # 在Tacview中显示目标区域中心点（在第一帧之前发送）
+        # 目标区域中心点由Tacview服务器在客户端连接时发送（在第一帧之前）
         if self.tacview_streamer and self.tacview_streamer.is_connected:
-            self.tacview_streamer.send_target_area(self.target_area)
             print(f"  Tacview数据流已启动，使用批量发送模式（支持大规模飞机）", flush=True)
         
         print(f"\n提示: 可通过界面的暂停/继续按钮和倍速选择器实时控制推演\n", flush=True)
         
-        self.update_positions(steps)
+        try:
+            self.update_positions(steps)
+        finally:
+            self.stop_recording()
         metrics = self.calculate_performance_metrics()
 
         print("\n仿真性能指标:")
@@ -1736,24 +4588,291 @@ class DroneSimulation:
         print("\n组内聚合度 (成员间平均距离):")
         for group_id, cohesion in metrics['group_cohesion'].items():
             print(f"组 {group_id}: {cohesion:.2f} km")
+        if 'time_series' in metrics:
+            print(f"\n指标曲线: {len(metrics['time_series']['steps'])} 个采样点 (每 {self.metrics_interval} 步)")
+
+        if checkpoint_path:
+            start = time.time()
+            self.save_checkpoint(checkpoint_path)
+            print(f"检查点已保存: {checkpoint_path} ({(time.time() - start) * 1000:.1f} 毫秒)")
 
         print("\n仿真完成！")
         
+        self.close_control_channel()
+        
         # 关闭Tacview连接
         try:
             if self.tacview_streamer:
                 self.tacview_streamer.close()
             # 等待线程结束
-            if hasattr(self, 'tacview_thread') and self.tacview_thread.is_alive():
+            if self.tacview_thread and self.tacview_thread.is_alive():
                 self.tacview_thread.join(timeout=1)
         except Exception as e:
             # 忽略关闭时的错误
             pass
 
+    def export_acmi(self, path, steps=1000, frame_interval=1, resume_from=None, streamer=None, **recorder_options):
+        """离线导出ACMI文件：不启动Tacview服务器、不等待实时间隔，全速推演并写入输出帧
+
+        文件包含文件头、参考时间、目标区域和全部输出帧，可直接用Tacview打开回看。
+        默认每个物理步写一帧；frame_interval > 1 时只在输出步上发布快照和编码，其余步只做物理和指标。
+        实测（204 架，每步 0.01 秒仿真时间）：每步一帧约 480-540 步/秒，1 小时仿真（360000 步）
+        约需 11-12.5 分钟；每 10 步一帧约 880-900 步/秒，约 7 分钟；只做物理约 980 步/秒，
+        是导出速度的上限。1 小时的推演不能在几秒内导出。
+
+        Args:
+            path: 输出路径（.txt.acmi / .zip.acmi 可直接用Tacview打开；.gz 需先解压，见 AcmiRecorder）
+            steps: 推演步数
+            frame_interval: 每隔多少个物理步写一帧（默认1，每步一帧；10 即0.1秒仿真时间一帧；最后一步总是写入）
+            resume_from: 检查点文件路径，提供时从检查点继续
+            streamer: 已配置死区等参数的 TacviewStreamer（不启动服务器），省略时使用默认参数
+            recorder_options: 传给 AcmiRecorder 的轮转和 fsync 参数
+
+        Returns:
+            dict: 录制统计（文件、帧数、字节数）及推演步数、仿真时长和耗时
+        """
+        if resume_from:
+            self.load_checkpoint(resume_from)
+        else:
+            self.initialize_positions()
+        if streamer is None:
+            streamer = TacviewStreamer()
+        streamer.target_area = self.target_area
+        streamer.log_file_path = None
+        recorder = AcmiRecorder(path, **recorder_options)
+        streamer.attach_recorder(recorder)
+        live_streamer, self.tacview_streamer = self.tacview_streamer, streamer
+        
+        params = self._flight_params()
+        self._reserve_metric_series(steps)
+        if self.physics_workers and self.physics_workers > 1 and self.n_grouped:
+            self._start_sharded_physics(params)
+        
+        print('\n' + '=' * 70)
+        print(f'【离线导出ACMI】{path} | {steps} 步 | 每 {frame_interval} 步一帧 | {len(self.registry)} 架')
+        frame_interval = max(1, frame_interval)
+        start_time = time.time()
+        start_sim_time = self.sim_time
+        try:
+            for step in range(1, steps + 1):
+                self._physics_step(params)
+                self.sim_step += 1
+                self.sim_time += self.tacview_time_step
+                self._record_metrics()
+                if step % frame_interval == 0 or step == steps:
+                    self.frame_buffer.publish(self.sim_step, self.sim_time, self.state, self.registry)
+                    frame, values = self.frame_buffer.read()
+                    self._frames_emitted += 1
+                    self._send_tacview_frame(frame, values)
+                if step % 1000 == 0:
+                    print(f"  导出进度: {step}/{steps} 步 ({step / steps * 100:.1f}%)", flush=True)
+        finally:
+            self._stop_sharded_physics()
+            self._sync_state_dicts()
+            streamer.close()
+            self.tacview_streamer = live_streamer
+        elapsed = time.time() - start_time
+        
+        result = recorder.stats()
+        result.update({'steps': steps, 'sim_seconds': self.sim_time - start_sim_time, 'elapsed': elapsed})
+        print(f"  导出完成: {result['frames']} 帧 | {result['bytes'] / 1024 / 1024:.1f} MB (未压缩) | "
+              f"耗时 {elapsed:.2f} 秒 ({steps / elapsed if elapsed > 0 else 0:.0f} 步/秒)")
+        print('=' * 70 + '\n')
+        return result
+
 
 # 5. Main execution
+def send_control_command(port=10115, host='127.0.0.1', **fields):
+    """向运行中的推演发送控制消息，例如 send_control_command(paused=True)
+
+    消息为UDP/JSON，只包含需要修改的字段（paused, speed_multiplier）。
+    """
+    with socket(AF_INET, SOCK_DGRAM) as sock:
+        sock.sendto(json.dumps(fields).encode('utf-8'), (host, port))
+
+
+def _synthetic_registry(count):
+    """生成 count 架（红蓝各半）的合成实体注册表，用于基准测试"""
+    drone_types = {}
+    for k in range(count):
+        if k % 2 == 0:
+            drone_types[f'A{k // 2 + 1}'] = 'attack'
+        else:
+            drone_types[f'D{k // 2 + 1}'] = 'defense'
+    return EntityRegistry(drone_types)
+
+
+def benchmark_acmi_encoder(sizes=(100, 1000, 10000), frames=20, seed=0):
+    """ACMI编码基准：逐行格式化（send_drone_data + 拼接）、整帧向量化编码及省略静态属性后的吞吐量对比
+
+    省略静态属性的目标是减少字节数（10000 架时单帧约小 2.9x），不是编码时间：整帧编码的大部分
+    时间花在每个对象 7 个浮点字段（T= 的 6 个分量和 Mach）的 % 格式化上（1000 架以上约占 80%-85%），
+    省略静态属性只少复制模板中的常量部分，编码时间只快约 1.1-1.2x。format_seconds 单独测量
+    稳态帧中格式化数值的耗时。
+
+    Returns:
+        list: 每个规模一项，包含两种方式的单帧耗时 (秒) 和吞吐量 (字节/秒)
+    """
+    rng = np.random.default_rng(seed)
+    streamer = TacviewStreamer()
+    streamer.deadband_position = 0.0  # 基准数据每帧相同，关闭死区以测量编码本身
+    streamer.is_connected = True  # 没有客户端，只编码不发送
+    results = []
+    print('\n' + '=' * 70)
+    print('【ACMI编码基准】')
+    try:
+        for count in sizes:
+            registry = _synthetic_registry(count)
+            x = rng.uniform(0, 100, count)
+            y = rng.uniform(0, 100, count)
+            z = 1000 + rng.uniform(-50, 50, count)
+            vx = rng.uniform(-150, 150, count)
+            vy = rng.uniform(-150, 150, count)
+
+            start = time.perf_counter()
+            for f in range(frames):
+                lines = [streamer.send_drone_data(drone_id, (x[k], y[k], z[k]), (vx[k], vy[k], 0),
+                                                  registry.types[k], f * 0.01,
+                                                  object_id=registry.object_id_list[k], label=registry.labels[k])
+                         for k, drone_id in enumerate(registry.ids)]
+                legacy = (f'#{f * 0.01:.2f}\n' + ''.join(lines)).encode('utf-8')
+            legacy_time = (time.perf_counter() - start) / frames
+
+            streamer.elide_static = False
+            start = time.perf_counter()
+            for f in range(frames):
+                data = streamer.encode_frame(f * 0.01, registry, x, y, z, vx, vy)
+            encode_time = (time.perf_counter() - start) / frames
+
+            # 静态属性省略：首帧之后的稳态帧
+            streamer.elide_static = True
+            streamer.encode_frame(0.0, registry, x, y, z, vx, vy)
+            start = time.perf_counter()
+            for f in range(frames):
+                elided = streamer.encode_frame(f * 0.01, registry, x, y, z, vx, vy)
+            elided_time = (time.perf_counter() - start) / frames
+
+            # 只格式化数值（同一模板、同样数量的浮点字段），不含坐标换算和模板选择
+            template = streamer._short_template
+            args = rng.uniform(0, 100, 7 * count).tolist()
+            start = time.perf_counter()
+            for f in range(frames):
+                template % (f * 0.01, *args)
+            format_time = (time.perf_counter() - start) / frames
+
+            result = {
+                'objects': count,
+                'frame_bytes': len(data),
+                'legacy_seconds': legacy_time,
+                'legacy_bytes_per_second': len(legacy) / legacy_time,
+                'encoder_seconds': encode_time,
+                'encoder_bytes_per_second': len(data) / encode_time,
+                'elided_frame_bytes': len(elided),
+                'elided_seconds': elided_time,
+                'format_seconds': format_time
+            }
+            results.append(result)
+            print(f"  {count:>6} 架 | 单帧 {len(data) / 1024:.1f} KB | 逐行: {legacy_time * 1000:.2f} 毫秒 "
+                  f"({result['legacy_bytes_per_second'] / 1e6:.1f} MB/秒) | 整帧: {encode_time * 1000:.2f} 毫秒 "
+                  f"({result['encoder_bytes_per_second'] / 1e6:.1f} MB/秒) | 加速 {legacy_time / encode_time:.1f}x")
+            print(f"  {'':>6}   | 省略静态属性: 单帧 {len(elided) / 1024:.1f} KB, {elided_time * 1000:.2f} 毫秒 "
+                  f"(字节 {len(data) / len(elided):.1f}x, 编码 {encode_time / elided_time:.1f}x) | "
+                  f"其中格式化数值 {format_time * 1000:.2f} 毫秒 ({format_time / elided_time * 100:.0f}%)")
+    finally:
+        streamer.is_connected = False
+    print('=' * 70 + '\n')
+    return results
+
+
+def benchmark_tacview_stream(sizes=(10, 100, 1000, 10000), frames=100, port=58123, send_policy='block'):
+    """Tacview数据流基准：TacviewStreamer 经本地TCP推送给 FakeTacviewClient（独立进程），测量端到端性能
+
+    每个规模编码并发送 frames 帧随机运动的对象（关闭死区，每帧发送全部对象），统计帧率、
+    字节率、单帧编码时间以及编码开始到客户端收到该帧最后一个字节的延迟。
+    send_policy 为发送线程的队列策略（默认 block：不丢帧，编码受发送速度限制）。
+
+    Returns:
+        list: 每个规模一项（objects, fps, bytes_per_second, encode_seconds, latency_* 秒）
+    """
+    rng = np.random.default_rng(0)
+    results = []
+    print('\n' + '=' * 70)
+    print('【Tacview数据流基准】')
+    for count in sizes:
+        registry = _synthetic_registry(count)
+        x = rng.uniform(0, 100, count)
+        y = rng.uniform(0, 100, count)
+        z = 1000 + rng.uniform(-50, 50, count)
+        streamer = TacviewStreamer(local_port=port)
+        streamer.log_file_path = None
+        streamer.deadband_position = 0.0
+        if send_policy:
+            streamer.start_sender(8, send_policy)
+        ctx = mp.get_context()
+        receiver, sender = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_fake_client_worker, args=(port, sender), daemon=True)
+        try:
+            if not streamer.start_server():
+                print(f'  {count:>6} 架 | 无法监听端口 {port}，跳过')
+                continue
+            process.start()
+            deadline = time.time() + 10
+            while not streamer.is_connected and time.time() < deadline:
+                time.sleep(0.01)
+
+            produced = {}
+            encode_time = 0.0
+            for f in range(frames):
+                vx = rng.uniform(-150, 150, count)
+                vy = rng.uniform(-150, 150, count)
+                x += vx * 1e-4
+                y += vy * 1e-4
+                timestamp = round((f + 1) * 0.01, 2)
+                start = time.perf_counter()
+                data = streamer.encode_frame(timestamp, registry, x, y, z, vx, vy)
+                encode_time += time.perf_counter() - start
+                produced[timestamp] = start
+                streamer.send_encoded_frame(timestamp, data, count)
+        finally:
+            streamer.close()  # 发完剩余数据后关闭连接，客户端进程随之结束
+        received_frames, _, _ = receiver.recv() if receiver.poll(30) else ([], 0, 0)
+        process.join(5)
+        received = len(received_frames)
+
+        arrivals = [(produced[frame[0]], frame[4], frame[2]) for frame in received_frames if frame[0] in produced]
+        if not arrivals:
+            print(f'  {count:>6} 架 | 客户端未收到数据')
+            continue
+        latencies = np.array([done - start for start, done, _ in arrivals])
+        elapsed = arrivals[-1][1] - arrivals[0][0]
+        frame_bytes = sum(size for _, _, size in arrivals)
+        result = {
+            'objects': count,
+            'frames_sent': frames,
+            'frames_received': received,
+            'objects_received': received_frames[-1][1] if received_frames else 0,
+            'fps': len(arrivals) / elapsed if elapsed > 0 else 0.0,
+            'bytes_per_second': frame_bytes / elapsed if elapsed > 0 else 0.0,
+            'encode_seconds': encode_time / frames,
+            'latency_mean': float(latencies.mean()),
+            'latency_p50': float(np.percentile(latencies, 50)),
+            'latency_p95': float(np.percentile(latencies, 95)),
+            'latency_max': float(latencies.max())
+        }
+        results.append(result)
+        print(f"  {count:>6} 架 | 收到 {received}/{frames} 帧 | {result['fps']:.0f} 帧/秒 | "
+              f"{result['bytes_per_second'] / 1e6:.1f} MB/秒 | 编码 {result['encode_seconds'] * 1000:.2f} 毫秒 | "
+              f"延迟 平均 {result['latency_mean'] * 1000:.2f}, P50 {result['latency_p50'] * 1000:.2f}, "
+              f"P95 {result['latency_p95'] * 1000:.2f}, 最大 {result['latency_max'] * 1000:.2f} 毫秒")
+    print('=' * 70 + '\n')
+    return results
+
+
 def select_json_file():
     """使用文件对话框选择态势文件（JSON或XML）"""
+    import tkinter as tk
+    from tkinter import filedialog
+    
     # 创建一个隐藏的根窗口
     root = tk.Tk()
     root.withdraw()  # 隐藏主窗口
@@ -1782,16 +4901,93 @@ if __name__ == "__main__":
     print('=' * 70 + '\n')
     
     # 检查命令行参数
-    situation_file = None
-    control_file = 'simulation_control.json'  # 默认控制文件路径
+    parser = argparse.ArgumentParser(description='任务分配与推演系统')
+    parser.add_argument('situation_file', nargs='?', help='态势文件（JSON或XML），省略时弹出文件选择对话框')
+    parser.add_argument('control_file', nargs='?', default='simulation_control.json', help='推演控制文件路径')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='多进程分片物理的工作进程数（>1 时启用，按任务分组分片）')
+    parser.add_argument('--control-port', type=int, default=10115,
+                        help='本地UDP控制端口（JSON消息，0 表示只使用控制文件）')
+    parser.add_argument('--pretty-output', action='store_true',
+                        help='以缩进JSON格式保存 task_allocation_output.json（默认紧凑列式）')
+    parser.add_argument('--binary-output', action='store_true',
+                        help='同时保存二进制列式结果 task_allocation_output.npz')
+    parser.add_argument('--async-output', action='store_true',
+                        help='Tacview和态势广播在输出线程中读取每帧快照，步耗时不包含发送时间')
+    parser.add_argument('--pipeline', choices=StageQueue.POLICIES, default=None,
+                        help='启用物理→编码→发送输出流水线，并指定队列背压策略')
+    parser.add_argument('--pipeline-queue', type=int, default=4,
+                        help='输出流水线每个队列的容量（默认4）')
+    parser.add_argument('--max-warp-steps', type=int, default=100,
+                        help='高倍速时每个输出帧最多执行的物理步数（1 表示关闭时间倍率，默认100）')
+    parser.add_argument('--settle-radius', type=float, default=0.0,
+                        help='到达目标的编队无人机原地悬停的目标距离 (km)，0 表示关闭（默认0）')
+    parser.add_argument('--tacview-send-policy', choices=StageQueue.POLICIES + ('',), default='drop_oldest',
+                        help='Tacview发送线程的队列策略（默认 drop_oldest；空字符串表示在推演线程中直接发送）')
+    parser.add_argument('--tacview-queue', type=int, default=8, help='Tacview发送队列容量（默认8）')
+    parser.add_argument('--deadband-position', type=float, default=0.01,
+                        help='Tacview死区：水平位移阈值 (km)，0 表示每帧发送所有对象（默认0.01，'
+                             '配合 --settle-radius 抑制悬停无人机的重复更新）')
+    parser.add_argument('--deadband-angle', type=float, default=1.0,
+                        help='Tacview死区：航向变化阈值 (度，默认1.0)')
+    parser.add_argument('--keyframe-interval', type=int, default=50,
+                        help='Tacview关键帧间隔（帧），关键帧发送所有对象（默认50）')
+    parser.add_argument('--acmi-record', metavar='PATH',
+                        help='录制ACMI文件（.txt.acmi 纯文本，.zip.acmi / .gz 压缩），在后台线程写入；'
+                             'Tacview不能直接打开 .gz，需先解压为 .txt.acmi（--replay 可直接回放）')
+    parser.add_argument('--acmi-max-mb', type=float, default=0,
+                        help='ACMI录制文件按大小轮转 (MB，未压缩)，0 表示不轮转')
+    parser.add_argument('--acmi-max-seconds', type=float, default=0,
+                        help='ACMI录制文件按仿真时长轮转 (秒)，0 表示不轮转')
+    parser.add_argument('--acmi-fsync', type=float, default=0,
+                        help='ACMI录制 fsync 间隔 (秒)，0 表示只在关闭文件时 fsync')
+    parser.add_argument('--export-acmi', metavar='PATH',
+                        help='离线导出ACMI文件：不连接Tacview，全速推演后退出（可配合 --acmi-max-* 轮转）')
+    parser.add_argument('--export-steps', type=int, default=1000, help='离线导出的推演步数（默认1000）')
+    parser.add_argument('--export-frame-interval', type=int, default=1,
+                        help='离线导出时每隔多少步写一帧（默认1，每步一帧；10 表示每0.1秒仿真时间一帧，'
+                             '文件约小10倍，导出约快1.7倍）')
+    parser.add_argument('--replay', metavar='ACMI',
+                        help='回放录制的ACMI文件给Tacview客户端（不做任务分配和推演；控制端口支持 seek）')
+    parser.add_argument('--replay-speed', type=float, default=1.0, help='回放倍速（默认1.0）')
+    parser.add_argument('--replay-loop', action='store_true', help='回放到结尾后从头开始')
+    parser.add_argument('--benchmark-stream', action='store_true',
+                        help='运行Tacview数据流基准（本地模拟客户端，10/100/1000/10000架）后退出')
+    parser.add_argument('--benchmark-encoder', action='store_true',
+                        help='运行ACMI编码基准（100/1000/10000架）后退出')
+    parser.add_argument('--precompute-modes', action='store_true',
+                        help='启动时预计算全部三种任务模式（默认只计算当前模式，推演中切换时按需计算）')
+    parser.add_argument('--replicas', type=int, default=0,
+                        help='蒙特卡洛副本数：>0 时不做实时推演，批量推演 R 个随机初始化并输出指标分布')
+    parser.add_argument('--record', metavar='DIR', help='记录逐步轨迹到目录（压缩 .npz 分块）')
+    parser.add_argument('--resume', metavar='CHECKPOINT', help='从检查点文件继续推演')
+    parser.add_argument('--checkpoint', metavar='PATH', help='推演结束后保存检查点文件')
+    args = parser.parse_args()
+    
+    if args.benchmark_encoder:
+        benchmark_acmi_encoder()
+        sys.exit(0)
+    
+    if args.benchmark_stream:
+        benchmark_tacview_stream()
+        sys.exit(0)
     
-    if len(sys.argv) > 1:
-        situation_file = sys.argv[1]
+    if args.replay:
+        replay = AcmiReplayServer(args.replay, speed=args.replay_speed, loop=args.replay_loop,
+                                  control_port=args.control_port)
+        print(f"✓ 回放文件: {args.replay} | {len(replay)} 帧 ({replay.times[0]:.2f}s - {replay.times[-1]:.2f}s) | "
+              f"同步点 {len(replay.keyframes)} 个 | 索引耗时 {replay.index_time * 1000:.1f} 毫秒", flush=True)
+        replay.serve()
+        sys.exit(0)
+    
+    situation_file = args.situation_file
+    control_file = args.control_file  # 默认控制文件路径
+    
+    if situation_file:
         print(f"✓ 使用指定的态势文件: {situation_file}", flush=True)
         
         # 如果提供了第二个参数，作为控制文件路径
-        if len(sys.argv) > 2:
-            control_file = sys.argv[2]
+        if control_file != 'simulation_control.json':
             print(f"✓ 使用指定的控制文件: {control_file}", flush=True)
     else:
         # 弹出文件选择对话框
@@ -1816,13 +5012,59 @@ if __name__ == "__main__":
         print('-' * 70, flush=True)
         
         # 执行任务分配
-        allocation_result = execute_task_allocation(situation_file)
+        startup_timings = {'import': _IMPORT_ELAPSED}
+        allocation_result = execute_task_allocation(situation_file, timings=startup_timings,
+                                                    precompute_modes=args.precompute_modes)
         
-        # 保存结果到JSON文件
-        with open('task_allocation_output.json', 'w', encoding='utf-8') as f:
-            json.dump(allocation_result, f, indent=2, ensure_ascii=False)
+        # 保存结果到JSON文件（默认紧凑列式，--pretty-output 写原来的缩进格式）
+        save_stats = write_allocation_output(allocation_result, 'task_allocation_output.json',
+                                             pretty=args.pretty_output, sidecar=args.binary_output)
+        startup_timings['save'] = save_stats['seconds'] + save_stats.get('sidecar_seconds', 0.0)
         
-        print(f"\n✓ 任务分配完成，结果已保存到 task_allocation_output.json", flush=True)
+        print(f"\n✓ 任务分配完成，结果已保存到 task_allocation_output.json "
+              f"({'缩进' if args.pretty_output else '紧凑列式'}格式, {save_stats['bytes'] / 1024:.1f} KB, "
+              f"{save_stats['seconds'] * 1000:.1f} 毫秒)", flush=True)
+        if 'sidecar_path' in save_stats:
+            print(f"  二进制文件: {save_stats['sidecar_path']} ({save_stats['sidecar_bytes'] / 1024:.1f} KB, "
+                  f"{save_stats['sidecar_seconds'] * 1000:.1f} 毫秒)", flush=True)
+
+        if args.replicas > 0:
+            # 批量蒙特卡洛推演（无Tacview、无延时）
+            print('\n' + '-' * 70, flush=True)
+            print(f'【步骤2】批量蒙特卡洛推演（{args.replicas} 个副本）...', flush=True)
+            print('-' * 70, flush=True)
+            simulation = DroneSimulation(allocation_result, control_file_path=control_file,
+                                         enable_status_broadcast=False, enable_tacview=False)
+            simulation.settle_radius = args.settle_radius
+            replica_result = simulation.run_replicas(args.replicas, steps=1000)
+            print(f"\n副本数: {replica_result['replicas']} | 步数: {replica_result['steps']} | "
+                  f"耗时: {replica_result['elapsed']:.2f} 秒", flush=True)
+            for name, label in (('avg_distance_to_target', '到目标的平均距离'),
+                                ('mean_group_cohesion', '平均组内聚合度')):
+                summary = replica_result['summary'][name]
+                print(f"{label}: 均值 {summary['mean']:.2f} km | 标准差 {summary['std']:.2f} | "
+                      f"P5 {summary['p5']:.2f} | P50 {summary['p50']:.2f} | P95 {summary['p95']:.2f}", flush=True)
+            sys.exit(0)
+
+        if args.export_acmi:
+            # 离线导出ACMI（无Tacview服务器、无实时等待）
+            print('\n' + '-' * 70, flush=True)
+            print('【步骤2】离线导出ACMI...', flush=True)
+            print('-' * 70, flush=True)
+            simulation = DroneSimulation(allocation_result, control_file_path=control_file,
+                                         physics_workers=args.workers, enable_status_broadcast=False,
+                                         enable_tacview=False)
+            simulation.settle_radius = args.settle_radius
+            simulation.situation_file = situation_file
+            streamer = TacviewStreamer()
+            streamer.deadband_position = args.deadband_position
+            streamer.deadband_angle = args.deadband_angle
+            streamer.keyframe_interval = args.keyframe_interval
+            simulation.export_acmi(args.export_acmi, steps=args.export_steps,
+                                   frame_interval=args.export_frame_interval, resume_from=args.resume,
+                                   streamer=streamer, max_bytes=int(args.acmi_max_mb * 1024 * 1024),
+                                   max_seconds=args.acmi_max_seconds, fsync_interval=args.acmi_fsync)
+            sys.exit(0)
 
         # 运行仿真
         print('\n' + '-' * 70, flush=True)
@@ -1835,10 +5077,28 @@ if __name__ == "__main__":
         print('  4. 点击 Connect', flush=True)
         print('  5. 返回本程序等待连接...\n', flush=True)
         
-        simulation = DroneSimulation(allocation_result, control_file_path=control_file)
+        acmi_recorder = None
+        if args.acmi_record:
+            acmi_recorder = AcmiRecorder(args.acmi_record, max_bytes=int(args.acmi_max_mb * 1024 * 1024),
+                                         max_seconds=args.acmi_max_seconds, fsync_interval=args.acmi_fsync)
+        simulation = DroneSimulation(allocation_result, control_file_path=control_file,
+                                     physics_workers=args.workers, control_port=args.control_port,
+                                     async_output=args.async_output, output_pipeline=args.pipeline,
+                                     pipeline_queue_size=args.pipeline_queue,
+                                     tacview_send_policy=args.tacview_send_policy or None,
+                                     tacview_queue_size=args.tacview_queue, acmi_recorder=acmi_recorder)
+        simulation.startup_timings = startup_timings
+        simulation.max_warp_steps = args.max_warp_steps
+        simulation.settle_radius = args.settle_radius
+        simulation.situation_file = situation_file
+        if simulation.tacview_streamer:
+            simulation.tacview_streamer.deadband_position = args.deadband_position
+            simulation.tacview_streamer.deadband_angle = args.deadband_angle
+            simulation.tacview_streamer.keyframe_interval = args.keyframe_interval
         
         # 使用默认的仿真步数（减少步数以配合较长的间隔时间）
-        simulation.run_simulation(steps=1000)
+        simulation.run_simulation(steps=1000, resume_from=args.resume, checkpoint_path=args.checkpoint,
+                                  record_dir=args.record)
         
         print('\n' + '=' * 70)
         print('✓✓✓ 仿真推演完成 ✓✓✓')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试整帧ACMI编码：与逐行格式化（send_drone_data）输出一致，静态属性省略和关键帧
+"""
+
+import numpy as np
+
+import task_allocation as ta
+
+
+def build_frame(count, seed=0):
+    """合成注册表和一帧状态（前 5 架速度为零）"""
+    rng = np.random.default_rng(seed)
+    registry = ta._synthetic_registry(count)
+    x = rng.uniform(0, 100, count)
+    y = rng.uniform(0, 100, count)
+    z = 1000 + rng.uniform(-50, 50, count)
+    vx = rng.uniform(-150, 150, count)
+    vy = rng.uniform(-150, 150, count)
+    vx[:5] = vy[:5] = 0.0
+    return registry, x, y, z, vx, vy
+
+
+def split_line(line):
+    """对象行拆成 (对象ID, T= 的 6 个分量, 其余属性)"""
+    object_id, rest = line.split(',T=', 1)
+    transform, _, properties = rest.partition(',')
+    return object_id, [float(v) for v in transform.split('|')], properties
+
+
+def new_streamer():
+    streamer = ta.TacviewStreamer()
+    streamer.log_file_path = None
+    streamer.deadband_position = 0.0
+    return streamer
+
+
+def test_encode_matches_line_format(count=50):
+    """完整属性的整帧编码与逐行格式化的对象、坐标、航向和属性一致（roll/pitch 为随机显示噪声）"""
+    registry, x, y, z, vx, vy = build_frame(count)
+    streamer = new_streamer()
+    streamer.elide_static = False
+    streamer.is_connected = True  # 没有客户端，只编码不发送
+    try:
+        frame = streamer.encode_frame(1.5, registry, x, y, z, vx, vy).decode('utf-8').splitlines()
+        lines = ''.join(streamer.send_drone_data(drone_id, (x[k], y[k], z[k]), (vx[k], vy[k], 0),
+                                                 registry.types[k], 1.5, object_id=registry.object_id_list[k],
+                                                 label=registry.labels[k])
+                        for k, drone_id in enumerate(registry.ids)).splitlines()
+    finally:
+        streamer.is_connected = False
+    assert frame[0] == '#1.50'
+    assert len(frame) - 1 == len(lines) == count
+    for encoded, expected in zip(frame[1:], lines):
+        encoded_id, encoded_t, encoded_props = split_line(encoded)
+        expected_id, expected_t, expected_props = split_line(expected)
+        assert encoded_id == expected_id
+        assert np.allclose([encoded_t[k] for k in (0, 1, 2, 5)], [expected_t[k] for k in (0, 1, 2, 5)],
+                           rtol=0, atol=1e-6), encoded_id
+        assert all(-5 <= v <= 5 for v in encoded_t[3:5])
+        assert encoded_props == expected_props
+
+
+def test_static_elision():
+    """静态属性只在首帧发送；请求关键帧后重新发送全部对象的静态属性"""
+    registry, x, y, z, vx, vy = build_frame(20)
+    streamer = new_streamer()
+    first = streamer.encode_frame(0.01, registry, x, y, z, vx, vy)
+    steady = streamer.encode_frame(0.02, registry, x, y, z, vx, vy)
+    streamer.request_keyframe()
+    keyframe = streamer.encode_frame(0.03, registry, x, y, z, vx, vy)
+    assert first.count(b'Type=') == 20
+    assert steady.count(b'\n') - 1 == 20 and b'Type=' not in steady
+    assert keyframe.keyframe_seq is not None and keyframe.count(b'Type=') == 20
+    for line in steady.decode('utf-8').splitlines()[1:]:
+        assert split_line(line)[2].startswith('Mach=')
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试整帧ACMI编码")
+    print("=" * 70)
+    test_encode_matches_line_format()
+    print("\n✓ 整帧编码与逐行格式一致性测试成功！")
+    test_static_elision()
+    print("\n✓ 静态属性省略测试成功！")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试ACMI录制：输出流水线丢帧时的关键帧请求和文件轮转
+"""
+
+import os
+import tempfile
+import time
+
+import task_allocation as ta
+
+SITUATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'situation3.json')
+
+
+def build_simulation(**options):
+    """按 situation3.json 建立推演（不启动Tacview服务器和态势广播）并初始化位置"""
+    allocation_result = ta.execute_task_allocation(SITUATION_FILE)
+    simulation = ta.DroneSimulation(allocation_result, enable_status_broadcast=False, enable_tacview=False,
+                                    control_file_path=os.devnull, seed=3, **options)
+    simulation.initialize_positions()
+    return simulation
+
+
+def read_acmi(path):
+    """读取纯文本ACMI文件，返回按 '#时间' 切分的帧列表（第一项为文件头）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().split('\n#')
+
+
+def test_pipeline_rotation(sim_seconds=20.0, max_seconds=1.0):
+    """coalesce 流水线在发送阶段前不断丢帧时，录制仍按仿真时间轮转，每个文件都从关键帧开始"""
+    simulation = build_simulation(output_pipeline='coalesce', pipeline_queue_size=2)
+    streamer = ta.TacviewStreamer()
+    streamer.log_file_path = None
+    streamer.target_area = simulation.target_area
+    simulation.tacview_streamer = streamer
+
+    # 发送阶段比编码阶段慢：编码好的帧（包括请求的关键帧）在流水线队列中被合并丢弃
+    send_encoded_frame = streamer.send_encoded_frame
+
+    def slow_send(*args):
+        time.sleep(0.002)
+        return send_encoded_frame(*args)
+
+    streamer.send_encoded_frame = slow_send
+
+    with tempfile.TemporaryDirectory() as tmp:
+        recorder = ta.AcmiRecorder(os.path.join(tmp, 'pipeline.txt.acmi'), max_seconds=max_seconds)
+        streamer.attach_recorder(recorder)
+        params = simulation._flight_params()
+        simulation._start_pipeline()
+        try:
+            while simulation.sim_time < sim_seconds:
+                simulation._physics_step(params)
+                simulation.sim_step += 1
+                simulation.sim_time += simulation.tacview_time_step
+                simulation.frame_buffer.publish(simulation.sim_step, simulation.sim_time,
+                                                simulation.state, simulation.registry)
+                simulation.pipeline.submit(simulation.frame_buffer.read())
+        finally:
+            simulation._stop_pipeline()
+            streamer.close()
+
+        send_queue = simulation.pipeline_stats['stages'][2]['queue']
+        print(f"  发送阶段入口队列丢帧: {send_queue['dropped']}/{send_queue['puts']}")
+        print(f"  录制文件: {len(recorder.files)} 个 | 写入 {recorder.frames_written} 帧")
+        assert send_queue['dropped'] > 0
+        assert len(recorder.files) >= 0.8 * sim_seconds / max_seconds
+
+        objects = len(simulation.registry)
+        for path in recorder.files:
+            frames = read_acmi(path)
+            assert len(frames) > 1, f'{path} 没有帧'
+            assert frames[1].count('Type=') == objects, f'{path} 的第一帧不是关键帧'
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试ACMI录制（输出流水线丢帧 + 文件轮转）")
+    print("=" * 70)
+    test_pipeline_rotation()
+    print("\n✓ 流水线丢帧下的录制轮转测试成功！")
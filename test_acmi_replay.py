@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试ACMI回放：帧索引、关键帧、跳转和新客户端加入的同步帧，以及空文件
+"""
+
+import gzip
+import os
+import tempfile
+from threading import Thread
+
+import numpy as np
+
+import task_allocation as ta
+
+REPLAY_PORT = 58123
+
+
+def record_growing(path, frames=100, switch=50, requested=(20, 70)):
+    """录制合成数据：前 switch 帧 10 架，之后 20 架（新增对象中途出现），在 requested 帧请求关键帧
+
+    关闭死区：每帧都包含全部对象（只含动态字段），行数与关键帧相同。
+    返回每帧的对象ID列表。
+    """
+    small, large = ta._synthetic_registry(10), ta._synthetic_registry(20)
+    streamer = ta.TacviewStreamer()
+    streamer.log_file_path = None
+    streamer.deadband_position = 0.0
+    recorder = ta.AcmiRecorder(path, keyframe_seconds=0)
+    streamer.attach_recorder(recorder)
+    alive = []
+    try:
+        for k in range(frames):
+            registry = small if k < switch else large
+            if k in requested:
+                streamer.request_keyframe()
+            n = len(registry)
+            x = np.linspace(0, 50, n) + 0.01 * k
+            y = np.linspace(0, 50, n)
+            data = streamer.encode_frame(0.1 * (k + 1), registry, x, y, np.full(n, 1000.0), np.ones(n), np.ones(n))
+            streamer.send_encoded_frame(0.1 * (k + 1), data, n)
+            alive.append(list(registry.object_id_list))
+    finally:
+        streamer.close()
+    return alive
+
+
+def full_objects(data):
+    """同步帧中带完整属性（Type=）的对象ID集合"""
+    return {line.split(',', 1)[0] for line in data.decode('utf-8').splitlines() if 'Type=' in line}
+
+
+def test_keyframe_index():
+    """关键帧按录制时的标记识别；任意一帧的同步帧都包含当时所有对象的完整属性"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'growing.txt.acmi')
+        alive = record_growing(path)
+        replay = ta.AcmiReplayServer(path, local_port=REPLAY_PORT)
+        try:
+            assert len(replay) == len(alive)
+            assert replay.keyframes.tolist() == [0, 20, 70]
+            assert replay.object_counts.tolist() == [len(object_ids) for object_ids in alive]
+            assert replay.header.startswith('FileType=text/acmi/tacview')
+            assert ta.AcmiRecorder.KEYFRAME_MARKER.decode('utf-8') not in replay.header
+            for k, object_ids in enumerate(alive):
+                assert replay.frame_at(replay.times[k]) == k
+                data = bytes(replay._sync_frame(k, None))
+                assert data.count(b'#') == 1 and b'//' not in data, k
+                assert full_objects(data) >= set(map(str, object_ids)), f'第 {k} 帧的同步帧缺少静态属性'
+        finally:
+            replay._unload()
+
+
+def test_late_join_and_seek(speed=10.0):
+    """回放中途加入的客户端和跳转后收到的第一帧正是该时刻的同步帧"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'growing.txt.acmi')
+        alive = record_growing(path)
+        replay = ta.AcmiReplayServer(path, speed=speed, local_port=REPLAY_PORT)
+        server = Thread(target=replay.serve, kwargs={'duration': 10.0}, daemon=True)
+        server.start()
+        first = ta.FakeTacviewClient(port=REPLAY_PORT, name='first')
+        late = ta.FakeTacviewClient(port=REPLAY_PORT, name='late')
+        try:
+            assert first.connect()
+            first.start()
+            assert first.wait_for_frames(60) >= 60
+            replay.seek(5.55)
+            assert late.connect()
+            late.start()
+            server.join()
+        finally:
+            first.close()
+            late.close()
+
+        # 另建索引计算期望的同步帧（回放结束时已释放文件）
+        index = ta.AcmiReplayServer(path, local_port=REPLAY_PORT)
+        try:
+            def sync_objects(timestamp):
+                return bytes(index._sync_frame(index.frame_at(timestamp), None)).count(b',T=')
+
+            assert replay.seeks == 1
+            # 跳转后（时间戳回退）的第一帧
+            times = [frame[0] for frame in first.frames]
+            jump = next(i for i in range(1, len(times)) if times[i] < times[i - 1])
+            assert times[jump] == 5.5
+            assert first.frames[jump][1] == sync_objects(5.5)
+            assert late.header_lines and late.header_lines[0].startswith('FileType=')
+            assert late.frames[0][1] == sync_objects(late.frames[0][0])
+            assert set(late.objects) == {str(object_id).encode('utf-8') for object_id in alive[-1]}
+        finally:
+            index._unload()
+
+
+def test_empty_recording():
+    """空文件和只有文件头的文件报告没有帧（ValueError）"""
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {
+            'empty.txt.acmi': b'',
+            'empty.gz': gzip.compress(b''),
+            'header.txt.acmi': b'FileType=text/acmi/tacview\nFileVersion=2.1\n',
+        }
+        for name, content in paths.items():
+            path = os.path.join(tmp, name)
+            with open(path, 'wb') as f:
+                f.write(content)
+            try:
+                ta.AcmiReplayServer(path)
+            except ValueError as e:
+                assert '没有 #时间戳 帧' in str(e), e
+            else:
+                raise AssertionError(f'{name} 应当报告没有帧')
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试ACMI回放")
+    print("=" * 70)
+    test_keyframe_index()
+    print("\n✓ 关键帧索引和同步帧测试成功！")
+    test_late_join_and_seek()
+    print("\n✓ 中途加入和跳转测试成功！")
+    test_empty_recording()
+    print("\n✓ 空录制文件测试成功！")
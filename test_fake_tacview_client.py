@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试本地模拟Tacview客户端：数据流按任意位置分块到达时的解析，以及数据流吞吐量基准
+"""
+
+import numpy as np
+
+import task_allocation as ta
+
+BENCHMARK_PORT = 58126
+
+
+def sample_stream(count=8, frames=5):
+    """文件头 + frames 帧（第一帧带完整属性）的ACMI数据流"""
+    registry = ta._synthetic_registry(count)
+    streamer = ta.TacviewStreamer()
+    streamer.log_file_path = None
+    streamer.deadband_position = 0.0
+    streamer.target_area = (50, 50)
+    x = np.linspace(0, 50, count)
+    y = np.linspace(0, 50, count)
+    data = streamer._stream_header().encode('utf-8')
+    for k in range(frames):
+        data += streamer.encode_frame(0.1 * (k + 1), registry, x + k, y, np.full(count, 1000.0),
+                                      np.ones(count), np.ones(count))
+    return data
+
+
+def parse(data, chunk_size):
+    client = ta.FakeTacviewClient()
+    for offset in range(0, len(data), chunk_size):
+        client._parse(data[offset:offset + chunk_size], float(offset))
+    return client
+
+
+def test_parse_split_chunks(count=8, frames=5):
+    """按任意大小分块到达时，文件头、帧数、每帧对象数、字节数和对象位置与一次到达相同"""
+    data = sample_stream(count, frames)
+    whole = parse(data, len(data))
+    assert whole.header_lines[0].startswith('FileType=')
+    assert any('Type=Ground+Static+Building' in line for line in whole.header_lines)
+    assert [round(frame[0], 2) for frame in whole.frames] == [round(0.1 * (k + 1), 2) for k in range(frames)]
+    assert [frame[1] for frame in whole.frames] == [count] * frames
+    assert sum(frame[2] for frame in whole.frames) + len('\n'.join(whole.header_lines)) + 1 == len(data)
+    assert len(whole.objects) == count
+    for chunk_size in (1, 7, 64, 1000):
+        split = parse(data, chunk_size)
+        assert split.header_lines == whole.header_lines, chunk_size
+        assert [frame[:3] for frame in split.frames] == [frame[:3] for frame in whole.frames], chunk_size
+        assert split.objects == whole.objects, chunk_size
+        assert split.bytes_received == len(data)
+
+
+def test_stream_benchmark(sizes=(10, 200), frames=30):
+    """block 策略下客户端收到全部帧和全部对象，统计值有效"""
+    results = ta.benchmark_tacview_stream(sizes=sizes, frames=frames, port=BENCHMARK_PORT)
+    assert [result['objects'] for result in results] == list(sizes)
+    for result in results:
+        assert result['frames_received'] == frames
+        assert result['objects_received'] == result['objects']
+        assert result['fps'] > 0 and result['bytes_per_second'] > 0
+        assert 0 <= result['latency_p50'] <= result['latency_p95'] <= result['latency_max']
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试本地模拟Tacview客户端")
+    print("=" * 70)
+    test_parse_split_chunks()
+    print("\n✓ 分块数据流解析测试成功！")
+    test_stream_benchmark()
+    print("\n✓ 数据流吞吐量基准测试成功！")
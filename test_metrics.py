@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试性能指标：向量化的目标距离和组内聚合度与原来的逐对循环一致，推演中按间隔记录时间序列
+"""
+
+import os
+
+import numpy as np
+
+import task_allocation as ta
+
+SITUATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'situation.json')
+
+
+def loop_metrics(simulation):
+    """原来的逐对循环实现（推演结束时计算一次）"""
+    positions = simulation.drone_positions
+    target = simulation.target_area
+    avg_distance = sum(np.sqrt((p[0] - target[0]) ** 2 + (p[1] - target[1]) ** 2)
+                       for p in positions.values()) / len(positions)
+    cohesion = {}
+    for group in simulation.allocation_result['task_groups']:
+        all_drones = group['defense_drones'] + group['attack_drones']
+        total, pairs = 0.0, 0
+        for i, drone1 in enumerate(all_drones):
+            for drone2 in all_drones[i + 1:]:
+                pos1, pos2 = positions[drone1], positions[drone2]
+                total += np.sqrt((pos1[0] - pos2[0]) ** 2 + (pos1[1] - pos2[1]) ** 2)
+                pairs += 1
+        cohesion[group['group_id']] = total / pairs if pairs else 0
+    return avg_distance, cohesion
+
+
+def test_metrics_match_loop(steps=100):
+    """推演若干步后，向量化指标与逐对循环的结果一致（求和顺序不同，允许舍入误差）"""
+    allocation_result = ta.execute_task_allocation(SITUATION_FILE)
+    simulation = ta.DroneSimulation(allocation_result, enable_status_broadcast=False, enable_tacview=False,
+                                    control_file_path=os.devnull, seed=3)
+    simulation.initialize_positions()
+    simulation.advance(steps)
+
+    metrics = simulation.calculate_performance_metrics()
+    avg_distance, cohesion = loop_metrics(simulation)
+    assert np.isclose(metrics['avg_distance_to_target'], avg_distance, rtol=1e-12)
+    assert metrics['group_cohesion'].keys() == cohesion.keys()
+    for group_id, value in cohesion.items():
+        assert np.isclose(metrics['group_cohesion'][group_id], value, rtol=1e-12), group_id
+    assert any(value > 0 for value in cohesion.values())
+
+    # 每 metrics_interval 步一个采样点，最后一个采样点就是当前状态
+    series = metrics['time_series']
+    assert series['steps'].tolist() == list(range(simulation.metrics_interval, steps + 1,
+                                                  simulation.metrics_interval))
+    assert np.isclose(series['avg_distance_to_target'][-1], avg_distance, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试性能指标")
+    print("=" * 70)
+    test_metrics_match_loop()
+    print("\n✓ 向量化指标与逐对循环一致性测试成功！")
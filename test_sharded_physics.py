@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试多进程分片物理：与单进程计算逐位一致（包括休眠判断的节拍）
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+import task_allocation as ta
+
+SITUATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'situation.json')
+
+
+def build_simulation(allocation_result, workers=0, seed=3):
+    """建立推演（不启动Tacview服务器和态势广播）"""
+    return ta.DroneSimulation(allocation_result, enable_status_broadcast=False, enable_tacview=False,
+                              control_file_path=os.devnull, seed=seed, physics_workers=workers)
+
+
+def advance(simulation, steps):
+    """推进 steps 步：physics_workers > 1 时使用多进程分片"""
+    if simulation.physics_workers > 1:
+        simulation._start_sharded_physics(simulation._flight_params())
+        assert simulation.sharded_physics is not None, '多进程分片未启动'
+    try:
+        simulation.advance(steps)
+    finally:
+        simulation._stop_sharded_physics()
+
+
+def test_sharded_matches_single(steps=300):
+    """不开启休眠时，2 个进程分片推进的状态与单进程逐位一致"""
+    allocation_result = ta.execute_task_allocation(SITUATION_FILE)
+    states = []
+    for workers in (0, 2):
+        simulation = build_simulation(allocation_result, workers=workers)
+        simulation.initialize_positions()
+        advance(simulation, steps)
+        assert simulation.sim_step == steps
+        states.append(simulation.state.copy())
+    single, sharded = states
+    assert np.isfinite(single).all()
+    assert np.array_equal(single, sharded)
+
+
+def test_resume_settle_sharded(resume_step=37, steps=600):
+    """从步数不是 settle_check_interval 整数倍的检查点继续，分片与单进程的状态逐位一致"""
+    allocation_result = ta.execute_task_allocation(SITUATION_FILE)
+    origin = build_simulation(allocation_result)
+    origin.settle_radius = 8.0
+    origin.initialize_positions()
+    origin.advance(resume_step)
+    assert resume_step % origin.settle_check_interval
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, 'resume.npz')
+        origin.save_checkpoint(checkpoint)
+        results = []
+        for workers in (0, 2):
+            simulation = build_simulation(allocation_result, workers=workers)
+            simulation.settle_radius = 8.0
+            simulation.load_checkpoint(checkpoint)
+            assert simulation.sim_step == resume_step
+            advance(simulation, steps)
+            results.append((simulation.state.copy(), simulation.sleep_state.copy()))
+
+    (single_state, single_sleep), (sharded_state, sharded_sleep) = results
+    settled = int(single_sleep[ta.SLEEP_FLAG].sum())
+    print(f"  休眠: {settled}/{single_sleep.shape[1]} 架")
+    assert settled > 0
+    assert np.array_equal(single_state, sharded_state)
+    assert np.array_equal(single_sleep, sharded_sleep)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试多进程分片物理")
+    print("=" * 70)
+    test_sharded_matches_single()
+    print("\n✓ 分片与单进程推演一致性测试成功！")
+    test_resume_settle_sharded()
+    print("\n✓ 检查点继续后的分片休眠判断测试成功！")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试Tacview死区：真实推演输出中的抑制比例，以及流水线丢帧后的重新同步
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+import task_allocation as ta
+
+SITUATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'situation.json')
+
+
+def frame_objects(data):
+    """一帧ACMI数据中的对象行数（第一行为 '#时间'）"""
+    return data.count(b'\n') - 1
+
+
+def test_deadband_settled_drones(steps=3000, frame_interval=10):
+    """开启休眠后，到达目标悬停的无人机位置不变，死区抑制大部分对象更新"""
+    allocation_result = ta.execute_task_allocation(SITUATION_FILE)
+    simulation = ta.DroneSimulation(allocation_result, enable_status_broadcast=False, enable_tacview=False,
+                                    control_file_path=os.devnull, seed=3)
+    simulation.settle_radius = 8.0
+    streamer = ta.TacviewStreamer()
+    with tempfile.TemporaryDirectory() as tmp:
+        result = simulation.export_acmi(os.path.join(tmp, 'deadband.txt.acmi'), steps=steps,
+                                        frame_interval=frame_interval, streamer=streamer)
+    total = streamer.updates_sent + streamer.updates_suppressed
+    ratio = streamer.updates_suppressed / total
+    print(f"  休眠: {int(simulation.sleep_state[ta.SLEEP_FLAG].sum())}/{simulation.n_grouped} 架 | "
+          f"死区抑制 {streamer.updates_suppressed}/{total} ({ratio * 100:.1f}%) | {result['bytes'] / 1024:.0f} KB")
+    assert ratio > 0.5
+
+
+def test_pipeline_drop_resync(count=100):
+    """增量帧在流水线中被丢弃后，下一帧发送全部对象"""
+    registry = ta._synthetic_registry(count)
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 100, count)
+    y = rng.uniform(0, 100, count)
+    z = np.full(count, 1000.0)
+    v = np.zeros(count)
+    streamer = ta.TacviewStreamer()
+    streamer.log_file_path = None
+
+    first = streamer.encode_frame(0.01, registry, x, y, z, v, v)
+    assert frame_objects(first) == count
+
+    # 只移动前 10 架：增量帧只包含这 10 架
+    x[:10] += 1.0
+    delta = streamer.encode_frame(0.02, registry, x, y, z, v, v)
+    assert frame_objects(delta) == 10
+
+    # 增量帧被丢弃：这 10 架的新位置没有到达客户端，下一帧（位置不变）要重新发送全部对象
+    streamer.frame_dropped(delta)
+    resync = streamer.encode_frame(0.03, registry, x, y, z, v, v)
+    assert frame_objects(resync) == count
+    assert frame_objects(streamer.encode_frame(0.04, registry, x, y, z, v, v)) == 0
+    streamer.close()
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试Tacview死区")
+    print("=" * 70)
+    test_deadband_settled_drones()
+    print("\n✓ 真实推演输出的死区抑制测试成功！")
+    test_pipeline_drop_resync()
+    print("\n✓ 流水线丢帧后的死区重新同步测试成功！")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试Tacview发送线程：有界队列的背压策略，发送慢时推演线程不被阻塞
+"""
+
+import time
+from threading import Thread
+
+import task_allocation as ta
+
+
+def test_queue_policies():
+    """block 等待消费者，drop_oldest 丢弃最旧的项，coalesce 只保留最新一项；丢弃的项交给 on_drop"""
+    dropped = []
+    queue = ta.StageQueue(2, 'drop_oldest', on_drop=dropped.append)
+    for item in range(1, 6):
+        queue.put(item)
+    assert list(queue.items) == [4, 5] and dropped == [1, 2, 3]
+    assert queue.stats()['dropped'] == 3 and queue.stats()['max_depth'] == 2
+
+    dropped.clear()
+    queue = ta.StageQueue(2, 'coalesce', on_drop=dropped.append)
+    for item in range(1, 4):
+        queue.put(item)
+    assert list(queue.items) == [3] and dropped == [1, 2]
+
+    queue = ta.StageQueue(2, 'block')
+    producer = Thread(target=lambda: [queue.put(item) for item in range(1, 4)])
+    producer.start()
+    time.sleep(0.1)
+    assert producer.is_alive()  # 队列满，第三项等待
+    assert queue.get() == 1
+    producer.join(timeout=2)
+    queue.close()
+    assert [queue.get(), queue.get(), queue.get()] == [2, 3, None]
+    assert queue.stats()['dropped'] == 0 and queue.stats()['blocked_time'] > 0
+
+    try:
+        ta.StageQueue(2, 'unknown')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('未知策略应当报错')
+
+
+def test_slow_viewer_does_not_block(frames=100, send_time=0.01):
+    """发送比推演慢时 drop_oldest 丢弃积压的帧，推演线程放入帧不等待；丢帧后下一帧重新同步"""
+    streamer = ta.TacviewStreamer()
+    streamer.log_file_path = None
+    streamer.is_connected = True  # 没有真实客户端：替换 _write_frame 模拟慢速发送
+    written = []
+
+    def slow_write(timestamp, encoded_data, drone_count):
+        time.sleep(send_time)
+        written.append(timestamp)
+        return True
+
+    streamer._write_frame = slow_write
+    streamer.start_sender(4, 'drop_oldest')
+    start = time.perf_counter()
+    for k in range(frames):
+        assert streamer.send_encoded_frame(k * 0.01, ta.EncodedFrame(b'#%.2f\n' % (k * 0.01), k), 0)
+    submit_time = time.perf_counter() - start
+    resync = streamer._resync_positions
+    streamer.stop_sender()
+    stats = streamer.sender_stats()
+    streamer.is_connected = False
+
+    print(f"  放入 {frames} 帧耗时 {submit_time * 1000:.1f} 毫秒 | 发送 {stats['frames_written']} 帧, "
+          f"丢弃 {stats['dropped']} 帧 | 最大延迟 {stats['max_latency'] * 1000:.1f} 毫秒")
+    assert submit_time < frames * send_time / 4
+    assert stats['dropped'] > 0 and resync
+    assert stats['frames_written'] + stats['dropped'] == frames == stats['puts']
+    assert stats['max_depth'] <= 4
+    assert written == sorted(written) and written[-1] == (frames - 1) * 0.01
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试Tacview发送线程")
+    print("=" * 70)
+    test_queue_policies()
+    print("\n✓ 队列背压策略测试成功！")
+    test_slow_viewer_does_not_block()
+    print("\n✓ 慢速发送不阻塞推演测试成功！")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试多客户端Tacview数据流：中途加入、断开重连和积压客户端的重新同步
+"""
+
+import time
+
+import numpy as np
+
+import task_allocation as ta
+
+VIEWER_PORT = 58125
+
+
+def wait_until(condition, timeout=5.0):
+    """等待 condition() 为真，返回最终结果"""
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def viewer_count(streamer):
+    with streamer._viewer_lock:
+        return len(streamer.viewers) + len(streamer._joining)
+
+
+class FrameSource:
+    """按合成注册表编码并发送帧（每帧所有对象移动一段距离），记录已发送的时间戳"""
+
+    def __init__(self, streamer, count):
+        self.streamer = streamer
+        self.registry = ta._synthetic_registry(count)
+        self.x = np.linspace(0, 50, count)
+        self.y = np.linspace(0, 50, count)
+        self.sent = []
+
+    def send(self, frames, interval=0.0):
+        n = len(self.registry)
+        for _ in range(frames):
+            self.x += 0.5
+            timestamp = 0.1 * (len(self.sent) + 1)
+            data = self.streamer.encode_frame(timestamp, self.registry, self.x, self.y,
+                                              np.full(n, 1000.0), np.ones(n), np.ones(n))
+            if self.streamer.send_encoded_frame(timestamp, data, n):
+                self.sent.append(round(timestamp, 2))
+            if interval:
+                time.sleep(interval)
+
+
+def start_streamer():
+    streamer = ta.TacviewStreamer(local_port=VIEWER_PORT)
+    streamer.log_file_path = None
+    streamer.start_server()
+    return streamer
+
+
+def connect(name, **options):
+    client = ta.FakeTacviewClient(port=VIEWER_PORT, name=name, **options)
+    assert client.connect()
+    return client
+
+
+def finish(client):
+    """服务器关闭后等客户端收完剩余数据再关闭"""
+    if client.thread is not None:
+        client.thread.join(timeout=5)
+    client.close()
+
+
+def test_late_join_and_reconnect(count=50):
+    """第二个客户端中途加入、断开后重新连接：每次加入的第一帧包含全部对象，第一个客户端的数据流不中断"""
+    streamer = start_streamer()
+    source = FrameSource(streamer, count)
+    first = connect('first')
+    first.start()
+    late = again = None
+    try:
+        assert wait_until(lambda: viewer_count(streamer) == 1)
+        source.send(20)
+
+        late = connect('late')
+        late.start()
+        assert wait_until(lambda: viewer_count(streamer) == 2)
+        source.send(20)
+        assert late.wait_for_frames(20) >= 20
+
+        late.close()
+        for _ in range(200):
+            if streamer.disconnects:
+                break
+            source.send(1, interval=0.01)
+        assert streamer.disconnects == 1
+
+        again = connect('again')
+        again.start()
+        assert wait_until(lambda: viewer_count(streamer) == 2)
+        source.send(20)
+    finally:
+        streamer.close()
+        for client in (first, late, again):
+            if client is not None:
+                finish(client)
+
+    print(f"  发送 {len(source.sent)} 帧 | 连接 {streamer.connections} 次 | 断开 {streamer.disconnects} 次")
+    assert streamer.connections == 3
+    assert [frame[0] for frame in first.frames] == source.sent
+    for client in (late, again):
+        assert client.header_lines[0].startswith('FileType=')
+        assert client.frames[0][1] == count, f'{client.name} 的第一帧不是关键帧'
+        assert len(client.objects) == count
+    assert [frame[0] for frame in again.frames] == source.sent[-len(again.frames):]
+
+
+def test_lagging_viewer(count=2000, frames=100):
+    """不读取数据的客户端积压超过上限后重新等待关键帧，其余客户端不受影响"""
+    streamer = start_streamer()
+    streamer.deadband_position = 0.0
+    streamer.viewer_backlog_limit = 256 * 1024
+    source = FrameSource(streamer, count)
+    active = connect('active', track_objects=False)
+    active.start()
+    stalled = connect('stalled')  # 完成握手后不再读取
+    ports = {'active': active.sock.getsockname()[1], 'stalled': stalled.sock.getsockname()[1]}
+    try:
+        assert wait_until(lambda: viewer_count(streamer) == 2)
+        source.send(frames, interval=0.01)
+        with streamer._viewer_lock:
+            viewers = streamer.viewers + streamer._joining
+        resyncs = {name: next(viewer.resyncs for viewer in viewers if viewer.addr[1] == port)
+                   for name, port in ports.items()}
+    finally:
+        streamer.close()
+        finish(active)
+        stalled.close()
+
+    print(f"  积压重新同步: {resyncs}")
+    assert resyncs['stalled'] >= 1
+    assert resyncs['active'] == 0
+    assert [frame[0] for frame in active.frames] == source.sent
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试多客户端Tacview数据流")
+    print("=" * 70)
+    test_late_join_and_reconnect()
+    print("\n✓ 中途加入和断开重连测试成功！")
+    test_lagging_viewer()
+    print("\n✓ 积压客户端重新同步测试成功！")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试任务模式：预计算结果与单独计算一致，推演中按需切换任务模式
+"""
+
+import os
+
+import numpy as np
+
+import task_allocation as ta
+
+SITUATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'situation.json')
+
+
+def test_precompute_matches_single():
+    """预计算的每种模式与单独计算该模式的任务分组相同"""
+    attack_drones_data, defense_drones_data, _ = ta.load_situation_data(SITUATION_FILE)
+    results = ta.precompute_mode_allocations(attack_drones_data, defense_drones_data)
+    assert set(results) == set(ta.TASK_MODES)
+    for mode in ta.TASK_MODES:
+        single = ta.GameBasedTaskAllocation(attack_drones_data, defense_drones_data).execute_task_allocation(mode)
+        assert results[mode]['task_groups'] == single['task_groups'], mode
+
+
+def test_lazy_mode_switch():
+    """未预计算时按态势文件计算新模式；切换后每架无人机的状态保持不变，切换回来恢复原分组"""
+    allocation_result = ta.execute_task_allocation(SITUATION_FILE)
+    simulation = ta.DroneSimulation(allocation_result, enable_status_broadcast=False, enable_tacview=False,
+                                    control_file_path=os.devnull, seed=3)
+    simulation.situation_file = SITUATION_FILE
+    simulation.initialize_positions()
+    simulation.advance(20)
+    start_mode = allocation_result['task_mode']
+    start_groups = allocation_result['task_groups']
+    other_mode = next(mode for mode in ta.TASK_MODES if mode != start_mode)
+
+    before = {drone_id: simulation.state[:, k].copy() for drone_id, k in simulation.drone_index.items()}
+    assert simulation.switch_task_mode(other_mode)
+    attack_drones_data, defense_drones_data, _ = ta.load_situation_data(SITUATION_FILE)
+    expected = ta.GameBasedTaskAllocation(attack_drones_data, defense_drones_data).execute_task_allocation(other_mode)
+    assert simulation.allocation_result['task_mode'] == other_mode
+    assert simulation.allocation_result['task_groups'] == expected['task_groups']
+    for drone_id, k in simulation.drone_index.items():
+        assert np.array_equal(simulation.state[:, k], before[drone_id]), drone_id
+
+    assert simulation.switch_task_mode(start_mode)
+    assert simulation.allocation_result['task_groups'] == start_groups
+    simulation.advance(20)
+
+
+def test_switch_without_situation_file():
+    """没有态势文件且未预计算时不切换"""
+    allocation_result = ta.execute_task_allocation(SITUATION_FILE)
+    simulation = ta.DroneSimulation(allocation_result, enable_status_broadcast=False, enable_tacview=False,
+                                    control_file_path=os.devnull, seed=3)
+    simulation.initialize_positions()
+    start_groups = allocation_result['task_groups']
+    other_mode = next(mode for mode in ta.TASK_MODES if mode != allocation_result['task_mode'])
+    assert not simulation.switch_task_mode(other_mode)
+    assert simulation.allocation_result['task_groups'] == start_groups
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试任务模式预计算与切换")
+    print("=" * 70)
+    test_precompute_matches_single()
+    print("\n✓ 预计算任务模式测试成功！")
+    test_lazy_mode_switch()
+    print("\n✓ 按需切换任务模式测试成功！")
+    test_switch_without_situation_file()
+    print("\n✓ 无态势文件时的切换测试成功！")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+测试轨迹记录：环形缓冲区回绕后按顺序写出全部帧，任务模式切换后按记录开始时的无人机顺序取列
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+import task_allocation as ta
+
+SITUATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'situation.json')
+
+
+def recorded_fields(state, columns):
+    """state 中 columns 各列对应 TrajectoryRecorder.FIELDS 的值 (字段数, n)"""
+    rows = [ta.STATE_X, ta.STATE_Y, ta.STATE_VX, ta.STATE_VY, ta.STATE_HEADING, ta.STATE_ANGVEL]
+    return state[rows][:, columns].astype(np.float32)
+
+
+def test_ring_buffer_roundtrip(n=5, steps=100):
+    """帧数超过缓冲区容量时块按顺序写出，读回的步数和数值与记录时一致，缓冲区不重新分配"""
+    with tempfile.TemporaryDirectory() as tmp:
+        recorder = ta.TrajectoryRecorder(tmp, [f'D{k}' for k in range(n)], chunk_frames=16, num_chunks=2)
+        frames = recorder.frames
+        state = np.zeros((ta.STATE_SIZE, n))
+        expected = []
+        for step in range(1, steps + 1):
+            state[:] = np.arange(ta.STATE_SIZE)[:, None] * 1000.0 + np.arange(n) + step
+            recorder.record(step, step * 0.01, state)
+            expected.append(recorded_fields(state, np.arange(n)))
+        assert recorder.frames is frames
+        recorder.close()
+        meta, recorded_steps, times, recorded = ta.load_trajectory(tmp)
+    assert meta['fields'] == list(ta.TrajectoryRecorder.FIELDS)
+    assert recorded_steps.tolist() == list(range(1, steps + 1))
+    assert np.allclose(times, recorded_steps * 0.01)
+    assert np.array_equal(recorded, np.array(expected))
+
+
+def test_mode_switch_columns(steps=30):
+    """任务模式切换重排状态矩阵的列后，每架无人机仍记录在原来的列，取列不逐步分配内存"""
+    allocation_result = ta.execute_task_allocation(SITUATION_FILE)
+    simulation = ta.DroneSimulation(allocation_result, enable_status_broadcast=False, enable_tacview=False,
+                                    control_file_path=os.devnull, seed=3)
+    simulation.situation_file = SITUATION_FILE
+    simulation.initialize_positions()
+    other_mode = next(mode for mode in ta.TASK_MODES if mode != allocation_result['task_mode'])
+    with tempfile.TemporaryDirectory() as tmp:
+        simulation.start_recording(tmp, chunk_frames=16)
+        recorder = simulation.trajectory_recorder
+        order = list(recorder.drone_order)
+        simulation.advance(steps)
+        before = recorded_fields(simulation.state, [simulation.drone_index[d] for d in order])
+
+        assert simulation.switch_task_mode(other_mode)
+        assert simulation.drone_order != order, '切换后列顺序应当改变'
+        simulation.advance(1)
+        gathered = recorder._gathered
+        simulation.advance(steps - 1)
+        assert recorder._gathered is gathered
+        after = recorded_fields(simulation.state, [simulation.drone_index[d] for d in order])
+        simulation.stop_recording()
+        meta, recorded_steps, _, recorded = ta.load_trajectory(tmp)
+    assert meta['drone_order'] == order
+    assert recorded_steps.tolist() == list(range(1, 2 * steps + 1))
+    assert np.array_equal(recorded[steps - 1], before)
+    assert np.array_equal(recorded[-1], after)
+
+
+if __name__ == '__main__':
+    print("=" * 70)
+    print("测试轨迹记录")
+    print("=" * 70)
+    test_ring_buffer_roundtrip()
+    print("\n✓ 环形缓冲区回绕测试成功！")
+    test_mode_switch_columns()
+    print("\n✓ 任务模式切换后的取列测试成功！")